@@ -1,11 +1,12 @@
 import pandas as pd
-import numpy as np
+from dataclasses import replace
 from datetime import datetime
+import uuid
 import warnings
 import streamlit as st
-from pathlib import Path
-import io
-import json
+
+import tasy
+from tasy import ErroConfiguracao, ErroProcessamento
 warnings.filterwarnings('ignore')
 
 # ==================== CONFIGURAÇÃO DA PÁGINA ====================
@@ -58,150 +59,60 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ==================== CARREGAR CONFIGURAÇÕES ====================
-@st.cache_data
-def carregar_configuracoes():
-    """Carrega configurações do arquivo JSON"""
+def carregar_configuracao():
+    """Configuração compilada; relida a cada rerun se o config_exames.json mudou"""
     try:
-        with open('config_exames.json', 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        st.error("❌ Arquivo config_exames.json não encontrado!")
-        st.info("📄 Crie o arquivo config_exames.json no mesmo diretório do app_tasy.py")
-        st.stop()
-    except json.JSONDecodeError as e:
-        st.error(f"❌ Erro ao ler config_exames.json: {str(e)}")
-        st.info("Verifique se o JSON está com formato válido")
+        return tasy.obter_configuracao()
+    except ErroConfiguracao as e:
+        st.error(f"❌ {str(e)}")
+        if "não encontrado" in str(e):
+            st.info("📄 Crie o arquivo config_exames.json no mesmo diretório do app_tasy.py")
+        else:
+            st.info("Verifique se o JSON está com formato válido")
         st.stop()
 
-# Carregar configurações
-CONFIG = carregar_configuracoes()
-ESTABELECIMENTOS = CONFIG['estabelecimentos']
+# Carregar configurações (sem reiniciar o app quando o JSON é editado)
+CONFIGURACAO = carregar_configuracao()
+CONFIG = CONFIGURACAO.config
+ESTABELECIMENTOS = CONFIGURACAO.estabelecimentos
 
-# Construir mapas de exames
-# Estrutura: codigo_tasy -> {'nome': nome, 'colunas_lab': [...], 'categoria': categoria}
-MAPA_EXAMES_COMPLETO = {}
-MAPA_EXAMES_POR_CODIGO = {}
+# Mapas de exames (ver tasy.configuracao)
+MAPA_EXAMES_POR_CODIGO = CONFIGURACAO.mapa_exames_por_codigo
+ORDEM_COLUNAS_TASY = CONFIGURACAO.ordem_colunas_tasy
 
-for exame in CONFIG['exames']:
-    codigo_completo = f"NR_EXAME_{exame['codigo_tasy']}"
-    
-    # Mapa completo para exibição na UI
-    for coluna in exame['colunas_lab']:
-        MAPA_EXAMES_COMPLETO[coluna] = {
-            'codigo': codigo_completo,
-            'nome': exame['nome']
-        }
-    
-    # Mapa por código com todas as variações de coluna
-    MAPA_EXAMES_POR_CODIGO[codigo_completo] = {
-        'nome': exame['nome'],
-        'colunas_lab': exame['colunas_lab'],
-        'categoria': exame['categoria']
-    }
+# Cache de processamento compartilhado entre sessões e reruns
+@st.cache_resource
+def obter_cache_resultados():
+    return tasy.CacheResultados()
 
-# Ordem das colunas
-ORDEM_COLUNAS_TASY = CONFIG.get('ordem_colunas_tasy', [
-    'NM_PACIENTE', 'NR_ATENDIMENTO', 'DT_RESULTADO', 'DS_PROTOCOLO', 'CD_ESTABELECIMENTO'
-])
+CACHE_RESULTADOS = obter_cache_resultados()
 
-# ==================== TÍTULO ====================
-st.title("🏥 Gerador de Planilha para TASY")
-st.markdown("---")
+# Histórico dos resultados já enviados ao TASY (modo delta), compartilhado entre sessões
+CAMINHO_HISTORICO = 'historico_envios.sqlite'
 
-# ==================== FUNÇÕES ====================
-def mapear_exames_para_tasy(df, categoria=None):
-    """
-    Mapeia colunas do DataFrame para códigos TASY.
-    Testa todas as variações de nomenclatura até encontrar uma que existe.
-    
-    Args:
-        df: DataFrame com os dados do laboratório
-        categoria: 'basico' ou 'resultados2' (None = todos)
-    
-    Returns:
-        dict: {codigo_tasy: nome_coluna_encontrada}
-    """
-    mapeamento = {}
-    
-    for codigo_tasy, info in MAPA_EXAMES_POR_CODIGO.items():
-        # Filtrar por categoria se especificado
-        if categoria and info['categoria'] != categoria:
-            continue
-        
-        # Testar cada variação de coluna até encontrar uma que existe
-        for coluna_variacao in info['colunas_lab']:
-            if coluna_variacao in df.columns:
-                mapeamento[codigo_tasy] = coluna_variacao
-                break  # Encontrou, não precisa testar as outras variações
-    
-    return mapeamento
+@st.cache_resource
+def obter_historico_envios():
+    return tasy.HistoricoEnvios(CAMINHO_HISTORICO)
 
-def normalizar_nome(nome):
-    """
-    Normaliza nome para comparação:
-    - Remove espaços extras
-    - Converte para minúsculas
-    - Remove acentos
-    """
-    if pd.isna(nome):
-        return ''
-    
-    import unicodedata
-    
-    # Normalizar texto
-    nome = str(nome).strip().lower().replace('  ', ' ')
-    
-    # Remover acentos
-    nfkd = unicodedata.normalize('NFKD', nome)
-    nome_sem_acento = ''.join([c for c in nfkd if not unicodedata.combining(c)])
-    
-    return nome_sem_acento
+def registrar_envios(deltas):
+    for delta in deltas:
+        obter_historico_envios().registrar(delta)
 
-def converter_valor_numerico(valor):
-    if pd.isna(valor) or valor == '' or valor == ' ':
-        return None
-    try:
-        if isinstance(valor, str):
-            valor = valor.strip().replace(',', '.')
-        return float(valor)
-    except:
-        return None
+# Processamentos em segundo plano, um por sessão (ver tasy.tarefas)
+@st.cache_resource
+def obter_gerenciador_tarefas():
+    return tasy.GerenciadorTarefas()
 
-def formatar_data(data):
-    if pd.isna(data):
-        return None
-    try:
-        if isinstance(data, str):
-            if '/' in data and ':' in data:
-                return data
-            data = pd.to_datetime(data)
-        return data.strftime('%d/%m/%Y %H:%M:%S')
-    except:
-        return str(data)
-
-def detectar_colunas_nome(df):
-    possiveis = ['nome', 'paciente', 'nm_paciente', 'Paciente', 'Nome', 'NM_PACIENTE']
-    for col in df.columns:
-        if col in possiveis or col.lower() in [p.lower() for p in possiveis]:
-            return col
-    return df.columns[0]
+TAREFAS = obter_gerenciador_tarefas()
 
-def detectar_colunas_atendimento(df):
-    possiveis = ['atendimento', 'nr_atendimento', 'Atendimento', 'NR_ATENDIMENTO']
-    for col in df.columns:
-        if col in possiveis or col.lower() in [p.lower() for p in possiveis]:
-            return col
-    return None
+# Chave da sessão na URL: recarregar a página ou reconectar encontra o mesmo processamento
+if 'sessao' not in st.query_params:
+    st.query_params['sessao'] = uuid.uuid4().hex
+SESSAO = st.query_params['sessao']
 
-def ler_excel(arquivo):
-    """Lê arquivo Excel enviado"""
-    try:
-        return pd.read_excel(arquivo, engine='openpyxl')
-    except:
-        try:
-            return pd.read_excel(arquivo, engine='xlrd')
-        except:
-            return pd.read_excel(arquivo)
+# ==================== TÍTULO ====================
+st.title("🏥 Gerador de Planilha para TASY")
+st.markdown("---")
 
 # ==================== SIDEBAR ====================
 with st.sidebar:
@@ -216,6 +127,45 @@ with st.sidebar:
         index=0
     )
     
+    aplicar_aproximados = st.checkbox(
+        "Preencher atendimento de nomes aproximados",
+        value=False,
+        help="Nomes do laboratório que não batem exatamente com o TASY aparecem como sugestão "
+             "no relatório de inconsistências. Marque para preencher o atendimento dos candidatos "
+             "a partir da similaridade abaixo: pacientes diferentes podem ter nomes muito parecidos."
+    )
+    limiar_aproximado = st.slider(
+        "Similaridade mínima para preencher",
+        min_value=0.80,
+        max_value=1.00,
+        value=tasy.LIMIAR_APLICACAO,
+        step=0.01,
+        disabled=not aplicar_aproximados,
+        help="Use 1.00 para preencher apenas nomes com as mesmas palavras em outra ordem."
+    )
+    if not aplicar_aproximados:
+        limiar_aproximado = tasy.LIMIAR_PADRAO
+    
+    politica_duplicados = st.selectbox(
+        "Nome com mais de um atendimento no TASY",
+        tasy.POLITICAS_DUPLICADOS,
+        index=tasy.POLITICAS_DUPLICADOS.index(tasy.POLITICA_DUPLICADOS_PADRAO),
+        format_func={
+            'ultimo': "Última linha do arquivo",
+            'mais_recente': "Atendimento mais recente",
+            'mais_proximo': "Atendimento mais próximo da coleta",
+        }.get,
+        help="Como escolher o atendimento quando dois pacientes (ou dois atendimentos do mesmo paciente) "
+             "têm o mesmo nome. Os casos aparecem no relatório de inconsistências."
+    )
+    
+    enviar_apenas_novos = st.checkbox(
+        "📨 Apenas resultados ainda não enviados",
+        help=f"Compara com o histórico de envios ({CAMINHO_HISTORICO}) e gera a planilha só com os valores "
+             "novos ou alterados. O envio é registrado no histórico ao baixar a planilha para TASY."
+    )
+    historico = obter_historico_envios() if enviar_apenas_novos else None
+    
     # Seletor de Estabelecimento
     st.markdown("---")
     st.subheader("🏢 Estabelecimento")
@@ -258,9 +208,177 @@ with st.sidebar:
     st.markdown("---")
     
     processar = st.button("🚀 Processar", type="primary", use_container_width=True)
+    
+    # Lote: várias unidades de uma vez, processadas em paralelo
+    st.markdown("---")
+    with st.expander("📦 Lote (vários estabelecimentos)"):
+        st.caption("Envie as planilhas de cada estabelecimento; todos são processados em paralelo.")
+        arquivos_lote = {}
+        for nome_estab, cd_estab in ESTABELECIMENTOS.items():
+            st.markdown(f"**🏢 {nome_estab}** (Código: {cd_estab})")
+            arquivos_lote[nome_estab] = {
+                tipo: st.file_uploader(rotulo, type=['xlsx', 'xls'], key=f"lote_{tipo}_{nome_estab}")
+                for tipo, rotulo in [
+                    ('basicos', "Exames Básicos"),
+                    ('resultados2', "Resultados 2 (Opcional)"),
+                    ('pacientes', "Pacientes do TASY"),
+                ]
+            }
+        planilha_unica = st.checkbox(
+            "Uma única planilha TASY com todos os estabelecimentos",
+            help="Sem marcar, é gerada uma planilha por estabelecimento"
+        )
+        processar_lote = st.button("🚀 Processar lote", use_container_width=True)
+    
+    with st.expander("🔬 Diagnóstico"):
+        etapa_perfilada = st.selectbox(
+            "Perfilar etapa",
+            [None] + tasy.ETAPAS,
+            format_func=lambda etapa: "Nenhuma" if etapa is None else etapa,
+            help="Registra onde o tempo da etapa é gasto no próximo processamento. "
+                 "Com uma etapa escolhida, o processamento não reaproveita resultados anteriores."
+        )
+        perfilador = st.radio("Perfilador", tasy.perfiladores_disponiveis(), horizontal=True)
+
+# ==================== PROCESSAMENTO EM SEGUNDO PLANO ====================
+def executar_processamento(tarefa, arquivos, parametros, historico, etapa_perfilada, perfilador):
+    """Roda na thread da tarefa (sem chamadas st.*); devolve (resultado, delta)."""
+    resultado = tasy.processar_arquivos(
+        arquivos['basicos'],
+        arquivos['resultados2'],
+        arquivos['pacientes'],
+        parametros['protocolo'],
+        parametros['cd_estabelecimento'],
+        configuracao=CONFIGURACAO,
+        progresso=tarefa.progresso,
+        limiar_aproximado=parametros['limiar_aproximado'],
+        politica_duplicados=parametros['politica_duplicados'],
+        cache=None if etapa_perfilada else CACHE_RESULTADOS,
+        instrumentacao=tasy.Instrumentacao(etapa_perfilada, perfilador, observador=tarefa.observar_etapa)
+    )
+    delta = None
+    if historico is not None:
+        delta = historico.filtrar_novos(resultado.planilha_final, parametros['cd_estabelecimento'])
+    gerar_saida_processamento(tarefa, resultado, delta, 'xlsx')
+    # Exportações feitas depois, ao baixar outros formatos, não mexem mais no progresso
+    resultado.instrumentacao.observador = None
+    return resultado, delta
+
+def gerar_saida_processamento(tarefa, resultado, delta, formato):
+    """Planilha no `formato`, gerada uma vez por tarefa (medida como etapa 'exportacao')."""
+    if formato not in tarefa.saidas:
+        planilha = resultado.planilha_final if delta is None else delta.planilha
+        
+        def gerar():
+            with resultado.instrumentacao.etapa('exportacao', len(planilha)) as etapa:
+                saida = tasy.gerar_saida(planilha, formato)
+                etapa.linhas_saida = len(planilha)
+            return saida
+        
+        if delta is not None:
+            # A planilha depende do que já foi enviado: não vai para o cache
+            tarefa.saidas[formato] = gerar()
+        else:
+            tarefa.saidas[formato] = CACHE_RESULTADOS.saida(resultado, tarefa.parametros['protocolo'], formato, gerar)
+    return tarefa.saidas[formato]
+
+def executar_lote(tarefa, tarefas_lote, parametros, historico):
+    """Roda na thread da tarefa (sem chamadas st.*); devolve (lote, deltas)."""
+    def atualizar_lote(estabelecimento, resultado, erro, concluidos, total):
+        # 100 só quando a tarefa termina (deltas ainda por calcular)
+        tarefa.percentual = min(99, int(100 * concluidos / total))
+        tarefa.progresso(tarefa.percentual, f"{'❌' if erro else '✅'} {estabelecimento} ({concluidos}/{total})")
+    
+    tarefa.progresso(0, f"⚙️ Processando {len(tarefas_lote)} estabelecimento(s)...")
+    lote = tasy.processar_lote(
+        tarefas_lote,
+        parametros['protocolo'],
+        configuracao=CONFIGURACAO,
+        limiar_aproximado=parametros['limiar_aproximado'],
+        politica_duplicados=parametros['politica_duplicados'],
+        cache=CACHE_RESULTADOS,
+        ao_concluir=atualizar_lote
+    )
+    
+    deltas = {}
+    if historico is not None:
+        for nome_estab, resultado in list(lote.resultados.items()):
+            deltas[nome_estab] = historico.filtrar_novos(resultado.planilha_final, ESTABELECIMENTOS[nome_estab])
+            lote.resultados[nome_estab] = replace(resultado, planilha_final=deltas[nome_estab].planilha)
+    return lote, deltas
+
+def saida_lote(tarefa, chave, gerar):
+    """Arquivo do lote gerado uma vez e guardado na tarefa (os downloads refazem a página)."""
+    if chave not in tarefa.saidas:
+        tarefa.saidas[chave] = gerar()
+    return tarefa.saidas[chave]
+
+def planilha_lote(resultado, protocolo, com_historico):
+    """xlsx de um estabelecimento do lote."""
+    if com_historico:
+        # A planilha depende do que já foi enviado: não vai para o cache
+        return tasy.gerar_planilha_excel(resultado.planilha_final)
+    return CACHE_RESULTADOS.saida(resultado, protocolo, 'xlsx',
+                                  lambda: tasy.gerar_planilha_excel(resultado.planilha_final))
+
+@st.fragment(run_every=0.5)
+def acompanhar_processamento(tarefa):
+    """Atualiza só o progresso enquanto a tarefa roda; ao terminar, refaz a página com o resultado."""
+    if not tarefa.ativa:
+        st.rerun()
+    st.progress(tarefa.percentual, text=tarefa.mensagem)
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        st.caption(f"⏱️ {tarefa.segundos:.0f}s - {tarefa.descricao}")
+    with col2:
+        st.button(
+            "🛑 Cancelar",
+            on_click=tarefa.cancelar,
+            disabled=tarefa.cancelamento_pedido,
+            key=f"cancelar_{tarefa.id}"
+        )
 
 # ==================== ÁREA PRINCIPAL ====================
-if not processar:
+tarefa = TAREFAS.da_sessao(SESSAO)
+
+if processar_lote:
+    tarefas_lote = [
+        tasy.TarefaLote(nome_estab, ESTABELECIMENTOS[nome_estab],
+                        tasy.carregar_arquivo(arquivos['basicos']),
+                        tasy.carregar_arquivo(arquivos['pacientes']),
+                        tasy.carregar_arquivo(arquivos['resultados2']) if arquivos['resultados2'] else None)
+        for nome_estab, arquivos in arquivos_lote.items()
+        if arquivos['basicos'] and arquivos['pacientes']
+    ]
+    incompletos = [
+        nome_estab for nome_estab, arquivos in arquivos_lote.items()
+        if any(arquivos.values()) and not (arquivos['basicos'] and arquivos['pacientes'])
+    ]
+    if incompletos:
+        st.warning(f"⚠️ Sem Exames Básicos ou Pacientes, ignorado(s): {', '.join(incompletos)}")
+    
+    if not tarefas_lote:
+        st.error("❌ Envie pelo menos os arquivos de Exames Básicos e Pacientes de um estabelecimento!")
+        tarefa = None
+    else:
+        # Mesma vaga da sessão que o processamento individual: um substitui o
+        # outro na tela, e o lote continua visível entre reruns e reconexões
+        parametros_lote = {
+            'lote': True,
+            'protocolo': protocolo,
+            'limiar_aproximado': limiar_aproximado,
+            'politica_duplicados': politica_duplicados,
+            'planilha_unica': planilha_unica,
+            'carimbo': datetime.now().strftime('%Y%m%d_%H%M%S'),
+        }
+        tarefa = TAREFAS.enviar(
+            SESSAO,
+            lambda tarefa: executar_lote(tarefa, tarefas_lote, parametros_lote, historico),
+            descricao=f"Lote: {', '.join(tarefa_lote.estabelecimento for tarefa_lote in tarefas_lote)}",
+            parametros=parametros_lote
+        )
+
+if not processar and not processar_lote and tarefa is None:
     # Tela inicial
     col1, col2, col3 = st.columns([1, 2, 1])
     
@@ -296,47 +414,16 @@ if not processar:
     st.markdown("---")
     st.header("📊 Tabela de Referência - Mapeamento de Exames")
     
-    # Criar DataFrame para exibição
-    tabela_referencia = []
-    codigos_unicos = {}
-    
-    for key, value in MAPA_EXAMES_COMPLETO.items():
-        codigo = value['codigo']
-        nome = value['nome']
-        if codigo not in codigos_unicos:
-            codigos_unicos[codigo] = {
-                'codigo': codigo.replace('NR_EXAME_', ''),
-                'nome': nome,
-                'colunas_lab': [key]
-            }
-        else:
-            if key not in codigos_unicos[codigo]['colunas_lab']:
-                codigos_unicos[codigo]['colunas_lab'].append(key)
-    
-    for codigo, info in sorted(codigos_unicos.items()):
-        tabela_referencia.append({
-            'Código TASY': info['codigo'],
-            'Nome do Exame': info['nome'],
-            'Colunas do Lab': ', '.join(info['colunas_lab'])
-        })
-    
-    df_referencia = pd.DataFrame(tabela_referencia)
+    # Tabela e índice de busca montados uma vez por versão do config_exames.json
+    df_referencia = CONFIGURACAO.tabela_referencia
     
     # Adicionar filtro de busca
     col1, col2 = st.columns([3, 1])
     with col1:
         busca = st.text_input("🔍 Buscar exame:", placeholder="Digite o nome ou código...")
     
-    # Filtrar tabela
-    if busca:
-        mask = (
-            df_referencia['Nome do Exame'].str.contains(busca, case=False, na=False) |
-            df_referencia['Código TASY'].str.contains(busca, case=False, na=False) |
-            df_referencia['Colunas do Lab'].str.contains(busca, case=False, na=False)
-        )
-        df_filtrado = df_referencia[mask]
-    else:
-        df_filtrado = df_referencia
+    # Filtrar tabela (sem diferenciar maiúsculas e acentos)
+    df_filtrado = CONFIGURACAO.buscar_exames(busca)
     
     # Exibir tabela
     st.dataframe(
@@ -346,7 +433,8 @@ if not processar:
         column_config={
             "Código TASY": st.column_config.TextColumn("Código TASY", width="small"),
             "Nome do Exame": st.column_config.TextColumn("Nome do Exame", width="large"),
-            "Colunas do Lab": st.column_config.TextColumn("Colunas do Laboratório", width="medium")
+            "Colunas do Lab": st.column_config.TextColumn("Colunas do Laboratório", width="medium"),
+            "Faixa aceita": st.column_config.TextColumn("Faixa aceita", width="small")
         }
     )
     
@@ -364,137 +452,110 @@ if not processar:
     st.dataframe(df_estabelecimentos, use_container_width=True, hide_index=True)
 
 else:
-    if not arquivo_basicos or not arquivo_pacientes:
-        st.error("❌ Por favor, envie pelo menos os arquivos de Exames Básicos e Pacientes!")
-    else:
-        try:
-            progress_bar = st.progress(0)
-            status_text = st.empty()
-            
-            status_text.text("📂 Carregando arquivos...")
-            progress_bar.progress(10)
-            
-            pacientes = ler_excel(arquivo_pacientes)
-            col_nome_pac = detectar_colunas_nome(pacientes)
-            col_atend_pac = detectar_colunas_atendimento(pacientes)
-            
-            if not col_atend_pac:
-                st.error(f"❌ Coluna de atendimento não encontrada!\n\nColunas disponíveis: {', '.join(pacientes.columns)}")
-                st.stop()
-            
-            basicos = ler_excel(arquivo_basicos)
-            col_nome_lab = detectar_colunas_nome(basicos)
-            
-            if arquivo_resultados2:
-                resultados2 = ler_excel(arquivo_resultados2)
-            else:
-                resultados2 = None
-            
-            progress_bar.progress(30)
-            
-            status_text.text("🔍 Indexando pacientes...")
-            pacientes['nome_normalizado'] = pacientes[col_nome_pac].apply(normalizar_nome)
-            indice_pacientes = pacientes.set_index('nome_normalizado')[col_atend_pac].to_dict()
-            progress_bar.progress(40)
-            
-            status_text.text("⚙️ Processando exames básicos...")
-            basicos['nome_normalizado'] = basicos[col_nome_lab].apply(normalizar_nome)
-            
-            # ===== MUDANÇA: Aplicar estabelecimento fixo selecionado pelo usuário =====
-            basicos['CD_ESTABELECIMENTO'] = cd_estabelecimento_fixo
-            
-            # ===== NOVO: Mapear colunas usando a função que testa todas as variações =====
-            mapa_basicos = mapear_exames_para_tasy(basicos, categoria='basico')
-            
-            for col_tasy, col_lab in mapa_basicos.items():
-                basicos[col_tasy] = basicos[col_lab].apply(converter_valor_numerico)
-            
-            basicos['NR_ATENDIMENTO'] = basicos['nome_normalizado'].map(indice_pacientes)
-            basicos['nome_original'] = basicos[col_nome_lab]
-            sem_atendimento_basicos = basicos[basicos['NR_ATENDIMENTO'].isna()]
-            progress_bar.progress(60)
-            
-            if resultados2 is not None:
-                status_text.text("⚙️ Processando resultados 2...")
-                col_nome_r2 = detectar_colunas_nome(resultados2)
-                resultados2['nome_normalizado'] = resultados2[col_nome_r2].apply(normalizar_nome)
-                
-                # ===== MUDANÇA: Aplicar estabelecimento fixo selecionado pelo usuário =====
-                resultados2['CD_ESTABELECIMENTO'] = cd_estabelecimento_fixo
-                
-                # ===== NOVO: Mapear colunas usando a função que testa todas as variações =====
-                mapa_resultados2 = mapear_exames_para_tasy(resultados2, categoria='resultados2')
-                
-                for col_tasy, col_lab in mapa_resultados2.items():
-                    resultados2[col_tasy] = resultados2[col_lab].apply(converter_valor_numerico)
-                
-                resultados2['NR_ATENDIMENTO'] = resultados2['nome_normalizado'].map(indice_pacientes)
-                sem_atendimento_r2 = resultados2[resultados2['NR_ATENDIMENTO'].isna()]
-            else:
-                sem_atendimento_r2 = pd.DataFrame()
-            
-            progress_bar.progress(75)
-            
-            status_text.text("🔄 Mesclando dados...")
-            colunas_necessarias_basicos = ['nome_original', 'dthr_os', 'nome_normalizado', 
-                                            'NR_ATENDIMENTO', 'CD_ESTABELECIMENTO']
-            colunas_necessarias_basicos.extend([col for col in mapa_basicos.keys() if col in basicos.columns])
-            basicos_sel = basicos[colunas_necessarias_basicos]
+    if processar:
+        if not arquivo_basicos or not arquivo_pacientes:
+            st.error("❌ Por favor, envie pelo menos os arquivos de Exames Básicos e Pacientes!")
+            tarefa = None
+        else:
+            arquivos = {
+                'basicos': tasy.carregar_arquivo(arquivo_basicos),
+                'resultados2': tasy.carregar_arquivo(arquivo_resultados2) if arquivo_resultados2 else None,
+                'pacientes': tasy.carregar_arquivo(arquivo_pacientes),
+            }
+            parametros = {
+                'estabelecimento': estabelecimento_selecionado,
+                'cd_estabelecimento': cd_estabelecimento_fixo,
+                'protocolo': protocolo,
+                'limiar_aproximado': limiar_aproximado,
+                'politica_duplicados': politica_duplicados,
+            }
+            tarefa = TAREFAS.enviar(
+                SESSAO,
+                lambda tarefa: executar_processamento(tarefa, arquivos, parametros, historico,
+                                                      etapa_perfilada, perfilador),
+                etapas=tasy.etapas_processamento(resultados2=arquivo_resultados2 is not None),
+                descricao=f"{estabelecimento_selecionado} - {arquivo_basicos.name}",
+                parametros=parametros
+            )
+    
+    if tarefa is None:
+        pass
+    elif tarefa.ativa:
+        acompanhar_processamento(tarefa)
+    elif tarefa.estado == 'cancelada':
+        st.warning("🛑 Processamento cancelado. Clique em Processar para começar de novo.")
+    elif tarefa.estado == 'erro':
+        if isinstance(tarefa.erro, ErroProcessamento):
+            st.error(f"❌ {str(tarefa.erro)}")
+        else:
+            st.error(f"❌ Erro ao processar: {str(tarefa.erro)}")
+            st.exception(tarefa.erro)
+    elif tarefa.parametros.get('lote'):
+        lote, deltas = tarefa.resultado
+        carimbo = tarefa.parametros['carimbo']
+        
+        for nome_estab, erro in lote.erros.items():
+            st.error(f"❌ {nome_estab}: {erro}")
+        
+        if lote.resultados:
+            st.success(f"✅ Lote concluído: {len(lote.resultados)} estabelecimento(s)")
+            st.dataframe(
+                pd.DataFrame([
+                    {
+                        "Estabelecimento": nome_estab,
+                        "Código": ESTABELECIMENTOS[nome_estab],
+                        "Registros": len(resultado.planilha_final),
+                        "Inconsistências": resultado.total_inconsistencias,
+                        **({"Já enviados (omitidos)": deltas[nome_estab].celulas_repetidas} if deltas else {})
+                    }
+                    for nome_estab, resultado in lote.resultados.items()
+                ]),
+                use_container_width=True,
+                hide_index=True
+            )
             
-            if resultados2 is not None:
-                colunas_necessarias_r2 = ['nome_normalizado', 'dthr_os']
-                colunas_necessarias_r2.extend([col for col in mapa_resultados2.keys() if col in resultados2.columns])
-                resultados2_sel = resultados2[colunas_necessarias_r2]
-                
-                dados_mesclados = pd.merge(
-                    basicos_sel,
-                    resultados2_sel,
-                    on=['nome_normalizado', 'dthr_os'],
-                    how='outer',
-                    suffixes=('', '_r2')
+            if tarefa.parametros['planilha_unica']:
+                st.download_button(
+                    label="⬇️ Baixar Planilha para TASY (todos os estabelecimentos)",
+                    data=saida_lote(tarefa, 'combinada',
+                                    lambda: tasy.gerar_planilha_excel(lote.planilha_combinada())),
+                    file_name=f"Planilha_Importacao_TASY_LOTE_{carimbo}.xlsx",
+                    mime=tasy.MIME_XLSX,
+                    on_click=registrar_envios,
+                    args=(list(deltas.values()),)
                 )
             else:
-                dados_mesclados = basicos_sel.copy()
-            
-            if 'nome_original' not in dados_mesclados.columns or dados_mesclados['nome_original'].isna().any():
-                nome_map = pacientes.set_index('nome_normalizado')[col_nome_pac].to_dict()
-                if 'nome_original' in dados_mesclados.columns:
-                    dados_mesclados['nome_original'] = dados_mesclados['nome_original'].fillna(
-                        dados_mesclados['nome_normalizado'].map(nome_map)
+                for nome_estab, resultado in lote.resultados.items():
+                    st.download_button(
+                        label=f"⬇️ Baixar Planilha para TASY - {nome_estab}",
+                        data=saida_lote(
+                            tarefa, nome_estab,
+                            lambda resultado=resultado: planilha_lote(resultado, tarefa.parametros['protocolo'], bool(deltas))
+                        ),
+                        file_name=f"Planilha_Importacao_TASY_{nome_estab}_{carimbo}.xlsx",
+                        mime=tasy.MIME_XLSX,
+                        key=f"download_lote_{nome_estab}",
+                        on_click=registrar_envios,
+                        args=([deltas[nome_estab]] if deltas else [],)
                     )
-                else:
-                    dados_mesclados['nome_original'] = dados_mesclados['nome_normalizado'].map(nome_map)
             
-            planilha_final = pd.DataFrame()
-            planilha_final['NM_PACIENTE'] = dados_mesclados['nome_original']
-            planilha_final['NR_ATENDIMENTO'] = dados_mesclados['NR_ATENDIMENTO']
-            planilha_final['DT_RESULTADO'] = dados_mesclados['dthr_os'].apply(formatar_data)
-            planilha_final['DS_PROTOCOLO'] = protocolo
-            planilha_final['CD_ESTABELECIMENTO'] = dados_mesclados['CD_ESTABELECIMENTO']
-            
-            for coluna in ORDEM_COLUNAS_TASY[5:]:
-                if coluna in dados_mesclados.columns:
-                    valor = dados_mesclados[coluna]
-                    if isinstance(valor, pd.DataFrame):
-                        planilha_final[coluna] = valor.iloc[:, 0]
-                    else:
-                        planilha_final[coluna] = valor
-                else:
-                    planilha_final[coluna] = None
-            
-            planilha_final = planilha_final[planilha_final['NR_ATENDIMENTO'].notna()]
-            planilha_final['NR_ATENDIMENTO'] = planilha_final['NR_ATENDIMENTO'].astype(int)
-            planilha_final['CD_ESTABELECIMENTO'] = planilha_final['CD_ESTABELECIMENTO'].astype(int)
-            
-            progress_bar.progress(90)
-            
-            status_text.text("💾 Gerando arquivo...")
-            output = io.BytesIO()
-            planilha_final.to_excel(output, index=False, engine='openpyxl')
-            output.seek(0)
-            
-            progress_bar.progress(100)
-            status_text.text("✅ Concluído!")
+            if lote.total_inconsistencias or lote.total_fora_faixa:
+                st.download_button(
+                    label="⬇️ Baixar Relatório de Inconsistências (todos os estabelecimentos)",
+                    data=saida_lote(tarefa, 'relatorio',
+                                    lambda: tasy.gerar_relatorio_inconsistencias_lote(lote.resultados)),
+                    file_name=f"Relatorio_Inconsistencias_LOTE_{carimbo}.xlsx",
+                    mime=tasy.MIME_XLSX
+                )
+    else:
+        try:
+            resultado, delta = tarefa.resultado
+            planilha_final = resultado.planilha_final if delta is None else delta.planilha
+            # Opções do envio (a barra lateral pode ter mudado desde então)
+            estabelecimento_selecionado = tarefa.parametros['estabelecimento']
+            cd_estabelecimento_fixo = tarefa.parametros['cd_estabelecimento']
+            protocolo = tarefa.parametros['protocolo']
+            output = gerar_saida_processamento(tarefa, resultado, delta, 'xlsx')
             
             st.success(f"✅ Processamento concluído com sucesso!\n\n**Estabelecimento aplicado:** {estabelecimento_selecionado} (Código: {cd_estabelecimento_fixo})")
             
@@ -504,40 +565,159 @@ else:
             with col2:
                 st.metric("📋 Protocolo", protocolo)
             with col3:
-                st.metric("⚠️ Inconsistências", len(sem_atendimento_basicos) + len(sem_atendimento_r2))
+                st.metric("⚠️ Inconsistências", resultado.total_inconsistencias)
+            
+            if delta is not None:
+                st.info(f"📨 {delta.celulas_novas} valor(es) novo(s) e {delta.celulas_alteradas} alterado(s) a enviar; "
+                        f"{delta.celulas_repetidas} já enviado(s) omitido(s). O envio é registrado no histórico "
+                        "ao baixar a planilha.")
             
             st.download_button(
                 label="⬇️ Baixar Planilha para TASY",
                 data=output,
                 file_name=f"Planilha_Importacao_TASY_{estabelecimento_selecionado}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                mime=tasy.MIME_XLSX,
+                on_click=registrar_envios,
+                args=([delta] if delta is not None else [],)
             )
             
-            if len(sem_atendimento_basicos) + len(sem_atendimento_r2) > 0:
+            outros_formatos = [f for f in tasy.formatos_disponiveis() if f != 'xlsx']
+            for coluna, formato in zip(st.columns(len(outros_formatos)), outros_formatos):
+                extensao, mime = tasy.FORMATOS_SAIDA[formato]
+                with coluna:
+                    st.download_button(
+                        label=f"⬇️ Baixar em {formato.upper()}",
+                        data=gerar_saida_processamento(tarefa, resultado, delta, formato),
+                        file_name=f"Planilha_Importacao_TASY_{estabelecimento_selecionado}_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extensao}",
+                        mime=mime,
+                        use_container_width=True,
+                        on_click=registrar_envios,
+                        args=([delta] if delta is not None else [],)
+                    )
+            
+            aproximados = resultado.correspondencias_aproximadas
+            if len(aproximados) > 0:
+                with st.expander(f"🔎 Nomes encontrados por similaridade ({len(aproximados)})"):
+                    st.caption("Linhas com **Aplicado = Não** ficaram abaixo da similaridade mínima e não foram importadas.")
+                    st.dataframe(aproximados, use_container_width=True, hide_index=True)
+            
+            duplicados = resultado.nomes_duplicados
+            if len(duplicados) > 0:
+                with st.expander(f"👥 Nomes com mais de um atendimento no TASY ({len(duplicados)})"):
+                    st.dataframe(duplicados, use_container_width=True, hide_index=True)
+            
+            fora_faixa = resultado.valores_fora_faixa
+            if len(fora_faixa) > 0:
+                with st.expander(f"🩺 Valores fora da faixa aceita ({len(fora_faixa)})"):
+                    st.caption("Os valores foram mantidos na planilha; confira no laudo antes de importar.")
+                    st.dataframe(fora_faixa, use_container_width=True, hide_index=True)
+            
+            if resultado.total_inconsistencias > 0 or len(aproximados) > 0 or len(duplicados) > 0 or len(fora_faixa) > 0:
                 with st.expander("⚠️ Ver pacientes não encontrados"):
-                    nomes_sem_atend = set()
-                    if len(sem_atendimento_basicos) > 0:
-                        nomes_sem_atend.update(sem_atendimento_basicos['nome_original'].unique())
-                    if len(sem_atendimento_r2) > 0:
-                        nomes_sem_atend.update(resultados2[resultados2['NR_ATENDIMENTO'].isna()][col_nome_r2].unique())
+                    nomes_sem_atend = resultado.nomes_sem_atendimento
                     
                     for nome in sorted(nomes_sem_atend):
                         st.write(f"- {nome}")
                     
-                    inconsist_output = io.BytesIO()
-                    pd.DataFrame({'Paciente': list(nomes_sem_atend)}).to_excel(inconsist_output, index=False)
-                    inconsist_output.seek(0)
+                    inconsist_output = tasy.gerar_relatorio_inconsistencias(nomes_sem_atend, aproximados, duplicados, fora_faixa)
                     
                     st.download_button(
                         label="⬇️ Baixar Relatório de Inconsistências",
                         data=inconsist_output,
                         file_name="Relatorio_Inconsistencias.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        mime=tasy.MIME_XLSX
+                    )
+            
+            valores_invalidos = {col: qtd for col, qtd in resultado.valores_invalidos.items() if qtd}
+            if valores_invalidos:
+                with st.expander("⚠️ Valores não numéricos descartados"):
+                    st.dataframe(
+                        pd.DataFrame([
+                            {
+                                "Código TASY": col.replace('NR_EXAME_', ''),
+                                "Nome do Exame": MAPA_EXAMES_POR_CODIGO[col]['nome'],
+                                "Valores descartados": qtd
+                            }
+                            for col, qtd in valores_invalidos.items()
+                        ]),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+            
+            datas_invalidas = sum(resultado.datas_invalidas.values())
+            if datas_invalidas:
+                st.warning(
+                    f"⚠️ {datas_invalidas} data(s) de coleta (dthr_os) em formato não reconhecido: "
+                    + ", ".join(f"{qtd} em {planilha}" for planilha, qtd in resultado.datas_invalidas.items() if qtd)
+                )
+            
+            with st.expander("📂 Leitura dos arquivos"):
+                st.dataframe(
+                    pd.DataFrame([
+                        {
+                            "Arquivo": info.arquivo,
+                            "Formato": info.formato,
+                            "Leitor": info.motor,
+                            "Linhas": info.linhas,
+                            "Colunas lidas": info.colunas,
+                            "Tempo (s)": round(info.segundos, 2)
+                        }
+                        for info in resultado.leituras
+                    ]),
+                    use_container_width=True,
+                    hide_index=True
+                )
+                memoria = resultado.memoria
+                if memoria is not None and memoria.pico is not None:
+                    st.caption(
+                        f"🧠 Pico de memória do processo: {memoria.pico / 2**20:,.0f} MB"
+                        + ("" if memoria.reiniciado else " (desde o início do servidor)")
+                    )
+            
+            instrumentacao = resultado.instrumentacao
+            with st.expander("⏱️ Etapas do processamento"):
+                if instrumentacao.etapas:
+                    st.dataframe(
+                        pd.DataFrame([
+                            {
+                                "Etapa": medicao.etapa,
+                                "Tempo (s)": round(medicao.segundos, 3),
+                                "Linhas entrada": medicao.linhas_entrada,
+                                "Linhas saída": medicao.linhas_saida,
+                                "Pico de memória (MB)": round(medicao.pico_memoria / 2**20) if medicao.pico_memoria else None,
+                                "Execuções": medicao.chamadas
+                            }
+                            for medicao in instrumentacao.etapas.values()
+                        ]),
+                        use_container_width=True,
+                        hide_index=True
+                    )
+                    st.caption(f"Total medido: {instrumentacao.total_segundos:.2f}s")
+                else:
+                    st.caption("♻️ Resultado reaproveitado de um processamento anterior; nenhuma etapa foi executada.")
+                st.download_button(
+                    label="⬇️ Baixar métricas (JSON)",
+                    data=instrumentacao.para_json(
+                        estabelecimento=estabelecimento_selecionado,
+                        protocolo=protocolo,
+                        registros=len(planilha_final)
+                    ),
+                    file_name=f"Metricas_TASY_{estabelecimento_selecionado}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                    mime="application/json"
+                )
+                if instrumentacao.perfil:
+                    st.markdown(f"**Perfil da etapa `{instrumentacao.perfilar}`** ({instrumentacao.perfilador})")
+                    st.code(instrumentacao.perfil, language=None)
+                    st.download_button(
+                        label="⬇️ Baixar perfil",
+                        data=instrumentacao.perfil,
+                        file_name=f"Perfil_{instrumentacao.perfilar}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+                        mime="text/plain"
                     )
             
             with st.expander("👁️ Visualizar dados processados"):
                 st.dataframe(planilha_final.head(20), use_container_width=True)
             
         except Exception as e:
-            st.error(f"❌ Erro ao processar: {str(e)}")
+            st.error(f"❌ Erro ao exibir o resultado: {str(e)}")
             st.exception(e)
@@ -0,0 +1,3 @@
+"""
+Benchmark do pipeline com planilhas sintéticas (python -m benchmarks.executar).
+"""
@@ -0,0 +1,203 @@
+"""
+Teste de carga do serviço HTTP (tasy.servico) com planilhas sintéticas.
+
+Envia `--requisicoes` pedidos POST /processar, `--concorrencia` por vez, e
+mede vazão e latência do lado do cliente; no fim mostra também o
+GET /metricas do serviço (espera na fila x processamento, recusas).
+
+    python -m tasy.servico --trabalhadores 2 --fila 4 &
+    python -m benchmarks.carga --requisicoes 40 --concorrencia 8
+
+    python -m benchmarks.carga --iniciar-servico --trabalhadores 2 --fila 4
+
+Os pedidos alternam entre `--variantes` conjuntos de planilhas (sementes
+diferentes): o primeiro pedido de cada conjunto é processado de verdade e
+os seguintes reaproveitam o cache do serviço, como reenvios do mesmo mês.
+Com concorrência maior que trabalhadores + fila, parte dos pedidos recebe
+503 (contrapressão), contados à parte.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+import tasy
+
+from .dados import gerar_planilhas
+from .executar import DADOS_PADRAO, ambiente
+
+URL_PADRAO = 'http://127.0.0.1:8765'
+
+
+def corpo_multipart(arquivos, campos):
+    """
+    Returns:
+        tuple: (corpo, Content-Type)
+    """
+    fronteira = uuid.uuid4().hex
+    partes = []
+    for nome, valor in campos.items():
+        partes.append(f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode())
+    for nome, caminho in arquivos.items():
+        partes.append(
+            f'--{fronteira}\r\nContent-Disposition: form-data; name="{nome}"; filename="{Path(caminho).name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode()
+            + Path(caminho).read_bytes() + b'\r\n'
+        )
+    partes.append(f'--{fronteira}--\r\n'.encode())
+    return b''.join(partes), f'multipart/form-data; boundary={fronteira}'
+
+
+def enviar(url, corpo, tipo, tempo_limite=600):
+    """
+    Um POST /processar.
+
+    Returns:
+        dict: status, segundos, bytes e registros (cabeçalho X-Tasy-Registros)
+    """
+    pedido = urllib.request.Request(f"{url}/processar", data=corpo, method='POST',
+                                    headers={'Content-Type': tipo})
+    inicio = time.perf_counter()
+    try:
+        with urllib.request.urlopen(pedido, timeout=tempo_limite) as resposta:
+            conteudo = resposta.read()
+            return {'status': resposta.status, 'segundos': time.perf_counter() - inicio,
+                    'bytes': len(conteudo), 'registros': int(resposta.headers.get('X-Tasy-Registros', 0))}
+    except urllib.error.HTTPError as e:
+        e.read()
+        return {'status': e.code, 'segundos': time.perf_counter() - inicio, 'bytes': 0, 'registros': 0}
+
+
+def obter_json(url, caminho):
+    with urllib.request.urlopen(f"{url}{caminho}", timeout=10) as resposta:
+        return json.loads(resposta.read())
+
+
+def aguardar_servico(url, segundos=60):
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite:
+        try:
+            return obter_json(url, '/saude')
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Serviço não respondeu em {url}")
+
+
+def medir(url, pedidos, concorrencia):
+    """
+    Envia os pedidos ((corpo, tipo) cada) com `concorrencia` conexões simultâneas.
+
+    Returns:
+        dict: resumo do lado do cliente
+    """
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        respostas = list(executor.map(lambda pedido: enviar(url, *pedido), pedidos))
+    duracao = time.perf_counter() - inicio
+
+    aceitas = [r for r in respostas if r['status'] == 200]
+    latencias = [r['segundos'] for r in aceitas]
+    resumo = {
+        'requisicoes': len(respostas),
+        'concorrencia': concorrencia,
+        'concluidas': len(aceitas),
+        'recusadas_503': sum(r['status'] == 503 for r in respostas),
+        'erros': sum(r['status'] not in (200, 503) for r in respostas),
+        'duracao': round(duracao, 3),
+        'vazao_por_segundo': round(len(aceitas) / duracao, 3),
+        'registros': sum(r['registros'] for r in aceitas),
+    }
+    if latencias:
+        p50, p95, p99 = np.percentile(latencias, [50, 95, 99])
+        resumo['latencia'] = {'p50': round(p50, 4), 'p95': round(p95, 4), 'p99': round(p99, 4),
+                              'max': round(max(latencias), 4)}
+    return resumo
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.carga',
+        description="Teste de carga do serviço HTTP TASY (python -m tasy.servico).",
+    )
+    parser.add_argument('--url', default=URL_PADRAO)
+    parser.add_argument('--requisicoes', type=int, default=40)
+    parser.add_argument('--concorrencia', type=int, default=4, help="pedidos simultâneos")
+    parser.add_argument('--linhas', type=int, default=1000, help="linhas do basicos de cada planilha sintética")
+    parser.add_argument('--variantes', type=int, default=4,
+                        help="conjuntos de planilhas diferentes (os demais pedidos repetem um deles)")
+    parser.add_argument('--formato', default='xlsx')
+    parser.add_argument('--dados', type=Path, default=DADOS_PADRAO,
+                        help="pasta das planilhas geradas (reaproveitadas entre execuções)")
+    parser.add_argument('--iniciar-servico', action='store_true',
+                        help="sobe um python -m tasy.servico na porta da --url durante o teste")
+    parser.add_argument('--trabalhadores', type=int, default=2, help="com --iniciar-servico")
+    parser.add_argument('--fila', type=int, default=8, help="com --iniciar-servico")
+    parser.add_argument('--saida', type=Path, default=None,
+                        help="arquivo .jsonl ao qual acrescentar o resultado desta execução")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    configuracao = tasy.obter_configuracao()
+    estabelecimento = next(iter(configuracao.estabelecimentos))
+
+    conjuntos = []
+    for semente in range(args.variantes):
+        arquivos = gerar_planilhas(args.linhas, configuracao.config, args.dados, semente)
+        conjuntos.append(corpo_multipart(arquivos, {
+            'estabelecimento': estabelecimento, 'protocolo': 'MENSAL', 'formato': args.formato,
+        }))
+    pedidos = [conjuntos[i % len(conjuntos)] for i in range(args.requisicoes)]
+
+    servico = None
+    if args.iniciar_servico:
+        porta = args.url.rsplit(':', 1)[-1].strip('/')
+        servico = subprocess.Popen([
+            sys.executable, '-m', 'tasy.servico', '--porta', porta,
+            '--trabalhadores', str(args.trabalhadores), '--fila', str(args.fila),
+        ])
+    try:
+        aguardar_servico(args.url)
+        cliente = medir(args.url, pedidos, args.concorrencia)
+        servidor = obter_json(args.url, '/metricas')
+    finally:
+        if servico is not None:
+            servico.terminate()
+            servico.wait()
+
+    print(f"{'pedidos':<24}{cliente['requisicoes']:>10}")
+    print(f"{'concluídos':<24}{cliente['concluidas']:>10}")
+    print(f"{'recusados (503)':<24}{cliente['recusadas_503']:>10}")
+    print(f"{'erros':<24}{cliente['erros']:>10}")
+    print(f"{'duração (s)':<24}{cliente['duracao']:>10.2f}")
+    print(f"{'vazão (pedidos/s)':<24}{cliente['vazao_por_segundo']:>10.2f}")
+    for percentil, segundos in cliente.get('latencia', {}).items():
+        print(f"{'latência ' + percentil + ' (s)':<24}{segundos:>10.3f}")
+    print("\nMétricas do serviço:")
+    print(json.dumps(servidor, ensure_ascii=False, indent=2))
+
+    if args.saida:
+        execucao = {
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'ambiente': ambiente(),
+            'linhas': args.linhas,
+            'variantes': args.variantes,
+            'cliente': cliente,
+            'servico': servidor,
+        }
+        with open(args.saida, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(execucao, ensure_ascii=False) + '\n')
+    return 1 if cliente['erros'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
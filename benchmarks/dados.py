@@ -0,0 +1,199 @@
+"""
+Planilhas sintéticas (basicos, resultados2 e pacientes) para o benchmark.
+
+Os dados imitam as exportações reais:
+- colunas de exame com as variações de nome do config_exames.json;
+- nomes com e sem acento, em maiúsculas ou não, com espaços a mais e
+  alguns com erro de digitação;
+- pacientes sem atendimento e homônimos no TASY;
+- datas de coleta em formatos misturados (texto dd/mm/aaaa, ISO, número
+  de série do Excel), diferentes entre basicos e resultados2 para a mesma
+  coleta;
+- valores com vírgula decimal, células vazias e valores não numéricos;
+- colunas extras que a leitura deve ignorar.
+
+A geração é determinística (semente) e os arquivos ficam guardados em
+`pasta`, então cada escala só é gerada uma vez.
+"""
+import hashlib
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from tasy.exportacao import escrever_xlsx
+from tasy.transformacoes import ORIGEM_SERIAL_EXCEL
+
+PRENOMES = [
+    'José', 'João', 'Antônio', 'Francisco', 'Luís', 'Sebastião', 'Conceição', 'Mônica', 'Inês',
+    'Maria', 'Ana', 'Luíza', 'Cecília', 'Márcia', 'Letícia', 'Fábio', 'Cláudio', 'Vitória',
+    'Raimundo', 'Benedita', 'Aparecida', 'Tânia', 'Helena', 'Sérgio', 'Rogério', 'Júlia',
+]
+SOBRENOMES = [
+    'da Silva', 'dos Santos', 'de Oliveira', 'Souza', 'Gonçalves', 'Araújo', 'Conceição',
+    'Assunção', 'Magalhães', 'Bragança', 'Simões', 'Estêvão', 'Brandão', 'Falcão', 'Lopes',
+    'Guimarães', 'Sampaio', 'Aragão', 'Damião', 'Calixto', 'Romão', 'Peçanha', 'Fontes',
+]
+
+# Frações dos nomes do laboratório
+FRACAO_SEM_ATENDIMENTO = 0.03   # paciente ausente do TASY
+FRACAO_ERRO_DIGITACAO = 0.02    # uma letra trocada (correspondência aproximada)
+FRACAO_HOMONIMOS = 0.01         # nomes com dois atendimentos no TASY
+
+# Frações das células de exame
+FRACAO_VAZIOS = 0.15
+FRACAO_INVALIDOS = 0.005
+INVALIDOS = ['<0,5', 'NEG', '*', 'hemolisado', '>1000']
+
+# Coletas do basicos que também aparecem no resultados2
+FRACAO_COMPARTILHADAS = 0.6
+
+COLUNAS_EXTRAS = ['cd_convenio', 'ds_setor', 'nr_prescricao', 'ds_material', 'nm_medico', 'ie_urgente']
+
+
+def _nomes_pacientes(rng, quantidade):
+    """Nomes completos distintos no padrão do TASY (maiúsculas, com acento)."""
+    prenomes = np.array(PRENOMES)[rng.integers(0, len(PRENOMES), quantidade)]
+    meio = np.array(SOBRENOMES)[rng.integers(0, len(SOBRENOMES), quantidade)]
+    fim = np.array(SOBRENOMES)[rng.integers(0, len(SOBRENOMES), quantidade)]
+    # Sufixo numérico garante nomes distintos em qualquer escala
+    nomes = [f"{p} {m} {f} {i:07d}".upper() for i, (p, m, f) in enumerate(zip(prenomes, meio, fim))]
+    return np.array(nomes, dtype=object)
+
+
+def _variar_nomes(rng, nomes):
+    """Como o laboratório digita: caixa, acentos e espaços variam; alguns erros de digitação."""
+    nomes = pd.Series(nomes, dtype=object)
+    sorteio = rng.random(len(nomes))
+    minusculas = sorteio < 0.3
+    nomes[minusculas] = nomes[minusculas].str.title()
+    sem_acento = (sorteio >= 0.3) & (sorteio < 0.5)
+    nomes[sem_acento] = (nomes[sem_acento].str.normalize('NFKD')
+                         .str.encode('ascii', 'ignore').str.decode('ascii'))
+    espacos = rng.random(len(nomes)) < 0.1
+    nomes[espacos] = nomes[espacos].str.replace(' ', '  ', n=1) + ' '
+
+    erro = rng.random(len(nomes)) < FRACAO_ERRO_DIGITACAO
+    nomes[erro] = [nome[:2] + nome[3] + nome[2] + nome[4:] for nome in nomes[erro]]
+    return nomes.to_numpy()
+
+
+def _formatar_datas(rng, datas):
+    """Datas de coleta em formatos misturados, como texto ou número de série do Excel."""
+    datas = pd.Series(datas)
+    formato = rng.integers(0, 4, len(datas))
+    saida = np.empty(len(datas), dtype=object)
+    saida[formato == 0] = datas[formato == 0].dt.strftime('%d/%m/%Y %H:%M:%S')
+    saida[formato == 1] = datas[formato == 1].dt.strftime('%d/%m/%Y %H:%M')
+    saida[formato == 2] = datas[formato == 2].dt.strftime('%Y-%m-%d %H:%M:%S')
+    seriais = (datas[formato == 3] - ORIGEM_SERIAL_EXCEL) / pd.Timedelta(days=1)
+    saida[formato == 3] = seriais.round(8).to_numpy()
+    return saida
+
+
+def _valores_exame(rng, linhas):
+    """Resultados com vírgula decimal, vazios e alguns valores não numéricos."""
+    numeros = np.round(rng.uniform(0.1, 500, linhas), 1)
+    valores = pd.Series(numeros.astype(str), dtype=object).str.replace('.', ',', regex=False).to_numpy()
+    sorteio = rng.random(linhas)
+    valores[sorteio < FRACAO_VAZIOS] = None
+    invalidos = (sorteio >= FRACAO_VAZIOS) & (sorteio < FRACAO_VAZIOS + FRACAO_INVALIDOS)
+    valores[invalidos] = np.array(INVALIDOS, dtype=object)[rng.integers(0, len(INVALIDOS), invalidos.sum())]
+    return valores
+
+
+def _planilha_lab(rng, nomes, datas, exames):
+    """DataFrame de uma exportação do laboratório; `exames` = colunas (variante já sorteada)."""
+    linhas = len(nomes)
+    dados = {
+        'Paciente': _variar_nomes(rng, nomes),
+        'dthr_os': _formatar_datas(rng, datas),
+    }
+    for coluna in exames:
+        dados[coluna] = _valores_exame(rng, linhas)
+    for coluna in COLUNAS_EXTRAS:
+        dados[coluna] = rng.integers(0, 10_000, linhas).astype(str)
+    return pd.DataFrame(dados)
+
+
+def _colunas_exames(rng, config, categoria):
+    """Uma variante de nome do config_exames.json para cada exame da categoria."""
+    return [exame['colunas_lab'][rng.integers(0, len(exame['colunas_lab']))]
+            for exame in config['exames'] if exame['categoria'] == categoria]
+
+
+def gerar_dataframes(linhas, config, semente=0):
+    """
+    Gera as três planilhas em memória.
+
+    Args:
+        linhas: linhas do basicos (o resultados2 tem um número parecido)
+        config: dict do config_exames.json
+        semente: semente do gerador aleatório
+
+    Returns:
+        dict: {'basicos': DataFrame, 'resultados2': DataFrame, 'pacientes': DataFrame}
+    """
+    rng = np.random.default_rng(semente)
+    quantidade_pacientes = max(50, linhas // 4)
+    nomes = _nomes_pacientes(rng, quantidade_pacientes)
+
+    inicio = pd.Timestamp('2025-01-02 06:00')
+    minutos = rng.integers(0, 365 * 24 * 60, linhas)
+    coletas = pd.DataFrame({
+        'nome': nomes[rng.integers(0, quantidade_pacientes, linhas)],
+        'data': inicio + pd.to_timedelta(minutos, unit='min'),
+    })
+
+    basicos = _planilha_lab(rng, coletas['nome'].to_numpy(), coletas['data'],
+                            _colunas_exames(rng, config, 'basico'))
+
+    # resultados2: parte das mesmas coletas (outro formato de data) e coletas só dele
+    compartilhadas = coletas.sample(frac=FRACAO_COMPARTILHADAS, random_state=semente)
+    proprias = pd.DataFrame({
+        'nome': nomes[rng.integers(0, quantidade_pacientes, linhas - len(compartilhadas))],
+        'data': inicio + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, linhas - len(compartilhadas)), unit='min'),
+    })
+    coletas_r2 = pd.concat([compartilhadas, proprias], ignore_index=True)
+    resultados2 = _planilha_lab(rng, coletas_r2['nome'].to_numpy(), coletas_r2['data'],
+                                _colunas_exames(rng, config, 'resultados2'))
+
+    # pacientes: todos menos os "sem atendimento", homônimos com um segundo atendimento
+    no_tasy = rng.random(quantidade_pacientes) >= FRACAO_SEM_ATENDIMENTO
+    homonimos = no_tasy & (rng.random(quantidade_pacientes) < FRACAO_HOMONIMOS)
+    nomes_tasy = np.concatenate([nomes[no_tasy], nomes[homonimos]])
+    pacientes = pd.DataFrame({
+        'NM_PACIENTE': nomes_tasy,
+        'NR_ATENDIMENTO': rng.permutation(len(nomes_tasy)) + 1_000_000,
+        'DT_ENTRADA': (inicio + pd.to_timedelta(rng.integers(0, 365, len(nomes_tasy)), unit='D'))
+                      .strftime('%d/%m/%Y'),
+    })
+
+    return {'basicos': basicos, 'resultados2': resultados2, 'pacientes': pacientes}
+
+
+def _assinatura(linhas, config, semente):
+    conteudo = json.dumps([linhas, semente, config['exames']], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(conteudo.encode('utf-8')).hexdigest()[:12]
+
+
+def gerar_planilhas(linhas, config, pasta, semente=0):
+    """
+    Grava as três planilhas .xlsx em `pasta` (reaproveitando arquivos já
+    gerados com os mesmos parâmetros e exames).
+
+    Returns:
+        dict: {'basicos': Path, 'resultados2': Path, 'pacientes': Path}
+    """
+    destino = Path(pasta) / f"{linhas}_{_assinatura(linhas, config, semente)}"
+    arquivos = {tipo: destino / f"{tipo}.xlsx" for tipo in ('basicos', 'resultados2', 'pacientes')}
+    if all(arquivo.exists() for arquivo in arquivos.values()):
+        return arquivos
+
+    destino.mkdir(parents=True, exist_ok=True)
+    for tipo, df in gerar_dataframes(linhas, config, semente).items():
+        temporario = arquivos[tipo].with_suffix('.tmp')
+        escrever_xlsx({'Sheet1': df}, temporario)
+        temporario.replace(arquivos[tipo])
+    return arquivos
@@ -0,0 +1,323 @@
+"""
+Benchmark do pipeline TASY com dados sintéticos.
+
+Para cada escala (linhas do basicos), gera as planilhas (benchmarks/dados.py),
+mede cada etapa isolada e o processamento completo, e compara com a linha
+de base gravada antes:
+
+    python -m benchmarks.executar                          # 1k, 10k, 100k
+    python -m benchmarks.executar --linhas 1000 1000000
+    python -m benchmarks.executar --gravar-linha-base      # após uma mudança aprovada
+
+Etapas isoladas: ingestao (leitura das três planilhas), normalizar_nome,
+converter_valor_numerico, converter_datas, mapeamento, mesclagem,
+validacao (faixas dos exames) e exportacao_xlsx/csv. O processamento completo (processar_arquivos) aparece
+como processar.<etapa>, com as etapas da Instrumentacao.
+
+Cada etapa roda `--repeticoes` vezes e vale o menor tempo. Há regressão
+quando o tempo ou a memória adicional passa da linha de base em mais de
+`--tolerancia` (e de um mínimo absoluto, para não acusar ruído); nesse
+caso o comando termina com código 1.
+
+Não precisa de rede nem do Streamlit.
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+import pandas as pd
+
+import tasy
+from tasy.cache import CacheLRU
+from tasy.instrumentacao import Instrumentacao
+from tasy.leitura import carregar_arquivo, ler_planilha
+from tasy.memoria import medir_memoria
+from tasy.motor import _localizar_atendimentos, _preparar_lab, colunas_necessarias, montar_planilha
+from tasy.pacientes import IndicePacientes, limpar_cache_indices
+from tasy.transformacoes import (
+    CACHE_NOMES,
+    COLUNA_DATA_LAB,
+    COLUNAS_ATENDIMENTO,
+    COLUNAS_DATA_ATENDIMENTO,
+    COLUNAS_NOME,
+    converter_colunas_numericas,
+    converter_datas,
+    detectar_colunas_nome,
+    normalizar_nomes,
+)
+
+from .dados import gerar_planilhas
+
+PASTA = Path(__file__).resolve().parent
+ESCALAS_PADRAO = [1_000, 10_000, 100_000]
+LINHA_BASE_PADRAO = PASTA / 'linha_base.json'
+DADOS_PADRAO = PASTA / 'dados'
+
+TOLERANCIA_PADRAO = 0.25
+# Diferenças abaixo disso não contam como regressão (ruído de medição)
+TEMPO_MINIMO = 0.05        # segundos
+MEMORIA_MINIMA = 32 * 2**20  # bytes
+
+
+def _medir(funcao, repeticoes):
+    """
+    Executa `funcao` `repeticoes` vezes.
+
+    Returns:
+        tuple: (retorno da última execução, menor tempo em segundos,
+                maior memória adicional em bytes, maior pico de memória)
+    """
+    tempos, adicionais, picos = [], [], []
+    for _ in range(repeticoes):
+        gc.collect()
+        with medir_memoria() as memoria:
+            inicio = time.perf_counter()
+            retorno = funcao()
+            tempos.append(time.perf_counter() - inicio)
+        if memoria.pico is not None:
+            picos.append(memoria.pico)
+            if memoria.inicial is not None:
+                adicionais.append(max(0, memoria.pico - memoria.inicial))
+    return retorno, min(tempos), max(adicionais, default=None), max(picos, default=None)
+
+
+def _registro(linhas, segundos, adicional, pico):
+    return {
+        'linhas': linhas,
+        'segundos': round(segundos, 4),
+        'linhas_por_segundo': round(linhas / segundos) if segundos > 0 else None,
+        'memoria_adicional': adicional,
+        'pico_memoria': pico,
+    }
+
+
+def _medir_etapas_isoladas(arquivos, configuracao, repeticoes, etapas):
+    """Cada etapa sozinha, sobre a saída da anterior; os DataFrames são liberados no retorno."""
+    def medir(nome, funcao, linhas_etapa):
+        # linhas_etapa: quantidade ou callable(retorno) -> quantidade
+        retorno, segundos, adicional, pico = _medir(funcao, repeticoes)
+        if callable(linhas_etapa):
+            linhas_etapa = linhas_etapa(retorno)
+        etapas[nome] = _registro(linhas_etapa, segundos, adicional, pico)
+        return retorno
+
+    # Leitura sem cache: ArquivoCarregado novo a cada repetição
+    def ler_tudo():
+        return {
+            'basicos': ler_planilha(carregar_arquivo(arquivos['basicos']),
+                                    colunas_necessarias(configuracao, 'basico'))[0],
+            'resultados2': ler_planilha(carregar_arquivo(arquivos['resultados2']),
+                                        colunas_necessarias(configuracao, 'resultados2'))[0],
+            'pacientes': ler_planilha(carregar_arquivo(arquivos['pacientes']),
+                                      COLUNAS_NOME + COLUNAS_ATENDIMENTO + COLUNAS_DATA_ATENDIMENTO)[0],
+        }
+    planilhas = medir('ingestao', ler_tudo, lambda planilhas: sum(len(df) for df in planilhas.values()))
+    basicos, resultados2 = planilhas['basicos'], planilhas['resultados2']
+
+    nomes = basicos[detectar_colunas_nome(basicos)]
+    # Cache vazio a cada repetição: mede a normalização, não o cache
+    medir('normalizar_nome', lambda: normalizar_nomes(nomes, cache=CacheLRU(maxsize=200_000)), len(nomes))
+
+    mapa_basicos = medir('mapeamento', lambda: tasy.construir_configuracao(configuracao.config)
+                         .mapeamento.resolver(basicos.columns, categoria='basico'), len(configuracao.config['exames']))
+    mapa_resultados2 = configuracao.mapeamento.resolver(resultados2.columns, categoria='resultados2')
+
+    medir('converter_valor_numerico', lambda: converter_colunas_numericas(basicos, mapa_basicos), len(basicos))
+    medir('converter_datas', lambda: converter_datas(basicos[COLUNA_DATA_LAB], configuracao.formatos_data),
+          len(basicos))
+
+    # Mesclagem sobre os dois lados já preparados, como em processar
+    indice = IndicePacientes(planilhas['pacientes'])
+    lados = []
+    for df, mapa in ((basicos, mapa_basicos), (resultados2, mapa_resultados2)):
+        lab, _, _ = _preparar_lab(df, mapa, configuracao.formatos_data)
+        lab['NR_ATENDIMENTO'], _ = _localizar_atendimentos(lab, 'nome_original', indice, None)
+        lados.append(lab)
+    lado_r2 = lados[1][['nome_normalizado', COLUNA_DATA_LAB, *mapa_resultados2]]
+    planilha = medir('mesclagem', lambda: montar_planilha(lados[0], lado_r2, 'MENSAL', 1, configuracao),
+                     len(lados[0]) + len(lado_r2))
+    medir('validacao', lambda: configuracao.faixas.conferir(planilha), len(planilha))
+
+    for formato in ('xlsx', 'csv'):
+        medir(f'exportacao_{formato}', lambda formato=formato: tasy.gerar_saida(planilha, formato), len(planilha))
+
+
+def medir_escala(linhas, configuracao, pasta_dados, repeticoes=3, semente=0):
+    """
+    Mede todas as etapas numa escala.
+
+    Returns:
+        dict: {etapa: {linhas, segundos, linhas_por_segundo, memoria_adicional, pico_memoria}}
+    """
+    arquivos = gerar_planilhas(linhas, configuracao.config, pasta_dados, semente)
+    etapas = {}
+    _medir_etapas_isoladas(arquivos, configuracao, repeticoes, etapas)
+
+    # Processamento completo, a frio (sem índice de pacientes nem nomes em
+    # cache); as etapas vêm da Instrumentacao da execução mais rápida
+    melhor = None
+    for _ in range(repeticoes):
+        limpar_cache_indices()
+        CACHE_NOMES.clear()
+        gc.collect()
+        instrumentacao = Instrumentacao()
+        with medir_memoria() as memoria:
+            inicio = time.perf_counter()
+            resultado = tasy.processar_arquivos(arquivos['basicos'], arquivos['resultados2'], arquivos['pacientes'],
+                                                'MENSAL', 1, configuracao=configuracao, instrumentacao=instrumentacao)
+            segundos = time.perf_counter() - inicio
+        if melhor is None or segundos < melhor[1]:
+            melhor = (instrumentacao, segundos, memoria, len(resultado.planilha_final))
+        del resultado
+    instrumentacao, segundos, memoria, registros = melhor
+
+    def adicional(pico):
+        return max(0, pico - memoria.inicial) if pico is not None and memoria.inicial is not None else None
+
+    for medicao in instrumentacao.etapas.values():
+        etapas[f'processar.{medicao.etapa}'] = _registro(
+            medicao.linhas_entrada or medicao.linhas_saida or 0, medicao.segundos,
+            adicional(medicao.pico_memoria), medicao.pico_memoria
+        )
+    etapas['processar'] = _registro(registros, segundos, adicional(memoria.pico), memoria.pico)
+    return etapas
+
+
+def ambiente():
+    """Onde o benchmark rodou (comparações entre máquinas diferentes não valem)."""
+    return {
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'plataforma': platform.platform(),
+        'processador': platform.processor() or platform.machine(),
+        'nucleos': os.cpu_count(),
+    }
+
+
+def comparar(atual, linha_base, tolerancia=TOLERANCIA_PADRAO):
+    """
+    Regressões de `atual` em relação à `linha_base` ({escala: {etapa: registro}}).
+
+    Returns:
+        list de dicts (escala, etapa, medida, linha_base, atual, variacao)
+    """
+    regressoes = []
+    for escala, etapas in atual.items():
+        base_escala = linha_base.get(escala, {})
+        for etapa, registro in etapas.items():
+            base = base_escala.get(etapa)
+            if base is None:
+                continue
+            for medida, minimo in (('segundos', TEMPO_MINIMO), ('memoria_adicional', MEMORIA_MINIMA)):
+                anterior, agora = base.get(medida), registro.get(medida)
+                if anterior is None or agora is None:
+                    continue
+                if agora > anterior * (1 + tolerancia) and agora - anterior > minimo:
+                    regressoes.append({
+                        'escala': escala, 'etapa': etapa, 'medida': medida,
+                        'linha_base': anterior, 'atual': agora,
+                        'variacao': agora / anterior - 1 if anterior else None,
+                    })
+    return regressoes
+
+
+def formatar_regressao(regressao):
+    """Linha do relatório de uma regressão de `comparar`."""
+    # Linha de base 0 (comum em memoria_adicional): sem variação percentual
+    variacao = f"{regressao['variacao']:+.0%}" if regressao['variacao'] is not None else "n/a"
+    return (f"REGRESSÃO {regressao['escala']} linhas, {regressao['etapa']} ({regressao['medida']}): "
+            f"{regressao['linha_base']} -> {regressao['atual']} ({variacao})")
+
+
+def _formatar_tabela(escala, etapas, linha_base):
+    base_escala = linha_base.get(escala, {})
+    linhas = [f"\n== {int(escala):,} linhas ==".replace(',', '.'),
+              f"{'etapa':<34}{'segundos':>10}{'linhas/s':>14}{'mem. (MB)':>11}{'vs base':>10}"]
+    for etapa, registro in etapas.items():
+        base = base_escala.get(etapa)
+        variacao = (f"{registro['segundos'] / base['segundos'] - 1:+.0%}"
+                    if base and base.get('segundos') else '')
+        memoria = registro['memoria_adicional'] if registro['memoria_adicional'] is not None else registro['pico_memoria']
+        linhas.append(
+            f"{etapa:<34}{registro['segundos']:>10.3f}"
+            f"{registro['linhas_por_segundo'] or 0:>14,}"
+            f"{(memoria or 0) / 2**20:>11.0f}{variacao:>10}".replace(',', '.')
+        )
+    return '\n'.join(linhas)
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.executar',
+        description="Benchmark do pipeline TASY com planilhas sintéticas.",
+    )
+    parser.add_argument('--linhas', type=int, nargs='+', default=ESCALAS_PADRAO,
+                        help="escalas (linhas do basicos), ex.: 1000 10000 1000000")
+    parser.add_argument('--repeticoes', type=int, default=3,
+                        help="execuções de cada etapa (vale o menor tempo)")
+    parser.add_argument('--semente', type=int, default=0)
+    parser.add_argument('--config', type=Path, default=None, help="caminho do config_exames.json")
+    parser.add_argument('--dados', type=Path, default=DADOS_PADRAO,
+                        help="pasta das planilhas geradas (reaproveitadas entre execuções)")
+    parser.add_argument('--linha-base', type=Path, default=LINHA_BASE_PADRAO)
+    parser.add_argument('--gravar-linha-base', action='store_true',
+                        help="grava esta execução como a nova linha de base")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO,
+                        help=f"piora aceita em relação à linha de base (padrão: {TOLERANCIA_PADRAO:.0%}%)")
+    parser.add_argument('--saida', type=Path, default=None,
+                        help="arquivo .jsonl ao qual acrescentar o resultado desta execução")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    configuracao = tasy.obter_configuracao(args.config)
+
+    linha_base = {}
+    if args.linha_base.exists():
+        gravada = json.loads(args.linha_base.read_text(encoding='utf-8'))
+        linha_base = gravada['escalas']
+        if gravada.get('ambiente') != ambiente():
+            print(f"Aviso: linha de base gravada em outro ambiente ({gravada.get('ambiente')}); "
+                  "compare com cuidado.", file=sys.stderr)
+
+    resultados = {}
+    for linhas in args.linhas:
+        escala = str(linhas)
+        resultados[escala] = medir_escala(linhas, configuracao, args.dados, args.repeticoes, args.semente)
+        print(_formatar_tabela(escala, resultados[escala], linha_base), flush=True)
+
+    execucao = {
+        'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'ambiente': ambiente(),
+        'config_versao': configuracao.config.get('versao'),
+        'repeticoes': args.repeticoes,
+        'escalas': resultados,
+    }
+    if args.saida:
+        with open(args.saida, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(execucao, ensure_ascii=False) + '\n')
+
+    regressoes = comparar(resultados, linha_base, args.tolerancia)
+    for regressao in regressoes:
+        print(formatar_regressao(regressao))
+
+    if args.gravar_linha_base:
+        # Escalas não medidas agora continuam com a linha de base anterior
+        execucao['escalas'] = {**linha_base, **resultados}
+        args.linha_base.write_text(json.dumps(execucao, ensure_ascii=False, indent=2), encoding='utf-8')
+        print(f"Linha de base gravada em {args.linha_base}")
+        return 0
+
+    if not linha_base:
+        print("Sem linha de base para comparar; use --gravar-linha-base.")
+    return 1 if regressoes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
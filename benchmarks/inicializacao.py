@@ -0,0 +1,136 @@
+"""
+Tempo de abertura do pacote e da interface.
+
+Cada medida roda num interpretador novo, como a primeira sessão depois de
+iniciar o servidor do Streamlit:
+
+- importar_tasy: `import tasy` (com o pandas);
+- importar_tasy_sem_pandas: `import tasy` com o pandas já carregado (custo
+  do próprio pacote);
+- app_primeira_execucao: primeira execução do app_tasy.py (importações,
+  configuração e tela inicial);
+- app_rerun: nova execução do script na mesma sessão (cada clique);
+- app_busca: rerun com um termo digitado em "🔍 Buscar exame".
+
+    python -m benchmarks.inicializacao
+    python -m benchmarks.inicializacao --repeticoes 10 --saida inicializacao.jsonl
+
+As medidas da interface usam o streamlit.testing (AppTest), sem navegador
+nem rede; sem o Streamlit instalado, só o pacote é medido.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from .executar import ambiente
+
+RAIZ = Path(__file__).resolve().parent.parent
+APP = RAIZ / 'app_tasy.py'
+
+_IMPORTAR_TASY = "import time; inicio = time.perf_counter(); import tasy; print(time.perf_counter() - inicio)"
+_IMPORTAR_TASY_SEM_PANDAS = "import pandas; " + _IMPORTAR_TASY
+
+_MEDIR_APP = """
+import json, sys, time
+from streamlit.testing.v1 import AppTest
+
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+inicio = time.perf_counter()
+app.run()
+primeira = time.perf_counter() - inicio
+
+reruns = []
+for _ in range(5):
+    inicio = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - inicio)
+
+busca = next(campo for campo in app.text_input if 'Buscar exame' in campo.label)
+buscas = []
+for termo in ('hemo', 'potássio', 'NR_EXAME', ''):
+    inicio = time.perf_counter()
+    busca.input(termo).run()
+    buscas.append(time.perf_counter() - inicio)
+
+print(json.dumps({
+    'app_primeira_execucao': primeira,
+    'app_rerun': min(reruns),
+    'app_busca': min(buscas),
+    'erros': [str(erro.value) for erro in app.exception],
+}))
+"""
+
+
+def _executar(codigo, *argumentos):
+    """Roda `codigo` num interpretador novo e devolve a última linha impressa."""
+    ambiente_processo = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        filter(None, [str(RAIZ), os.environ.get('PYTHONPATH')])
+    ))
+    saida = subprocess.run(
+        [sys.executable, '-c', codigo, *argumentos], cwd=RAIZ, env=ambiente_processo,
+        capture_output=True, text=True, check=True,
+    )
+    return saida.stdout.strip().splitlines()[-1]
+
+
+def medir(repeticoes=5):
+    """
+    Returns:
+        dict: {medida: menor tempo em segundos}
+    """
+    medidas = {
+        'importar_tasy': min(float(_executar(_IMPORTAR_TASY)) for _ in range(repeticoes)),
+        'importar_tasy_sem_pandas': min(float(_executar(_IMPORTAR_TASY_SEM_PANDAS)) for _ in range(repeticoes)),
+    }
+    if importlib.util.find_spec('streamlit') is None:
+        print("Streamlit não instalado: interface não medida.", file=sys.stderr)
+        return medidas
+
+    execucoes = [json.loads(_executar(_MEDIR_APP, str(APP))) for _ in range(repeticoes)]
+    erros = [erro for execucao in execucoes for erro in execucao.pop('erros')]
+    if erros:
+        raise RuntimeError(f"app_tasy.py falhou: {erros[0]}")
+    for medida in execucoes[0]:
+        medidas[medida] = min(execucao[medida] for execucao in execucoes)
+    return medidas
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.inicializacao',
+        description="Tempo de importação do pacote e de abertura da interface.",
+    )
+    parser.add_argument('--repeticoes', type=int, default=5,
+                        help="interpretadores novos por medida (vale o menor tempo)")
+    parser.add_argument('--saida', type=Path, default=None,
+                        help="arquivo .jsonl ao qual acrescentar o resultado desta execução")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    medidas = medir(args.repeticoes)
+
+    print(f"{'medida':<28}{'segundos':>10}")
+    for medida, segundos in medidas.items():
+        print(f"{medida:<28}{segundos:>10.3f}")
+
+    if args.saida:
+        execucao = {
+            'data': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'ambiente': ambiente(),
+            'repeticoes': args.repeticoes,
+            'medidas': {medida: round(segundos, 4) for medida, segundos in medidas.items()},
+        }
+        with open(args.saida, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(execucao, ensure_ascii=False) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,153 @@
+"""
+Motor de geração da planilha de importação TASY.
+
+Pode ser usado sem Streamlit:
+
+    from tasy import processar_arquivos
+    resultado = processar_arquivos('basicos.xlsx', None, 'pacientes.xlsx', 'MENSAL', 1)
+
+O processamento em lote, em fluxo, o histórico de envios e o serviço
+HTTP só são importados no primeiro uso (ver _IMPORTACAO_TARDIA), para
+não pesar na abertura da interface.
+"""
+import importlib
+
+from .cache import CacheLRU
+from .cache_resultados import CacheResultados
+from .combinacao import REGRAS_COLETAS_REPETIDAS, combinar_coletas
+from .configuracao import (
+    ConfiguracaoTasy,
+    carregar_configuracoes,
+    construir_configuracao,
+    obter_configuracao,
+    validar_configuracao,
+)
+from .correspondencia import LIMIAR_APLICACAO, LIMIAR_PADRAO, CorrespondenciaAproximada
+from .erros import ErroConfiguracao, ErroProcessamento, FilaCheia, ProcessamentoCancelado
+from .exportacao import (
+    FORMATOS_SAIDA,
+    MIME_XLSX,
+    EscritorPlanilha,
+    escrever_xlsx,
+    formatos_disponiveis,
+    gerar_planilha_csv,
+    gerar_planilha_excel,
+    gerar_planilha_parquet,
+    gerar_relatorio_inconsistencias,
+    gerar_relatorio_inconsistencias_lote,
+    gerar_saida,
+)
+from .instrumentacao import (
+    DESCRICOES_ETAPAS,
+    ETAPAS,
+    PERFILADORES,
+    Instrumentacao,
+    MedicaoEtapa,
+    perfiladores_disponiveis,
+)
+from .leitura import (
+    ArquivoCarregado,
+    InfoLeitura,
+    carregar_arquivo,
+    ler_excel,
+    ler_planilha,
+    ler_planilha_em_blocos,
+)
+from .mapeamento import MapeamentoExames
+from .motor import ResultadoProcessamento, processar, processar_arquivos
+from .pacientes import (
+    POLITICA_DUPLICADOS_PADRAO,
+    POLITICAS_DUPLICADOS,
+    IndicePacientes,
+    obter_indice_pacientes,
+)
+from .tarefas import GerenciadorTarefas, Tarefa, etapas_processamento
+from .transformacoes import normalizar_nome, normalizar_nomes
+from .validacao import COLUNAS_FORA_FAIXA, FaixasReferencia
+
+# nome -> submódulo, importado no primeiro acesso (processos, SQLite, arquivos temporários, http.server)
+_IMPORTACAO_TARDIA = {
+    'DeltaEnvio': 'historico',
+    'HistoricoEnvios': 'historico',
+    'ResultadoLote': 'lote',
+    'ServicoTasy': 'servico',
+    'TarefaLote': 'lote',
+    'processar_em_fluxo': 'fluxo',
+    'processar_lote': 'lote',
+}
+
+
+def __getattr__(nome):
+    if nome not in _IMPORTACAO_TARDIA:
+        raise AttributeError(f"module {__name__!r} has no attribute {nome!r}")
+    valor = getattr(importlib.import_module(f".{_IMPORTACAO_TARDIA[nome]}", __name__), nome)
+    globals()[nome] = valor
+    return valor
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_IMPORTACAO_TARDIA))
+
+__all__ = [
+    'ArquivoCarregado',
+    'CacheLRU',
+    'CacheResultados',
+    'COLUNAS_FORA_FAIXA',
+    'ConfiguracaoTasy',
+    'CorrespondenciaAproximada',
+    'DESCRICOES_ETAPAS',
+    'DeltaEnvio',
+    'ETAPAS',
+    'ErroConfiguracao',
+    'ErroProcessamento',
+    'EscritorPlanilha',
+    'FORMATOS_SAIDA',
+    'FaixasReferencia',
+    'FilaCheia',
+    'GerenciadorTarefas',
+    'HistoricoEnvios',
+    'IndicePacientes',
+    'InfoLeitura',
+    'Instrumentacao',
+    'LIMIAR_APLICACAO',
+    'LIMIAR_PADRAO',
+    'MIME_XLSX',
+    'MapeamentoExames',
+    'MedicaoEtapa',
+    'PERFILADORES',
+    'POLITICAS_DUPLICADOS',
+    'POLITICA_DUPLICADOS_PADRAO',
+    'REGRAS_COLETAS_REPETIDAS',
+    'ProcessamentoCancelado',
+    'ResultadoLote',
+    'ResultadoProcessamento',
+    'ServicoTasy',
+    'Tarefa',
+    'TarefaLote',
+    'carregar_arquivo',
+    'carregar_configuracoes',
+    'combinar_coletas',
+    'construir_configuracao',
+    'escrever_xlsx',
+    'etapas_processamento',
+    'formatos_disponiveis',
+    'gerar_planilha_csv',
+    'gerar_planilha_excel',
+    'gerar_planilha_parquet',
+    'gerar_relatorio_inconsistencias',
+    'gerar_relatorio_inconsistencias_lote',
+    'gerar_saida',
+    'ler_excel',
+    'ler_planilha',
+    'ler_planilha_em_blocos',
+    'normalizar_nome',
+    'normalizar_nomes',
+    'obter_configuracao',
+    'obter_indice_pacientes',
+    'perfiladores_disponiveis',
+    'processar',
+    'processar_arquivos',
+    'processar_em_fluxo',
+    'processar_lote',
+    'validar_configuracao',
+]
@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# Guarda necessária: os processos do lote ('spawn') importam este módulo
+if __name__ == '__main__':
+    sys.exit(main())
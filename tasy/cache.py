@@ -0,0 +1,86 @@
+"""
+Cache LRU simples, seguro para uso entre threads.
+"""
+import dataclasses
+import io
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+def tamanho_aproximado(valor):
+    """Bytes ocupados por um valor guardado em cache (DataFrames, bytes, tuplas, dataclasses)."""
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(deep=True).sum())
+    if isinstance(valor, pd.Series):
+        return int(valor.memory_usage(deep=True))
+    if isinstance(valor, (bytes, bytearray)):
+        return len(valor)
+    if isinstance(valor, io.BytesIO):
+        return valor.getbuffer().nbytes
+    if isinstance(valor, (tuple, list, set)):
+        return sum(tamanho_aproximado(v) for v in valor)
+    if isinstance(valor, dict):
+        return sum(tamanho_aproximado(v) for v in valor.values())
+    if dataclasses.is_dataclass(valor) and not isinstance(valor, type):
+        return sum(tamanho_aproximado(getattr(valor, f.name)) for f in dataclasses.fields(valor))
+    return sys.getsizeof(valor)
+
+
+class CacheLRU:
+    """
+    Dicionário com limite de itens; descarta o menos usado recentemente.
+
+    Com `max_bytes`, também descarta itens até o total medido por `medir`
+    (padrão: tamanho_aproximado) caber no limite. O item mais recente é
+    sempre mantido, mesmo que sozinho passe do limite.
+    """
+
+    def __init__(self, maxsize=128, max_bytes=None, medir=tamanho_aproximado):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._medir = medir
+        self._dados = OrderedDict()
+        self._tamanhos = {}
+        self.bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, chave, padrao=None):
+        with self._lock:
+            try:
+                self._dados.move_to_end(chave)
+            except KeyError:
+                return padrao
+            return self._dados[chave]
+
+    def __setitem__(self, chave, valor):
+        tamanho = self._medir(valor) if self.max_bytes is not None else 0
+        with self._lock:
+            if chave in self._dados:
+                self.bytes -= self._tamanhos.pop(chave, 0)
+            self._dados[chave] = valor
+            self._dados.move_to_end(chave)
+            self._tamanhos[chave] = tamanho
+            self.bytes += tamanho
+            while len(self._dados) > 1 and (
+                len(self._dados) > self.maxsize
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                antiga, _ = self._dados.popitem(last=False)
+                self.bytes -= self._tamanhos.pop(antiga, 0)
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._dados
+
+    def __len__(self):
+        with self._lock:
+            return len(self._dados)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+            self._tamanhos.clear()
+            self.bytes = 0
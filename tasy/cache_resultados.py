@@ -0,0 +1,76 @@
+"""
+Cache de processamento por conteúdo dos arquivos enviados.
+
+Três níveis, cada um com despejo LRU limitado em bytes:
+
+    leituras   - DataFrames lidos de cada planilha (hash do arquivo + colunas)
+    resultados - ResultadoProcessamento, sem o protocolo (hash dos três
+                 arquivos, estabelecimento, configuração e opções)
+    saidas     - arquivos gerados (.xlsx/.csv/...) por resultado + protocolo
+
+Clicar em Processar de novo com os mesmos arquivos não relê nem reprocessa
+nada; trocar só o protocolo reaproveita o resultado e refaz apenas a coluna
+DS_PROTOCOLO e o arquivo de saída.
+"""
+import io
+from dataclasses import replace
+
+from .cache import CacheLRU
+from .leitura import carregar_arquivo, ler_planilha
+
+MB = 1024 * 1024
+
+
+class CacheResultados:
+    """Caches de leitura, resultado e saída compartilhados entre execuções."""
+
+    def __init__(self, max_bytes_leituras=256 * MB, max_bytes_resultados=128 * MB,
+                 max_bytes_saidas=64 * MB):
+        self.leituras = CacheLRU(maxsize=32, max_bytes=max_bytes_leituras)
+        self.resultados = CacheLRU(maxsize=16, max_bytes=max_bytes_resultados)
+        self.saidas = CacheLRU(maxsize=32, max_bytes=max_bytes_saidas)
+
+    def ler(self, arquivo, colunas):
+        """
+        Como leitura.ler_planilha, reaproveitando leituras do mesmo conteúdo.
+
+        Returns:
+            tuple: (DataFrame, InfoLeitura)
+        """
+        arquivo = carregar_arquivo(arquivo)
+        chave = (arquivo.hash, tuple(colunas))
+
+        guardado = self.leituras.get(chave)
+        if guardado is not None:
+            df, info = guardado
+            info = replace(info, motor='cache', segundos=0.0)
+        else:
+            df, info = ler_planilha(arquivo, colunas)
+            self.leituras[chave] = (df, info)
+
+        # O processamento acrescenta colunas ao DataFrame; a cópia rasa
+        # mantém o DataFrame guardado intacto sem duplicar os dados.
+        return df.copy(deep=False), info
+
+    def saida(self, resultado, protocolo, formato, gerar):
+        """
+        Arquivo de saída de um resultado, gerado uma vez por protocolo/formato.
+
+        Args:
+            resultado: ResultadoProcessamento (usa resultado.chave_cache)
+            gerar: callable() -> BytesIO, chamado se não houver no cache
+        """
+        if resultado.chave_cache is None:
+            return gerar()
+
+        chave = (resultado.chave_cache, protocolo, formato)
+        conteudo = self.saidas.get(chave)
+        if conteudo is None:
+            conteudo = gerar().getvalue()
+            self.saidas[chave] = conteudo
+        return io.BytesIO(conteudo)
+
+    def clear(self):
+        self.leituras.clear()
+        self.resultados.clear()
+        self.saidas.clear()
@@ -0,0 +1,353 @@
+"""
+Execução em lote sem interface (agendamento noturno).
+
+Estrutura esperada do diretório de entrada, uma pasta por estabelecimento
+do config_exames.json (maiúsculas, acentos, '_' e '-' são ignorados no nome):
+
+    entrada/
+        MATRIZ/
+            basicos_2025_11.xlsx
+            resultados2_2025_11.xlsx   (opcional)
+            pacientes_2025_11.xlsx
+        MONTE SERRAT/
+            ...
+
+Os estabelecimentos são processados em paralelo, um processo por
+estabelecimento (--processos limita quantos ao mesmo tempo).
+
+Uso:
+    python -m tasy entrada/ --protocolo MENSAL --saida saida/
+    python -m tasy entrada/ --combinado      (uma planilha para todos)
+    python -m tasy entrada/ --fluxo          (exportações grandes, memória limitada)
+    python -m tasy entrada/ --historico historico_envios.sqlite   (só resultados novos)
+"""
+import argparse
+import logging
+import warnings
+from dataclasses import replace
+from datetime import datetime
+from pathlib import Path
+
+from .configuracao import chave_estabelecimento, obter_configuracao
+from .correspondencia import LIMIAR_APLICACAO, LIMIAR_PADRAO
+from .erros import ErroConfiguracao
+from .exportacao import (
+    FORMATOS_SAIDA,
+    gerar_relatorio_inconsistencias,
+    gerar_relatorio_inconsistencias_lote,
+    gerar_saida,
+)
+from .fluxo import TAMANHO_BLOCO, processar_em_fluxo
+from .historico import HistoricoEnvios
+from .instrumentacao import ETAPAS, PERFILADORES, Instrumentacao
+from .lote import ResultadoLote, TarefaLote, processar_lote
+from .pacientes import POLITICA_DUPLICADOS_PADRAO, POLITICAS_DUPLICADOS
+
+PROTOCOLOS = ["MENSAL", "TRIMESTRAL", "SEMESTRAL", "ANUAL"]
+EXTENSOES_EXCEL = {'.xlsx', '.xls'}
+
+logger = logging.getLogger('tasy')
+
+
+def localizar_arquivos(pasta):
+    """
+    Identifica as planilhas de uma pasta de estabelecimento pelo nome do arquivo.
+
+    Returns:
+        dict: {'basicos': Path, 'resultados2': Path ou None, 'pacientes': Path}
+        (chaves ausentes quando o arquivo não foi encontrado)
+    """
+    arquivos = {}
+    for caminho in sorted(pasta.iterdir()):
+        if caminho.suffix.lower() not in EXTENSOES_EXCEL or caminho.name.startswith('~$'):
+            continue
+        chave = chave_estabelecimento(caminho.stem)
+        if 'resultados2' in chave or 'resultado2' in chave:
+            arquivos.setdefault('resultados2', caminho)
+        elif 'basico' in chave:
+            arquivos.setdefault('basicos', caminho)
+        elif 'paciente' in chave:
+            arquivos.setdefault('pacientes', caminho)
+    return arquivos
+
+
+def localizar_pastas_estabelecimentos(entrada, estabelecimentos):
+    """Associa cada estabelecimento à sua subpasta em `entrada` (ou None)."""
+    pastas = {chave_estabelecimento(p.name): p for p in entrada.iterdir() if p.is_dir()}
+    return {nome: pastas.get(chave_estabelecimento(nome)) for nome in estabelecimentos}
+
+
+def gravar_resultado(nome, resultado, saida, carimbo, formatos=('xlsx',),
+                    politica_duplicados=POLITICA_DUPLICADOS_PADRAO, gravar_arquivos=True):
+    """
+    Registra no log o resultado de um estabelecimento e grava a planilha e o
+    relatório de inconsistências dele (`gravar_arquivos=False` no modo
+    --combinado, em que só os arquivos do lote são gravados).
+    """
+    for info in resultado.leituras:
+        logger.info("%s: %s lido em %.2fs (%s, %s) - %d linhas, %d colunas",
+                    nome, info.arquivo, info.segundos, info.formato, info.motor, info.linhas, info.colunas)
+    if resultado.memoria is not None and resultado.memoria.pico is not None:
+        logger.info("%s: pico de memória %.0f MB", nome, resultado.memoria.pico / 2**20)
+
+    if resultado.linhas_gravadas is not None:
+        logger.info("%s: %d registros gravados em fluxo", nome, resultado.linhas_gravadas)
+    elif gravar_arquivos:
+        gravar_planilha(nome, resultado.planilha_final, saida, carimbo, formatos, resultado.instrumentacao)
+    else:
+        logger.info("%s: %d registros", nome, len(resultado.planilha_final))
+
+    for col_tasy, quantidade in resultado.valores_invalidos.items():
+        if quantidade:
+            logger.warning("%s: %s com %d valor(es) não numérico(s) descartado(s)", nome, col_tasy, quantidade)
+
+    for planilha, quantidade in resultado.datas_invalidas.items():
+        if quantidade:
+            logger.warning("%s: %d data(s) de %s não reconhecida(s) em dthr_os", nome, quantidade, planilha)
+
+    aproximados = resultado.correspondencias_aproximadas
+    if len(aproximados):
+        logger.info("%s: %d nome(s) encontrado(s) por similaridade, %d sugestão(ões) para conferir",
+                    nome, (aproximados['Aplicado'] == 'Sim').sum(), (aproximados['Aplicado'] == 'Não').sum())
+
+    duplicados = resultado.nomes_duplicados
+    if len(duplicados):
+        logger.warning("%s: %d nome(s) com mais de um atendimento no TASY (política %s)",
+                       nome, len(duplicados), politica_duplicados)
+
+    fora_faixa = resultado.valores_fora_faixa
+    if len(fora_faixa):
+        logger.warning("%s: %d valor(es) fora da faixa aceita (%s)", nome, resultado.total_fora_faixa, ', '.join(
+            f"{exame}: {quantidade}" for exame, quantidade in fora_faixa['Nome do Exame'].value_counts().items()
+        ))
+    for tabela, quantidade in resultado.linhas_omitidas.items():
+        if quantidade:
+            logger.warning("%s: relatório com as primeiras linhas de %s; %d linha(s) só contada(s)",
+                           nome, tabela, quantidade)
+
+    if gravar_arquivos and (resultado.nomes_sem_atendimento or len(aproximados) or len(duplicados)
+                            or len(fora_faixa)):
+        arquivo_inconsist = saida / f"Relatorio_Inconsistencias_{nome}_{carimbo}.xlsx"
+        arquivo_inconsist.write_bytes(gerar_relatorio_inconsistencias(
+            resultado.nomes_sem_atendimento, aproximados, duplicados, fora_faixa
+        ).getvalue())
+        logger.warning("%s: %d inconsistências -> %s",
+                       nome, resultado.total_inconsistencias, arquivo_inconsist)
+
+    instrumentacao = resultado.instrumentacao
+    if instrumentacao.etapas:
+        logger.info("%s: etapas %s", nome, ', '.join(
+            f"{medicao.etapa} {medicao.segundos:.2f}s" for medicao in instrumentacao.etapas.values()
+        ))
+    if instrumentacao.perfil:
+        arquivo_perfil = saida / f"Perfil_{nome}_{instrumentacao.perfilar}_{carimbo}.txt"
+        arquivo_perfil.write_text(instrumentacao.perfil, encoding='utf-8')
+        logger.info("%s: perfil de %s -> %s", nome, instrumentacao.perfilar, arquivo_perfil)
+
+    return resultado
+
+
+def gravar_planilha(nome, planilha, saida, carimbo, formatos=('xlsx',), instrumentacao=None):
+    """Grava a planilha de importação em cada formato pedido."""
+    instrumentacao = instrumentacao or Instrumentacao()
+    for formato in formatos:
+        arquivo_saida = arquivo_planilha(nome, saida, carimbo, formato)
+        with instrumentacao.etapa('exportacao', len(planilha)) as etapa:
+            arquivo_saida.write_bytes(gerar_saida(planilha, formato).getvalue())
+            etapa.linhas_saida = len(planilha)
+        logger.info("%s: %d registros -> %s", nome, len(planilha), arquivo_saida)
+
+
+def arquivo_planilha(nome, saida, carimbo, formato):
+    extensao, _ = FORMATOS_SAIDA[formato]
+    return saida / f"Planilha_Importacao_TASY_{nome}_{carimbo}{extensao}"
+
+
+def processar_lote_em_fluxo(tarefas, protocolo, configuracao, saida, carimbo, formatos,
+                            limiar_aproximado, politica_duplicados, tamanho_bloco,
+                            perfilar=None, perfilador='cprofile'):
+    """
+    Modo --fluxo: um estabelecimento por vez, cada planilha gravada direto
+    em `saida` enquanto é montada (ver fluxo.processar_em_fluxo).
+    """
+    lote = ResultadoLote()
+    for concluidos, tarefa in enumerate(tarefas, start=1):
+        destinos = {formato: arquivo_planilha(tarefa.estabelecimento, saida, carimbo, formato)
+                    for formato in formatos}
+        try:
+            resultado = processar_em_fluxo(
+                tarefa.basicos, tarefa.resultados2, tarefa.pacientes, protocolo, tarefa.cd_estabelecimento,
+                destinos, configuracao=configuracao, limiar_aproximado=limiar_aproximado,
+                politica_duplicados=politica_duplicados, tamanho_bloco=tamanho_bloco,
+                instrumentacao=Instrumentacao(perfilar, perfilador),
+            )
+        except Exception as e:
+            lote.erros[tarefa.estabelecimento] = str(e)
+            _registrar_conclusao(tarefa.estabelecimento, None, str(e), concluidos, len(tarefas))
+            continue
+        lote.resultados[tarefa.estabelecimento] = resultado
+        for destino in destinos.values():
+            logger.info("%s: -> %s", tarefa.estabelecimento, destino)
+        _registrar_conclusao(tarefa.estabelecimento, resultado, None, concluidos, len(tarefas))
+    return lote
+
+
+def _registrar_conclusao(estabelecimento, resultado, erro, concluidos, total):
+    if erro is not None:
+        logger.error("%s: erro ao processar: %s", estabelecimento, erro)
+    else:
+        logger.info("%s: processado (%d/%d)", estabelecimento, concluidos, total)
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m tasy',
+        description="Gera as planilhas de importação TASY para todos os estabelecimentos.",
+    )
+    parser.add_argument('entrada', type=Path,
+                        help="diretório com uma subpasta por estabelecimento")
+    parser.add_argument('--protocolo', choices=PROTOCOLOS, default='MENSAL')
+    parser.add_argument('--saida', type=Path, default=Path('.'),
+                        help="diretório dos arquivos gerados (padrão: diretório atual)")
+    parser.add_argument('--formato', action='append', dest='formatos', choices=list(FORMATOS_SAIDA),
+                        help="formato da planilha gerada (pode repetir; padrão: xlsx)")
+    parser.add_argument('--config', type=Path, default=None,
+                        help="caminho do config_exames.json")
+    parser.add_argument('--estabelecimento', action='append', dest='estabelecimentos',
+                        help="processa apenas este estabelecimento (pode repetir)")
+    parser.add_argument('--aplicar-aproximados', action='store_true',
+                        help="preenche o atendimento dos nomes encontrados por similaridade "
+                             "(padrão: só sugere, no relatório de inconsistências)")
+    parser.add_argument('--limiar-aproximado', type=float, default=LIMIAR_APLICACAO,
+                        help="com --aplicar-aproximados, confiança mínima (0 a 1) para aplicar "
+                             f"(padrão: {LIMIAR_APLICACAO})")
+    parser.add_argument('--sem-aproximacao', action='store_true',
+                        help="não procura nomes por similaridade (nem como sugestão)")
+    parser.add_argument('--politica-duplicados', choices=POLITICAS_DUPLICADOS, default=POLITICA_DUPLICADOS_PADRAO,
+                        help="atendimento usado quando um nome aparece mais de uma vez no TASY "
+                             f"(padrão: {POLITICA_DUPLICADOS_PADRAO})")
+    parser.add_argument('--processos', type=int, default=None,
+                        help="estabelecimentos processados em paralelo (padrão: núcleos disponíveis; 1 = sem paralelismo)")
+    parser.add_argument('--combinado', action='store_true',
+                        help="grava uma única planilha TASY e um único relatório com todos os estabelecimentos")
+    parser.add_argument('--fluxo', action='store_true',
+                        help="lê as planilhas em blocos e grava a saída aos poucos, com memória limitada "
+                             "(exportações muito grandes; um estabelecimento por vez; .xls ainda é lido inteiro)")
+    parser.add_argument('--tamanho-bloco', type=int, default=TAMANHO_BLOCO,
+                        help=f"linhas lidas por vez no modo --fluxo (padrão: {TAMANHO_BLOCO})")
+    parser.add_argument('--metricas', type=Path, default=None,
+                        help="arquivo .jsonl ao qual acrescentar tempo, linhas e memória de cada etapa "
+                             "(uma linha por estabelecimento, para acompanhar a evolução)")
+    parser.add_argument('--perfilar', choices=ETAPAS, default=None,
+                        help="perfila esta etapa e grava o relatório em Perfil_<estabelecimento>_<etapa>_*.txt")
+    parser.add_argument('--perfilador', choices=PERFILADORES, default='cprofile',
+                        help="perfilador usado com --perfilar (pyinstrument precisa estar instalado)")
+    parser.add_argument('--historico', type=Path, default=None,
+                        help="arquivo SQLite com os resultados já enviados: grava só valores novos ou "
+                             "alterados e registra o envio depois que os arquivos foram gravados")
+    return parser
+
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    if args.fluxo and args.combinado:
+        parser.error("--combinado não pode ser usado com --fluxo (a planilha combinada fica toda em memória)")
+    if args.fluxo and args.historico:
+        parser.error("--historico não pode ser usado com --fluxo (a planilha é gravada antes de ser comparada)")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    warnings.filterwarnings('ignore')
+
+    try:
+        configuracao = obter_configuracao(args.config)
+    except ErroConfiguracao as e:
+        logger.error("%s", e)
+        return 2
+
+    if not args.entrada.is_dir():
+        logger.error("Diretório de entrada não encontrado: %s", args.entrada)
+        return 2
+
+    estabelecimentos = configuracao.estabelecimentos
+    if args.estabelecimentos:
+        desconhecidos = [e for e in args.estabelecimentos if e not in estabelecimentos]
+        if desconhecidos:
+            logger.error("Estabelecimento(s) desconhecido(s): %s", ', '.join(desconhecidos))
+            return 2
+        estabelecimentos = {e: estabelecimentos[e] for e in args.estabelecimentos}
+
+    args.saida.mkdir(parents=True, exist_ok=True)
+    carimbo = datetime.now().strftime('%Y%m%d_%H%M%S')
+    if args.sem_aproximacao:
+        limiar_aproximado = None
+    elif args.aplicar_aproximados:
+        limiar_aproximado = args.limiar_aproximado
+    else:
+        limiar_aproximado = LIMIAR_PADRAO
+
+    formatos = args.formatos or ['xlsx']
+    falhas = 0
+    tarefas = []
+    pastas = localizar_pastas_estabelecimentos(args.entrada, estabelecimentos)
+    for nome, pasta in pastas.items():
+        if pasta is None:
+            logger.warning("%s: nenhuma pasta em %s, ignorado", nome, args.entrada)
+            continue
+        arquivos = localizar_arquivos(pasta)
+        faltando = [tipo for tipo in ('basicos', 'pacientes') if tipo not in arquivos]
+        if faltando:
+            falhas += 1
+            logger.error("%s: arquivo(s) não encontrado(s) em %s: %s", nome, pasta, ', '.join(faltando))
+            continue
+        tarefas.append(TarefaLote(nome, estabelecimentos[nome], arquivos['basicos'],
+                                  arquivos['pacientes'], arquivos.get('resultados2')))
+
+    if args.fluxo:
+        lote = processar_lote_em_fluxo(tarefas, args.protocolo, configuracao, args.saida, carimbo, formatos,
+                                       limiar_aproximado, args.politica_duplicados, args.tamanho_bloco,
+                                       args.perfilar, args.perfilador)
+    else:
+        lote = processar_lote(tarefas, args.protocolo, configuracao=configuracao, processos=args.processos,
+                              limiar_aproximado=limiar_aproximado, politica_duplicados=args.politica_duplicados,
+                              ao_concluir=_registrar_conclusao, perfilar=args.perfilar, perfilador=args.perfilador)
+    falhas += len(lote.erros)
+
+    historico = HistoricoEnvios(args.historico) if args.historico else None
+    deltas = []
+    if historico is not None:
+        for nome, resultado in list(lote.resultados.items()):
+            delta = historico.filtrar_novos(resultado.planilha_final, estabelecimentos[nome])
+            logger.info("%s: %d valor(es) novo(s), %d alterado(s), %d já enviado(s) omitido(s)",
+                        nome, delta.celulas_novas, delta.celulas_alteradas, delta.celulas_repetidas)
+            lote.resultados[nome] = replace(resultado, planilha_final=delta.planilha)
+            deltas.append(delta)
+
+    for nome, resultado in lote.resultados.items():
+        gravar_resultado(nome, resultado, args.saida, carimbo, formatos,
+                         args.politica_duplicados, gravar_arquivos=not args.combinado)
+        if args.metricas:
+            registros = (len(resultado.planilha_final) if resultado.linhas_gravadas is None
+                         else resultado.linhas_gravadas)
+            resultado.instrumentacao.gravar_jsonl(
+                args.metricas, estabelecimento=nome, protocolo=args.protocolo,
+                modo='fluxo' if args.fluxo else 'memoria', registros=registros,
+                pico_memoria=resultado.memoria.pico if resultado.memoria is not None else None,
+            )
+
+    if args.combinado and lote.resultados:
+        gravar_planilha('LOTE', lote.planilha_combinada(), args.saida, carimbo, formatos)
+
+    if (lote.total_inconsistencias or lote.total_fora_faixa) and (args.combinado or len(lote.resultados) > 1):
+        arquivo_inconsist = args.saida / f"Relatorio_Inconsistencias_LOTE_{carimbo}.xlsx"
+        arquivo_inconsist.write_bytes(gerar_relatorio_inconsistencias_lote(lote.resultados).getvalue())
+        logger.warning("LOTE: %d inconsistências, %d valor(es) fora da faixa -> %s",
+                       lote.total_inconsistencias, lote.total_fora_faixa, arquivo_inconsist)
+
+    if historico is not None:
+        # Só depois de gravar todos os arquivos: uma falha antes daqui não marca nada como enviado
+        with historico:
+            for delta in deltas:
+                historico.registrar(delta)
+        logger.info("Histórico de envios atualizado: %s", args.historico)
+
+    return 1 if falhas else 0
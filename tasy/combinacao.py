@@ -0,0 +1,137 @@
+"""
+Combinação do basicos com o resultados2: uma linha por coleta.
+
+Uma coleta é o par (nome normalizado, dthr_os). Cada planilha é reduzida
+antes a uma linha por coleta, conforme a regra de coletas repetidas
+(chave opcional 'regra_coletas_repetidas' do config_exames.json):
+
+- 'primeiro': em cada coluna, o primeiro valor preenchido na ordem do arquivo;
+- 'ultimo': o último valor preenchido (a linha mais recente da exportação).
+
+As coletas das duas planilhas são cruzadas por uma chave int64 (código do
+nome x código da data, via pd.factorize) e os exames do resultados2 entram
+numa única passada: onde a mesma coluna existir nas duas planilhas, vale a
+do basicos e o resultados2 só preenche o que estiver vazio.
+
+O resultado tem uma linha por coleta do basicos, em ordem de nome e data.
+Coletas que só existem no resultados2 não entram: o atendimento e o nome
+vêm do basicos.
+"""
+import numpy as np
+import pandas as pd
+
+from .transformacoes import COLUNA_DATA_LAB
+
+REGRAS_COLETAS_REPETIDAS = ['primeiro', 'ultimo']
+REGRA_COLETAS_REPETIDAS_PADRAO = 'primeiro'
+
+
+def _datas_int64(datas):
+    """dthr_os como int64 (NaT vira um valor como outro qualquer da chave)."""
+    return np.asarray(datas.to_numpy(), dtype='datetime64[ns]').view('int64')
+
+
+def codificar_coletas(*lados):
+    """
+    Chave int64 de coleta de cada DataFrame (nome_normalizado, dthr_os),
+    comparável entre eles e crescente na ordem (nome, data).
+
+    Returns:
+        list de arrays int64, um por DataFrame
+    """
+    nomes = np.concatenate([lado['nome_normalizado'].to_numpy(dtype=object) for lado in lados])
+    datas = np.concatenate([_datas_int64(lado[COLUNA_DATA_LAB]) for lado in lados])
+    codigos_nomes, _ = pd.factorize(nomes, sort=True)
+    codigos_datas, unicas = pd.factorize(datas, sort=True)
+    chaves = codigos_nomes.astype('int64') * len(unicas) + codigos_datas
+    return np.split(chaves, np.cumsum([len(lado) for lado in lados])[:-1])
+
+
+def reduzir_coletas(df, chaves, regra=REGRA_COLETAS_REPETIDAS_PADRAO):
+    """
+    Uma linha por chave de coleta, em ordem crescente de chave.
+
+    Returns:
+        tuple: (DataFrame com índice 0..n-1, chaves únicas ordenadas)
+    """
+    if regra not in REGRAS_COLETAS_REPETIDAS:
+        raise ValueError(f"Regra de coletas repetidas inválida: {regra}")
+    ordem = np.argsort(chaves, kind='stable')
+    ordenadas = chaves[ordem]
+    if not (ordenadas[1:] == ordenadas[:-1]).any():
+        # Caso comum: nenhuma coleta repetida, só a reordenação
+        return df.take(ordem).reset_index(drop=True), ordenadas
+
+    # Nome, data e demais colunas de texto: da primeira (ou última) linha da
+    # coleta; colunas numéricas (exames, atendimento): o primeiro (ou último)
+    # valor preenchido, pela menor (ou maior) posição não vazia de cada
+    # coleta repetida (as demais já estão certas na linha representante)
+    inicios = np.flatnonzero(np.r_[True, ordenadas[1:] != ordenadas[:-1]])
+    tamanhos = np.diff(np.r_[inicios, len(ordenadas)])
+    representantes = inicios if regra == 'primeiro' else inicios + tamanhos - 1
+    reduzido = df.take(ordem[representantes]).reset_index(drop=True)
+
+    repetidas = np.flatnonzero(tamanhos > 1)
+    linhas = ordem[np.repeat(tamanhos > 1, tamanhos)]
+    inicios_repetidas = np.r_[0, np.cumsum(tamanhos[repetidas])[:-1]]
+    fins_repetidas = inicios_repetidas + tamanhos[repetidas] - 1
+    posicoes = np.arange(len(linhas))
+    novas = {}
+    for coluna in df.select_dtypes('number').columns:
+        valores = df[coluna].to_numpy()[linhas]
+        vazios = np.isnan(valores)
+        if not vazios.any():
+            continue
+        if regra == 'primeiro':
+            escolhidas = np.minimum.reduceat(np.where(vazios, len(linhas), posicoes), inicios_repetidas)
+            sem_valor = escolhidas > fins_repetidas
+        else:
+            escolhidas = np.maximum.reduceat(np.where(vazios, -1, posicoes), inicios_repetidas)
+            sem_valor = escolhidas < inicios_repetidas
+        valores = valores[np.clip(escolhidas, 0, len(linhas) - 1)]
+        valores[sem_valor] = np.nan
+        coluna_reduzida = reduzido[coluna].to_numpy().copy()
+        coluna_reduzida[repetidas] = valores
+        novas[coluna] = coluna_reduzida
+    return reduzido.assign(**novas), ordenadas[inicios]
+
+
+def combinar_coletas(basicos, resultados2, regra=REGRA_COLETAS_REPETIDAS_PADRAO):
+    """
+    Combina as duas planilhas preparadas (ver módulo).
+
+    Args:
+        basicos: nome_original, nome_normalizado, dthr_os, NR_ATENDIMENTO e exames
+        resultados2: nome_normalizado, dthr_os e exames (ou None)
+        regra: 'primeiro' ou 'ultimo'
+
+    Returns:
+        DataFrame: colunas do basicos mais os exames do resultados2
+    """
+    if resultados2 is None:
+        chaves, = codificar_coletas(basicos)
+        return reduzir_coletas(basicos, chaves, regra)[0]
+
+    chaves_basicos, chaves_r2 = codificar_coletas(basicos, resultados2)
+    basicos, chaves_basicos = reduzir_coletas(basicos, chaves_basicos, regra)
+    resultados2, chaves_r2 = reduzir_coletas(resultados2, chaves_r2, regra)
+
+    exames = [coluna for coluna in resultados2.columns if coluna not in ('nome_normalizado', COLUNA_DATA_LAB)]
+    if not exames:
+        return basicos
+    if len(chaves_r2) == 0:
+        bloco = np.full((len(basicos), len(exames)), np.nan, dtype='float32')
+    else:
+        # Coleta do resultados2 de cada coleta do basicos (as duas listas de chaves estão ordenadas)
+        posicoes = np.minimum(np.searchsorted(chaves_r2, chaves_basicos), len(chaves_r2) - 1)
+        bloco = resultados2[exames].to_numpy(dtype='float32')[posicoes]
+        bloco[chaves_r2[posicoes] != chaves_basicos] = np.nan
+
+    combinado = {}
+    for i, coluna in enumerate(exames):
+        if coluna in basicos.columns:
+            atual = basicos[coluna].to_numpy()
+            combinado[coluna] = np.where(np.isnan(atual), bloco[:, i], atual)
+        else:
+            combinado[coluna] = bloco[:, i]
+    return basicos.assign(**combinado)
@@ -0,0 +1,294 @@
+"""
+Carregamento do config_exames.json e construção dos mapas de exames.
+
+Este módulo não depende do Streamlit: a interface e a linha de comando
+usam as mesmas funções.
+
+`obter_configuracao` guarda a configuração compilada e só relê o JSON
+quando a data de modificação ou o tamanho do arquivo mudam; editar o
+config_exames.json passa a valer no próximo processamento, sem reiniciar.
+"""
+import hashlib
+import json
+import threading
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+
+import pandas as pd
+
+from .combinacao import REGRA_COLETAS_REPETIDAS_PADRAO, REGRAS_COLETAS_REPETIDAS
+from .erros import ErroConfiguracao
+from .mapeamento import CATEGORIAS, MapeamentoExames, chave_coluna
+from .transformacoes import FORMATOS_DATA, normalizar_nome
+from .validacao import FaixasReferencia, formatar_faixa
+
+CAMINHO_CONFIG_PADRAO = Path(__file__).resolve().parent.parent / 'config_exames.json'
+
+ORDEM_COLUNAS_PADRAO = [
+    'NM_PACIENTE', 'NR_ATENDIMENTO', 'DT_RESULTADO', 'DS_PROTOCOLO', 'CD_ESTABELECIMENTO'
+]
+
+
+def chave_estabelecimento(nome):
+    """Nome comparável (estabelecimento, pasta ou arquivo): sem acentos, minúsculo, apenas letras e dígitos."""
+    return ''.join(c for c in normalizar_nome(nome) if c.isalnum())
+
+
+@dataclass
+class ConfiguracaoTasy:
+    """Configuração já interpretada, pronta para o processamento."""
+    config: dict
+    estabelecimentos: dict
+    # coluna_lab -> {'codigo': 'NR_EXAME_xxx', 'nome': nome}
+    mapa_exames_completo: dict = field(default_factory=dict)
+    # 'NR_EXAME_xxx' -> {'nome': nome, 'colunas_lab': [...], 'categoria': categoria,
+    #                   'unidade', 'faixa_min', 'faixa_max' (None se ausentes)}
+    mapa_exames_por_codigo: dict = field(default_factory=dict)
+    ordem_colunas_tasy: list = field(default_factory=list)
+    # Formatos aceitos em dthr_os (chave opcional 'formatos_data' do JSON)
+    formatos_data: list = field(default_factory=lambda: list(FORMATOS_DATA))
+    # Linhas com o mesmo paciente e dthr_os (chave opcional 'regra_coletas_repetidas'; ver tasy.combinacao)
+    regra_coletas_repetidas: str = REGRA_COLETAS_REPETIDAS_PADRAO
+    # Hash do conteúdo da configuração; muda a cada edição do JSON (chave de cache)
+    assinatura: str = ''
+    # Índice reverso coluna do laboratório -> código TASY (ver tasy.mapeamento)
+    mapeamento: MapeamentoExames = None
+
+    @property
+    def versao(self):
+        return self.config.get('versao', 'N/A')
+
+    def codigo_estabelecimento(self, nome):
+        """Código do estabelecimento pelo nome, sem diferenciar caixa, acentos e espaços (None se desconhecido)."""
+        chave = chave_estabelecimento(nome)
+        for outro, codigo in self.estabelecimentos.items():
+            if chave_estabelecimento(outro) == chave:
+                return codigo
+        return None
+
+    def colunas_lab(self, categoria=None):
+        """Todas as variações de coluna do laboratório ('basico', 'resultados2' ou None = todas)."""
+        return [
+            coluna
+            for info in self.mapa_exames_por_codigo.values()
+            if not categoria or info['categoria'] == categoria
+            for coluna in info['colunas_lab']
+        ]
+
+    @cached_property
+    def faixas(self):
+        """FaixasReferencia dos exames com faixa_min/faixa_max (ver tasy.validacao)."""
+        return FaixasReferencia(self.mapa_exames_por_codigo)
+
+    @cached_property
+    def tabela_referencia(self):
+        """Uma linha por exame (código TASY, nome, colunas do laboratório, faixa), para consulta na interface."""
+        return pd.DataFrame(
+            [
+                {
+                    'Código TASY': codigo.replace('NR_EXAME_', ''),
+                    'Nome do Exame': info['nome'],
+                    'Colunas do Lab': ', '.join(dict.fromkeys(info['colunas_lab'])),
+                    'Faixa aceita': formatar_faixa(info['faixa_min'], info['faixa_max'], info['unidade']),
+                }
+                for codigo, info in sorted(self.mapa_exames_por_codigo.items())
+            ],
+            columns=['Código TASY', 'Nome do Exame', 'Colunas do Lab', 'Faixa aceita'],
+        )
+
+    @cached_property
+    def _indice_busca(self):
+        # Texto de cada linha da tabela_referencia, minúsculo e sem acentos
+        return [normalizar_nome(' | '.join(linha)) for linha in self.tabela_referencia.itertuples(index=False)]
+
+    def buscar_exames(self, termo):
+        """Linhas da tabela_referencia com `termo` no código, no nome ou nas colunas (ignora caixa e acentos)."""
+        termo = normalizar_nome(termo)
+        if not termo:
+            return self.tabela_referencia
+        return self.tabela_referencia[[termo in texto for texto in self._indice_busca]]
+
+
+def carregar_configuracoes(caminho=None):
+    """Carrega configurações do arquivo JSON"""
+    caminho = Path(caminho) if caminho else CAMINHO_CONFIG_PADRAO
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        raise ErroConfiguracao(f"Arquivo {caminho.name} não encontrado!") from None
+    except json.JSONDecodeError as e:
+        raise ErroConfiguracao(f"Erro ao ler {caminho.name}: {str(e)}") from e
+
+
+def validar_configuracao(config):
+    """
+    Confere a estrutura do config_exames.json antes de compilar os mapas.
+
+    Raises:
+        ErroConfiguracao: com todos os problemas encontrados, um por linha
+    """
+    if not isinstance(config, dict):
+        raise ErroConfiguracao("config_exames.json deve conter um objeto JSON")
+
+    problemas = []
+    estabelecimentos = config.get('estabelecimentos')
+    if not isinstance(estabelecimentos, dict) or not estabelecimentos:
+        problemas.append("'estabelecimentos' ausente ou vazio")
+    else:
+        for nome, codigo in estabelecimentos.items():
+            if not isinstance(codigo, int) or isinstance(codigo, bool):
+                problemas.append(f"estabelecimento {nome}: código deve ser inteiro ({codigo!r})")
+
+    exames = config.get('exames')
+    if not isinstance(exames, list) or not exames:
+        problemas.append("'exames' ausente ou vazio")
+        exames = []
+
+    codigos = set()
+    donos_colunas = {}
+    for posicao, exame in enumerate(exames, start=1):
+        if not isinstance(exame, dict):
+            problemas.append(f"exame #{posicao}: deve ser um objeto")
+            continue
+        rotulo = f"exame #{posicao} ({exame.get('codigo_tasy', '?')})"
+        faltando = [c for c in ('codigo_tasy', 'nome', 'colunas_lab', 'categoria') if c not in exame]
+        if faltando:
+            problemas.append(f"{rotulo}: campos ausentes: {', '.join(faltando)}")
+            continue
+        codigo = str(exame['codigo_tasy'])
+        if codigo in codigos:
+            problemas.append(f"{rotulo}: codigo_tasy repetido")
+        codigos.add(codigo)
+        if exame['categoria'] not in CATEGORIAS:
+            problemas.append(f"{rotulo}: categoria '{exame['categoria']}' inválida "
+                             f"(esperado {' ou '.join(CATEGORIAS)})")
+        limites = []
+        for chave in ('faixa_min', 'faixa_max'):
+            limite = exame.get(chave)
+            if limite is None:
+                continue
+            if not isinstance(limite, (int, float)) or isinstance(limite, bool) or limite != limite:
+                problemas.append(f"{rotulo}: '{chave}' deve ser um número ({limite!r})")
+            else:
+                limites.append(limite)
+        if len(limites) == 2 and limites[0] > limites[1]:
+            problemas.append(f"{rotulo}: 'faixa_min' maior que 'faixa_max'")
+        unidade = exame.get('unidade')
+        if unidade is not None and not (isinstance(unidade, str) and unidade.strip()):
+            problemas.append(f"{rotulo}: 'unidade' deve ser um texto não vazio")
+        colunas = exame['colunas_lab']
+        if not isinstance(colunas, list) or not colunas or not all(isinstance(c, str) and c.strip() for c in colunas):
+            problemas.append(f"{rotulo}: 'colunas_lab' deve ser uma lista de nomes não vazia")
+            continue
+        for coluna in colunas:
+            dono = donos_colunas.setdefault(chave_coluna(coluna), codigo)
+            if dono != codigo:
+                problemas.append(f"{rotulo}: coluna '{coluna}' já pertence ao exame {dono}")
+
+    ordem = config.get('ordem_colunas_tasy')
+    if ordem is not None and (not isinstance(ordem, list) or not all(isinstance(c, str) for c in ordem)):
+        problemas.append("'ordem_colunas_tasy' deve ser uma lista de nomes de coluna")
+
+    formatos = config.get('formatos_data')
+    if formatos is not None and (not isinstance(formatos, list) or not formatos
+                                 or not all(isinstance(f, str) and f for f in formatos)):
+        problemas.append("'formatos_data' deve ser uma lista de formatos de data (ex.: \"%d/%m/%Y %H:%M\")")
+
+    regra = config.get('regra_coletas_repetidas')
+    if regra is not None and regra not in REGRAS_COLETAS_REPETIDAS:
+        problemas.append(f"'regra_coletas_repetidas' inválida ({regra!r}; esperado "
+                         f"{' ou '.join(REGRAS_COLETAS_REPETIDAS)})")
+
+    if problemas:
+        raise ErroConfiguracao("config_exames.json inválido:\n" + "\n".join(f"- {p}" for p in problemas))
+
+
+def _assinatura(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def construir_configuracao(config):
+    """
+    Valida o dicionário do config_exames.json e monta os mapas de exames.
+
+    Args:
+        config: conteúdo do config_exames.json
+
+    Returns:
+        ConfiguracaoTasy
+
+    Raises:
+        ErroConfiguracao: se a estrutura do config for inválida
+    """
+    validar_configuracao(config)
+
+    mapa_completo = {}
+    mapa_por_codigo = {}
+
+    for exame in config['exames']:
+        codigo_completo = f"NR_EXAME_{exame['codigo_tasy']}"
+
+        # Mapa completo para exibição na UI
+        for coluna in exame['colunas_lab']:
+            mapa_completo[coluna] = {
+                'codigo': codigo_completo,
+                'nome': exame['nome']
+            }
+
+        # Mapa por código com todas as variações de coluna
+        mapa_por_codigo[codigo_completo] = {
+            'nome': exame['nome'],
+            'colunas_lab': exame['colunas_lab'],
+            'categoria': exame['categoria'],
+            'unidade': exame.get('unidade'),
+            'faixa_min': exame.get('faixa_min'),
+            'faixa_max': exame.get('faixa_max'),
+        }
+
+    return ConfiguracaoTasy(
+        config=config,
+        estabelecimentos=config['estabelecimentos'],
+        mapa_exames_completo=mapa_completo,
+        mapa_exames_por_codigo=mapa_por_codigo,
+        ordem_colunas_tasy=config.get('ordem_colunas_tasy', list(ORDEM_COLUNAS_PADRAO)),
+        formatos_data=config.get('formatos_data', list(FORMATOS_DATA)),
+        regra_coletas_repetidas=config.get('regra_coletas_repetidas', REGRA_COLETAS_REPETIDAS_PADRAO),
+        assinatura=_assinatura(config),
+        mapeamento=MapeamentoExames(mapa_por_codigo),
+    )
+
+
+# caminho -> ((mtime_ns, tamanho), ConfiguracaoTasy)
+_CONFIGURACOES = {}
+_LOCK_CONFIGURACOES = threading.Lock()
+
+
+def obter_configuracao(caminho=None):
+    """
+    Retorna a configuração compilada do arquivo.
+
+    A cada chamada só o stat do arquivo é consultado; se a data de
+    modificação ou o tamanho mudaram, o JSON é relido e, se o conteúdo
+    (hash) também mudou, validado e recompilado.
+    """
+    caminho = Path(caminho).resolve() if caminho else CAMINHO_CONFIG_PADRAO
+    try:
+        estado = caminho.stat()
+    except FileNotFoundError:
+        raise ErroConfiguracao(f"Arquivo {caminho.name} não encontrado!") from None
+    marca = (estado.st_mtime_ns, estado.st_size)
+
+    with _LOCK_CONFIGURACOES:
+        guardada = _CONFIGURACOES.get(caminho)
+        if guardada is not None and guardada[0] == marca:
+            return guardada[1]
+
+        config = carregar_configuracoes(caminho)
+        if guardada is not None and guardada[1].assinatura == _assinatura(config):
+            configuracao = guardada[1]  # arquivo regravado sem mudança de conteúdo
+        else:
+            configuracao = construir_configuracao(config)
+        _CONFIGURACOES[caminho] = (marca, configuracao)
+        return configuracao
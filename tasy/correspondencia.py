@@ -0,0 +1,227 @@
+"""
+Correspondência aproximada de nomes (segunda passada).
+
+Usada apenas para os nomes que não foram encontrados exatamente no
+IndicePacientes: erros de digitação, abreviações ("J. da Silva") e
+sobrenomes trocados.
+
+Para não comparar todos contra todos, os nomes do TASY são agrupados em
+blocos (primeiro nome, último sobrenome, iniciais e chave fonética) e cada
+nome do laboratório só é comparado com os candidatos dos seus blocos.
+"""
+import math
+import re
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+try:
+    from rapidfuzz import fuzz as _fuzz
+except ImportError:  # rapidfuzz é opcional; difflib dá o mesmo resultado, mais devagar
+    _fuzz = None
+
+from .cache import CacheLRU
+
+# Candidatos a partir de SUGESTAO_MINIMA aparecem no relatório de
+# inconsistências. Por padrão nenhum é aplicado: nomes de pacientes
+# diferentes passam fácil de 0.95 ("jose carlos silva" x "josue carlos
+# silva"), e o atendimento errado levaria o exame a outro paciente.
+# Preencher o atendimento é opcional (--aplicar-aproximados), a partir de
+# LIMIAR_APLICACAO ou do limiar informado.
+SUGESTAO_MINIMA = 0.75
+LIMIAR_APLICACAO = 0.92
+# Limiar que nenhuma confiança alcança: só sugestões
+SOMENTE_SUGESTOES = math.inf
+LIMIAR_PADRAO = SOMENTE_SUGESTOES
+
+# Blocos maiores que isso (ex.: "maria", "silva") não ajudam a separar
+# candidatos e deixariam a busca quadrática; são ignorados.
+TAMANHO_MAXIMO_BLOCO = 100
+
+# Nomes com o resultado memorizado por índice (os menos usados são esquecidos)
+MEMO_MAXIMO = 50_000
+_SEM_MEMO = object()
+
+_FONETICA = [
+    (re.compile(r'[^a-z]'), ''),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'th'), 't'),
+    (re.compile(r'[cs]h'), 'x'),
+    (re.compile(r'lh'), 'l'),
+    (re.compile(r'nh'), 'n'),
+    (re.compile(r'qu|q'), 'k'),
+    (re.compile(r'c(?=[ei])'), 's'),
+    (re.compile(r'c'), 'k'),
+    (re.compile(r'g(?=[ei])'), 'j'),
+    (re.compile(r'[zç]'), 's'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'w'), 'v'),
+    (re.compile(r'h'), ''),
+    (re.compile(r'(.)\1+'), r'\1'),
+]
+
+
+def chave_fonetica(palavra):
+    """Chave fonética simplificada para português (primeira letra + consoantes)."""
+    for padrao, troca in _FONETICA:
+        palavra = padrao.sub(troca, palavra)
+    if not palavra:
+        return ''
+    return palavra[0] + re.sub(r'[aeiou]', '', palavra[1:])
+
+
+def _tokens(nome):
+    return nome.replace('.', ' ').split()
+
+
+_PARTICULAS = {'da', 'de', 'do', 'das', 'dos', 'e'}
+
+
+def chaves_bloco(nome):
+    """
+    Chaves de bloco de um nome normalizado.
+
+    Primeiro nome, último sobrenome, iniciais em ordem alfabética, menor
+    token e chave fonética; as duas do meio cobrem sobrenomes trocados.
+    """
+    tokens = [t for t in _tokens(nome) if t not in _PARTICULAS]
+    if not tokens:
+        return []
+    chaves = [
+        'p:' + tokens[0],
+        'u:' + tokens[-1],
+        'i:' + ''.join(sorted(t[0] for t in tokens)),
+        's:' + min(tokens),
+    ]
+    if len(tokens) > 1:
+        chaves.append('f:' + chave_fonetica(tokens[0]) + '|' + chave_fonetica(tokens[-1]))
+    return chaves
+
+
+def _ordenado(nome):
+    return ' '.join(sorted(_tokens(nome)))
+
+
+def _razao(a, b, minimo=0.0):
+    """
+    Razão de similaridade entre duas strings; devolve 0 assim que um limite
+    superior barato (tamanho, multiconjunto de letras) fica abaixo de `minimo`.
+    """
+    if _fuzz is not None:
+        return _fuzz.ratio(a, b, score_cutoff=minimo * 100) / 100
+    if 2 * min(len(a), len(b)) / ((len(a) + len(b)) or 1) < minimo:
+        return 0.0
+    comparador = SequenceMatcher(None, a, b, autojunk=False)
+    if comparador.quick_ratio() < minimo:
+        return 0.0
+    return comparador.ratio()
+
+
+def _mesmas_iniciais(tokens_a, tokens_b):
+    """'j da silva' x 'joao da silva': tokens iguais ou abreviados pela inicial."""
+    if len(tokens_a) != len(tokens_b):
+        return False
+    exatos = 0
+    for a, b in zip(tokens_a, tokens_b):
+        if a == b:
+            exatos += 1
+        elif not ((len(a) == 1 and b.startswith(a)) or (len(b) == 1 and a.startswith(b))):
+            return False
+    return exatos > 0
+
+
+def similaridade(nome_a, nome_b, minimo=0.0):
+    """
+    Similaridade entre 0 e 1 de dois nomes normalizados.
+
+    Compara os tokens em ordem alfabética (sobrenomes trocados não pesam) e
+    aceita abreviação pela inicial com confiança fixa de 0.9. Resultados
+    abaixo de `minimo` podem ser devolvidos como 0.
+    """
+    pontuacao = _razao(_ordenado(nome_a), _ordenado(nome_b), minimo)
+    if pontuacao < 0.9 and _mesmas_iniciais(_tokens(nome_a), _tokens(nome_b)):
+        pontuacao = 0.9
+    return pontuacao
+
+
+class CorrespondenciaAproximada:
+    """
+    Busca aproximada sobre os nomes de um IndicePacientes.
+
+    Os blocos são montados uma vez; os resultados por nome ficam
+    memorizados, então basicos e resultados2 não repetem a busca.
+    """
+
+    def __init__(self, atendimentos):
+        self.atendimentos = atendimentos
+        self._blocos = defaultdict(list)
+        self._ordenados = {}
+        for nome in atendimentos:
+            self._ordenados[nome] = _ordenado(nome)
+            for chave in chaves_bloco(nome):
+                self._blocos[chave].append(nome)
+        self._memo = CacheLRU(maxsize=MEMO_MAXIMO)
+
+    def _candidatos(self, nome):
+        candidatos = set()
+        for chave in chaves_bloco(nome):
+            bloco = self._blocos.get(chave, ())
+            if len(bloco) <= TAMANHO_MAXIMO_BLOCO:
+                candidatos.update(bloco)
+        return candidatos
+
+    def melhor_candidato(self, nome):
+        """
+        Se dois pacientes diferentes empatam na melhor pontuação (ex.: "j silva"
+        para "joao silva" e "jose silva"), a confiança cai para SUGESTAO_MINIMA
+        para que o candidato nunca seja aplicado automaticamente.
+
+        Candidatos abaixo de SUGESTAO_MINIMA não são considerados.
+
+        Returns:
+            tuple: (nome_tasy, NR_ATENDIMENTO, confianca) ou None
+        """
+        memorizado = self._memo.get(nome, _SEM_MEMO)
+        if memorizado is not _SEM_MEMO:
+            return memorizado
+
+        melhor = None
+        empate = False
+        if nome:
+            ordenado = _ordenado(nome)
+            tokens = _tokens(nome)
+            for candidato in sorted(self._candidatos(nome)):
+                minimo = melhor[2] if melhor is not None else SUGESTAO_MINIMA
+                pontuacao = _razao(ordenado, self._ordenados[candidato], minimo)
+                if pontuacao < 0.9 and _mesmas_iniciais(tokens, _tokens(candidato)):
+                    pontuacao = 0.9
+                if pontuacao < SUGESTAO_MINIMA:
+                    continue
+                if melhor is None or pontuacao > melhor[2]:
+                    melhor = (candidato, self.atendimentos[candidato], pontuacao)
+                    empate = False
+                elif pontuacao == melhor[2] and self.atendimentos[candidato] != melhor[1]:
+                    empate = True
+
+        if melhor is not None and empate:
+            melhor = (melhor[0], melhor[1], min(melhor[2], SUGESTAO_MINIMA))
+
+        self._memo[nome] = melhor
+        return melhor
+
+    def corresponder(self, nomes, limiar=SUGESTAO_MINIMA):
+        """
+        Melhor candidato de cada nome com confiança >= limiar.
+
+        Args:
+            nomes: nomes normalizados não encontrados (sem repetição)
+            limiar: confiança mínima entre 0 e 1
+
+        Returns:
+            dict: {nome: (nome_tasy, NR_ATENDIMENTO, confianca)}
+        """
+        encontrados = {}
+        for nome in nomes:
+            melhor = self.melhor_candidato(nome)
+            if melhor is not None and melhor[2] >= limiar:
+                encontrados[nome] = melhor
+        return encontrados
@@ -0,0 +1,19 @@
+"""
+Exceções do pacote tasy.
+"""
+
+
+class ErroConfiguracao(Exception):
+    """Erro ao localizar ou interpretar o arquivo de configuração."""
+
+
+class ErroProcessamento(Exception):
+    """Erro nos dados de entrada que impede a geração da planilha."""
+
+
+class ProcessamentoCancelado(ErroProcessamento):
+    """Processamento interrompido a pedido do usuário."""
+
+
+class FilaCheia(Exception):
+    """Todos os trabalhadores ocupados e a fila de espera cheia; tente mais tarde."""
@@ -0,0 +1,285 @@
+"""
+Geração dos arquivos de saída: planilha de importação TASY e relatório
+de inconsistências.
+
+O .xlsx é escrito em fluxo, linha a linha, com xlsxwriter em modo
+constant_memory (ou openpyxl write-only se o xlsxwriter não estiver
+instalado), sem montar a pasta de trabalho inteira em memória como o
+`DataFrame.to_excel`. A mesma planilha também pode sair em CSV ou Parquet,
+e EscritorPlanilha grava qualquer um dos três em partes, conforme os
+blocos ficam prontos.
+"""
+import importlib.util
+import io
+from pathlib import Path
+
+import pandas as pd
+
+from .erros import ErroProcessamento
+from .transformacoes import ampliar_float32
+
+MIME_XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+XLSXWRITER_DISPONIVEL = importlib.util.find_spec('xlsxwriter') is not None
+PARQUET_DISPONIVEL = (importlib.util.find_spec('pyarrow') is not None
+                      or importlib.util.find_spec('fastparquet') is not None)
+
+# formato -> (extensão, mime)
+FORMATOS_SAIDA = {
+    'xlsx': ('.xlsx', MIME_XLSX),
+    'csv': ('.csv', 'text/csv'),
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+}
+
+# Linhas convertidas para objetos Python por vez ao escrever o .xlsx
+TAMANHO_BLOCO_ESCRITA = 10_000
+
+# Linhas por aba no Excel (incluindo o cabeçalho)
+LIMITE_LINHAS_XLSX = 1_048_576
+
+
+def formatos_disponiveis():
+    """Formatos de saída que podem ser gerados neste ambiente."""
+    return [f for f in FORMATOS_SAIDA if f != 'parquet' or PARQUET_DISPONIVEL]
+
+
+def _linhas(df):
+    """
+    Linhas do DataFrame como listas de valores Python (NaN -> None), em blocos.
+    Colunas float32 (valores de exame) saem com o decimal curto original.
+    """
+    colunas_float32 = [i for i, tipo in enumerate(df.dtypes) if tipo == 'float32']
+    for inicio in range(0, len(df), TAMANHO_BLOCO_ESCRITA):
+        bloco = df.iloc[inicio:inicio + TAMANHO_BLOCO_ESCRITA]
+        if colunas_float32:
+            bloco = bloco.copy(deep=False)
+            for i in colunas_float32:
+                bloco.isetitem(i, ampliar_float32(bloco.iloc[:, i]))
+        bloco = bloco.astype(object)
+        yield from bloco.where(bloco.notna(), None).itertuples(index=False, name=None)
+
+
+class _PastaXlsx:
+    """Pasta .xlsx escrita em fluxo, uma aba de cada vez, linha a linha."""
+
+    def __init__(self, destino):
+        self.destino = destino
+        if XLSXWRITER_DISPONIVEL:
+            import xlsxwriter
+            self._workbook = xlsxwriter.Workbook(destino, {'constant_memory': True})
+        else:
+            from openpyxl import Workbook
+            self._workbook = Workbook(write_only=True)
+        self._aba = None
+        self.linha = 0
+
+    def nova_aba(self, nome, colunas):
+        if XLSXWRITER_DISPONIVEL:
+            self._aba = self._workbook.add_worksheet(nome)
+        else:
+            self._aba = self._workbook.create_sheet(nome)
+        self.linha = 0
+        self._escrever([str(c) for c in colunas])
+
+    def _escrever(self, valores):
+        if XLSXWRITER_DISPONIVEL:
+            self._aba.write_row(self.linha, 0, valores)
+        else:
+            self._aba.append(valores)
+        self.linha += 1
+
+    def acrescentar(self, df):
+        if self.linha + len(df) > LIMITE_LINHAS_XLSX:
+            raise ErroProcessamento(
+                f"A planilha passou de {LIMITE_LINHAS_XLSX:,} linhas, o limite do Excel; use CSV ou Parquet"
+            )
+        for valores in _linhas(df):
+            self._escrever(valores)
+
+    def fechar(self):
+        if XLSXWRITER_DISPONIVEL:
+            self._workbook.close()
+        else:
+            self._workbook.save(self.destino)
+
+
+def escrever_xlsx(abas, destino=None):
+    """
+    Escreve uma ou mais abas em .xlsx.
+
+    Args:
+        abas: {nome_da_aba: DataFrame} (na ordem das abas)
+        destino: caminho ou objeto tipo arquivo (None = BytesIO novo)
+
+    Returns:
+        o destino (BytesIO posicionado no início, se for o caso)
+    """
+    destino = io.BytesIO() if destino is None else destino
+    pasta = _PastaXlsx(destino)
+    for nome_aba, df in abas.items():
+        pasta.nova_aba(nome_aba, df.columns)
+        pasta.acrescentar(df)
+    pasta.fechar()
+    if hasattr(destino, 'seek'):
+        destino.seek(0)
+    return destino
+
+
+class EscritorPlanilha:
+    """
+    Planilha de importação gravada em partes, para o processamento em fluxo:
+    cada `acrescentar(df)` grava as linhas no destino e elas podem ser
+    descartadas em seguida.
+
+        with EscritorPlanilha('saida.xlsx', 'xlsx', colunas) as escritor:
+            for bloco in blocos:
+                escritor.acrescentar(bloco)
+
+    Args:
+        destino: caminho ou objeto tipo arquivo binário
+        formato: 'xlsx', 'csv' ou 'parquet' (parquet requer pyarrow)
+        colunas: colunas da planilha (cabeçalho mesmo se nenhuma linha for gravada)
+    """
+
+    def __init__(self, destino, formato, colunas):
+        if formato not in FORMATOS_SAIDA:
+            raise ValueError(f"Formato de saída inválido: {formato}")
+        if formato == 'parquet' and importlib.util.find_spec('pyarrow') is None:
+            raise ErroProcessamento("Exportação Parquet em fluxo requer o pacote pyarrow")
+        self.destino = destino
+        self.formato = formato
+        self.colunas = list(colunas)
+        self.linhas = 0
+        self._parquet = None
+        if formato == 'xlsx':
+            self._pasta = _PastaXlsx(destino)
+            self._pasta.nova_aba('Sheet1', self.colunas)
+        elif formato == 'csv':
+            self._arquivo = open(destino, 'wb') if isinstance(destino, (str, Path)) else destino
+            pd.DataFrame(columns=self.colunas).to_csv(self._arquivo, index=False, encoding='utf-8')
+
+    def acrescentar(self, df):
+        df = df[self.colunas]
+        if self.formato == 'xlsx':
+            self._pasta.acrescentar(df)
+        elif self.formato == 'csv':
+            df.to_csv(self._arquivo, index=False, header=False, encoding='utf-8')
+        else:
+            self._acrescentar_parquet(df)
+        self.linhas += len(df)
+
+    def _acrescentar_parquet(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Categorias mudam de um bloco para outro; no arquivo vão como texto/número
+        df = df.astype({c: df[c].cat.categories.dtype for c in df.columns
+                        if isinstance(df[c].dtype, pd.CategoricalDtype)})
+        if self._parquet is None:
+            tabela = pa.Table.from_pandas(df, preserve_index=False)
+            self._parquet = pq.ParquetWriter(self.destino, tabela.schema)
+        else:
+            tabela = pa.Table.from_pandas(df, schema=self._parquet.schema, preserve_index=False)
+        self._parquet.write_table(tabela)
+
+    def fechar(self):
+        if self.formato == 'xlsx':
+            self._pasta.fechar()
+        elif self.formato == 'csv':
+            if self._arquivo is not self.destino:
+                self._arquivo.close()
+        else:
+            if self._parquet is None:
+                self._acrescentar_parquet(pd.DataFrame(columns=self.colunas))
+            self._parquet.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.fechar()
+
+
+def gerar_planilha_excel(planilha_final):
+    """Gera o .xlsx da planilha final em memória"""
+    return escrever_xlsx({'Sheet1': planilha_final})
+
+
+def gerar_planilha_csv(planilha_final):
+    """Gera o .csv (UTF-8, separador vírgula) da planilha final em memória"""
+    output = io.BytesIO()
+    planilha_final.to_csv(output, index=False, encoding='utf-8')
+    output.seek(0)
+    return output
+
+
+def gerar_planilha_parquet(planilha_final):
+    """Gera o .parquet da planilha final em memória (requer pyarrow ou fastparquet)"""
+    if not PARQUET_DISPONIVEL:
+        raise ErroProcessamento("Exportação Parquet requer o pacote pyarrow")
+    output = io.BytesIO()
+    planilha_final.to_parquet(output, index=False)
+    output.seek(0)
+    return output
+
+
+def gerar_saida(planilha_final, formato='xlsx'):
+    """Gera a planilha final no formato pedido ('xlsx', 'csv' ou 'parquet')."""
+    geradores = {
+        'xlsx': gerar_planilha_excel,
+        'csv': gerar_planilha_csv,
+        'parquet': gerar_planilha_parquet,
+    }
+    if formato not in geradores:
+        raise ValueError(f"Formato de saída inválido: {formato}")
+    return geradores[formato](planilha_final)
+
+
+def gerar_relatorio_inconsistencias(nomes_sem_atendimento, correspondencias_aproximadas=None,
+                                    nomes_duplicados=None, valores_fora_faixa=None):
+    """
+    Gera o .xlsx com os pacientes não encontrados no TASY.
+
+    `correspondencias_aproximadas`, `nomes_duplicados` e `valores_fora_faixa`
+    (DataFrames de ResultadoProcessamento), se houver, vão em abas próprias
+    para conferência.
+    """
+    abas = {'Sheet1': pd.DataFrame({'Paciente': list(nomes_sem_atendimento)})}
+    if correspondencias_aproximadas is not None and len(correspondencias_aproximadas):
+        abas['Nomes aproximados'] = correspondencias_aproximadas
+    if nomes_duplicados is not None and len(nomes_duplicados):
+        abas['Nomes duplicados no TASY'] = nomes_duplicados
+    if valores_fora_faixa is not None and len(valores_fora_faixa):
+        abas['Valores fora da faixa'] = valores_fora_faixa
+    return escrever_xlsx(abas)
+
+
+def gerar_relatorio_inconsistencias_lote(resultados):
+    """
+    Relatório de inconsistências de vários estabelecimentos num só .xlsx,
+    com as mesmas abas de `gerar_relatorio_inconsistencias` e a coluna
+    Estabelecimento na frente.
+
+    Args:
+        resultados: {estabelecimento: ResultadoProcessamento}
+    """
+    def juntar(tabelas):
+        tabelas = [t.assign(Estabelecimento=nome)[['Estabelecimento', *t.columns]]
+                   for nome, t in tabelas if len(t)]
+        return pd.concat(tabelas, ignore_index=True) if tabelas else pd.DataFrame()
+
+    nomes = juntar(
+        (nome, pd.DataFrame({'Paciente': sorted(map(str, r.nomes_sem_atendimento))}))
+        for nome, r in resultados.items()
+    )
+    abas = {'Sheet1': nomes if len(nomes) else pd.DataFrame(columns=['Estabelecimento', 'Paciente'])}
+    aproximados = juntar((nome, r.correspondencias_aproximadas) for nome, r in resultados.items())
+    if len(aproximados):
+        abas['Nomes aproximados'] = aproximados
+    duplicados = juntar((nome, r.nomes_duplicados) for nome, r in resultados.items())
+    if len(duplicados):
+        abas['Nomes duplicados no TASY'] = duplicados
+    fora_faixa = juntar((nome, r.valores_fora_faixa) for nome, r in resultados.items())
+    if len(fora_faixa):
+        abas['Valores fora da faixa'] = fora_faixa
+    return escrever_xlsx(abas)
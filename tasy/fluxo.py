@@ -0,0 +1,275 @@
+"""
+Processamento em fluxo para exportações grandes demais para a memória
+(cargas de vários anos).
+
+As planilhas do laboratório são lidas em blocos de linhas; cada bloco é
+mapeado, convertido e cruzado com o IndicePacientes como em `processar`
+e gravado em disco, dividido em partições pelo hash do nome normalizado.
+Linhas com a mesma chave (nome_normalizado, dthr_os) caem sempre na mesma
+partição, então o cruzamento basicos x resultados2 é feito partição por
+partição, e cada pedaço da planilha final é acrescentado ao arquivo de
+saída assim que fica pronto. A memória usada depende do tamanho do bloco
+e da partição, não do tamanho da exportação.
+
+A planilha gerada tem as mesmas linhas de `processar`, agrupadas por
+partição em vez de ordenadas por nome. Os relatórios de linhas sem
+atendimento e de valores fora da faixa guardam só as primeiras
+LIMITE_LINHAS_RELATORIO linhas; as demais são apenas contadas
+(ResultadoProcessamento.linhas_omitidas).
+
+Só o .xlsx é lido em blocos: o .xls (formato binário antigo) não tem leitura
+parcial e é carregado inteiro antes de ser fatiado, então para ele a memória
+cresce com o tamanho da exportação. Converta para .xlsx as cargas grandes.
+"""
+import pickle
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+import pandas as pd
+
+from .configuracao import obter_configuracao
+from .correspondencia import LIMIAR_PADRAO
+from .exportacao import EscritorPlanilha
+from .instrumentacao import Instrumentacao
+from .leitura import ler_planilha_em_blocos
+from .memoria import medir_memoria
+from .motor import (
+    COLUNAS_IDENTIFICACAO,
+    ResultadoProcessamento,
+    _localizar_atendimentos,
+    _preparar_lab,
+    _sem_progresso,
+    colunas_necessarias,
+    montar_planilha,
+)
+from .pacientes import POLITICA_DUPLICADOS_PADRAO, obter_indice_pacientes
+from .transformacoes import COLUNA_DATA_LAB
+
+# Linhas lidas da planilha por vez
+TAMANHO_BLOCO = 50_000
+
+# Bytes de .xlsx por partição: o .xlsx é compactado, e ~4 MB de arquivo
+# rendem da ordem de 100 mil linhas de laboratório em memória
+BYTES_POR_PARTICAO = 4 * 2**20
+MAXIMO_PARTICOES = 1024
+
+# Linhas guardadas em cada relatório (sem atendimento, fora da faixa)
+LIMITE_LINHAS_RELATORIO = 100_000
+
+
+class _Particoes:
+    """Blocos de DataFrame gravados em disco, um arquivo por partição (pickles em sequência)."""
+
+    def __init__(self, pasta, prefixo, quantidade):
+        self.quantidade = quantidade
+        self._caminhos = [Path(pasta) / f"{prefixo}_{i}.pkl" for i in range(quantidade)]
+
+    def gravar(self, df):
+        """Distribui as linhas de `df` pelas partições (hash do nome normalizado)."""
+        particao = pd.util.hash_array(df['nome_normalizado'].to_numpy(dtype=object)) % self.quantidade
+        for numero, parte in df.groupby(particao, sort=False):
+            with open(self._caminhos[numero], 'ab') as f:
+                pickle.dump(parte, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def ler(self, numero):
+        """Linhas de uma partição (None se nenhuma linha caiu nela)."""
+        caminho = self._caminhos[numero]
+        if not caminho.exists():
+            return None
+        partes = []
+        with open(caminho, 'rb') as f:
+            while True:
+                try:
+                    partes.append(pickle.load(f))
+                except EOFError:
+                    break
+        return pd.concat(partes)
+
+
+class _Limitadas:
+    """Acumula DataFrames até `limite` linhas; as que passam disso só são contadas."""
+
+    def __init__(self, limite):
+        self.limite = limite
+        self.omitidas = 0
+        self._partes = []
+        self._linhas = 0
+
+    def acrescentar(self, df):
+        vagas = self.limite - self._linhas
+        if len(df) > vagas:
+            self.omitidas += len(df) - max(vagas, 0)
+            df = df.iloc[:max(vagas, 0)]
+        if len(df):
+            self._partes.append(df)
+            self._linhas += len(df)
+
+    def juntar(self):
+        return pd.concat(self._partes, ignore_index=True) if self._partes else pd.DataFrame()
+
+
+def _tamanho(arquivo):
+    if isinstance(arquivo, (str, Path)):
+        return Path(arquivo).stat().st_size
+    if hasattr(arquivo, 'getbuffer'):
+        return len(arquivo.getbuffer())
+    return len(arquivo.getvalue())
+
+
+def _quantidade_particoes(*arquivos):
+    tamanho = sum(_tamanho(arquivo) for arquivo in arquivos if arquivo is not None)
+    return max(1, min(MAXIMO_PARTICOES, tamanho // BYTES_POR_PARTICAO + 1))
+
+
+def processar_em_fluxo(arquivo_basicos, arquivo_resultados2, arquivo_pacientes,
+                       protocolo, cd_estabelecimento, destinos, configuracao=None, progresso=None,
+                       limiar_aproximado=LIMIAR_PADRAO, politica_duplicados=POLITICA_DUPLICADOS_PADRAO,
+                       tamanho_bloco=TAMANHO_BLOCO, particoes=None, instrumentacao=None):
+    """
+    Versão em fluxo de `processar_arquivos`: a planilha final vai direto
+    para os arquivos de `destinos` e nunca fica inteira em memória. Caminhos
+    são lidos do disco em blocos, sem carregar o arquivo (exceto .xls).
+
+    Args:
+        arquivo_basicos / arquivo_resultados2 / arquivo_pacientes: caminhos
+            ou arquivos enviados (resultados2 pode ser None)
+        protocolo / cd_estabelecimento: como em processar
+        destinos: {formato: caminho ou arquivo binário}, ex.: {'xlsx': 'saida.xlsx'}
+        tamanho_bloco: linhas lidas por vez
+        particoes: partições do cruzamento (None = pelo tamanho dos arquivos)
+        instrumentacao: Instrumentacao que recebe as etapas, somadas entre
+            blocos e partições (None = uma nova)
+
+    Returns:
+        ResultadoProcessamento com planilha_final vazia (só as colunas),
+        linhas_gravadas preenchido e relatórios limitados a
+        LIMITE_LINHAS_RELATORIO linhas (excedente em linhas_omitidas)
+    """
+    configuracao = configuracao or obter_configuracao()
+    progresso = progresso or _sem_progresso
+    instrumentacao = instrumentacao or Instrumentacao()
+    mapeamento = configuracao.mapeamento
+
+    particoes = particoes or _quantidade_particoes(arquivo_basicos, arquivo_resultados2)
+
+    with medir_memoria() as memoria, tempfile.TemporaryDirectory(prefix='tasy_') as pasta:
+        progresso(10, "📂 Carregando pacientes...")
+        with instrumentacao.etapa('leitura_pacientes') as etapa:
+            indice_pacientes, info_pacientes = obter_indice_pacientes(arquivo_pacientes, politica_duplicados)
+            etapa.linhas_saida = info_pacientes.linhas
+        colisoes = set(indice_pacientes.colisoes['nome_normalizado'])
+
+        valores_invalidos = Counter()
+        datas_invalidas = {}
+        aproximados = []
+        duplicados = []
+        fora_faixa = _Limitadas(LIMITE_LINHAS_RELATORIO)
+        sem_atendimento = {}
+        nomes_sem_atendimento = set()
+        mapas = {}
+        gravadas = {}
+
+        # (nome no resultado, categoria na configuração, arquivo, progresso)
+        planilhas = [('basicos', 'basico', arquivo_basicos, 30)]
+        if arquivo_resultados2 is not None:
+            planilhas.append(('resultados2', 'resultados2', arquivo_resultados2, 60))
+
+        for nome, categoria, arquivo, percentual in planilhas:
+            progresso(percentual, f"⚙️ Processando {nome} em blocos...")
+            gravadas[nome] = _Particoes(pasta, nome, particoes)
+            datas_invalidas[nome] = 0
+            sem_atendimento[nome] = _Limitadas(LIMITE_LINHAS_RELATORIO)
+            blocos = ler_planilha_em_blocos(arquivo, colunas_necessarias(configuracao, categoria), tamanho_bloco)
+            while True:
+                with instrumentacao.etapa(f'leitura_{nome}') as etapa:
+                    bloco = next(blocos, None)
+                    etapa.linhas_saida = len(bloco) if bloco is not None else 0
+                if bloco is None:
+                    break
+
+                with instrumentacao.etapa(f'preparar_{nome}', len(bloco)) as etapa:
+                    if nome not in mapas:
+                        mapas[nome] = mapeamento.resolver(bloco.columns, categoria=categoria)
+                    lab, invalidos, invalidas = _preparar_lab(bloco, mapas[nome], configuracao.formatos_data)
+                    valores_invalidos.update(invalidos)
+                    datas_invalidas[nome] += invalidas
+                    etapa.linhas_saida = len(lab)
+
+                with instrumentacao.etapa(f'atendimentos_{nome}', len(lab)) as etapa:
+                    lab['NR_ATENDIMENTO'], aproximados_bloco = _localizar_atendimentos(
+                        lab, 'nome_original', indice_pacientes, limiar_aproximado
+                    )
+                    aproximados.extend(aproximados_bloco)
+                    etapa.linhas_saida = int(lab['NR_ATENDIMENTO'].notna().sum())
+
+                sem = lab.loc[lab['NR_ATENDIMENTO'].isna(), COLUNAS_IDENTIFICACAO]
+                sem_atendimento[nome].acrescentar(sem)
+                nomes_sem_atendimento.update(sem['nome_original'].unique())
+                if colisoes:
+                    duplicados.append(lab.loc[lab['nome_normalizado'].isin(colisoes),
+                                              ['nome_normalizado', 'NR_ATENDIMENTO']])
+
+                with instrumentacao.etapa('particionamento', len(lab)) as etapa:
+                    if nome == 'resultados2':
+                        lab = lab[['nome_normalizado', COLUNA_DATA_LAB, *mapas[nome]]]
+                    gravadas[nome].gravar(lab)
+                    etapa.linhas_saida = len(lab)
+
+        # Só as linhas de nomes com colisão entram no resumo, então basta guardá-las
+        duplicados = (pd.concat(duplicados, ignore_index=True) if duplicados
+                      else pd.DataFrame(columns=['nome_normalizado', 'NR_ATENDIMENTO']))
+        nomes_duplicados = indice_pacientes.resumo_duplicados(duplicados['nome_normalizado'],
+                                                              duplicados['NR_ATENDIMENTO'])
+        correspondencias_aproximadas = (
+            pd.DataFrame(aproximados).drop_duplicates('nome_normalizado') if aproximados else pd.DataFrame()
+        )
+
+        progresso(75, "🔄 Mesclando e gravando por partição...")
+        colunas = configuracao.ordem_colunas_tasy
+        escritores = [EscritorPlanilha(destino, formato, colunas) for formato, destino in destinos.items()]
+        try:
+            for numero in range(particoes):
+                with instrumentacao.etapa('mesclagem') as etapa:
+                    basicos = gravadas['basicos'].ler(numero)
+                    if basicos is None:
+                        continue  # linhas só do resultados2 não têm atendimento
+                    # Partição sem resultados2: os exames dele ficam vazios, como em combinar_coletas
+                    resultados2 = gravadas['resultados2'].ler(numero) if 'resultados2' in gravadas else None
+                    etapa.linhas_entrada = len(basicos) + (len(resultados2) if resultados2 is not None else 0)
+                    planilha = montar_planilha(basicos, resultados2, protocolo, cd_estabelecimento, configuracao)
+                    etapa.linhas_saida = len(planilha)
+                with instrumentacao.etapa('validacao', len(planilha)) as etapa:
+                    fora = configuracao.faixas.conferir(planilha)
+                    fora_faixa.acrescentar(fora)
+                    etapa.linhas_saida = len(fora)
+                with instrumentacao.etapa('exportacao', len(planilha)) as etapa:
+                    for escritor in escritores:
+                        escritor.acrescentar(planilha)
+                    etapa.linhas_saida = len(planilha)
+        finally:
+            for escritor in escritores:
+                escritor.fechar()
+
+    progresso(90, "💾 Arquivos gravados")
+
+    sem_r2 = sem_atendimento.get('resultados2', _Limitadas(0))
+    return ResultadoProcessamento(
+        planilha_final=pd.DataFrame(columns=colunas),
+        sem_atendimento_basicos=sem_atendimento['basicos'].juntar(),
+        sem_atendimento_r2=sem_r2.juntar(),
+        nomes_sem_atendimento=nomes_sem_atendimento,
+        valores_invalidos=dict(valores_invalidos),
+        datas_invalidas=datas_invalidas,
+        correspondencias_aproximadas=correspondencias_aproximadas.drop(columns='nome_normalizado', errors='ignore'),
+        nomes_duplicados=nomes_duplicados,
+        valores_fora_faixa=fora_faixa.juntar(),
+        memoria=memoria,
+        linhas_gravadas=escritores[0].linhas if escritores else 0,
+        linhas_omitidas={
+            'sem_atendimento_basicos': sem_atendimento['basicos'].omitidas,
+            'sem_atendimento_r2': sem_r2.omitidas,
+            'valores_fora_faixa': fora_faixa.omitidas,
+        },
+        instrumentacao=instrumentacao,
+    )
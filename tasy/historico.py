@@ -0,0 +1,215 @@
+"""
+Histórico dos resultados já enviados ao TASY (modo delta).
+
+O laboratório manda exportações cumulativas: cada mês traz de novo os
+resultados dos meses anteriores. O histórico guarda, em SQLite, cada
+valor de exame já emitido (estabelecimento, NR_ATENDIMENTO, DT_RESULTADO,
+código do exame) com uma impressão digital do valor; `filtrar_novos`
+devolve só as células novas ou com valor alterado, e as linhas sem nada
+novo saem da planilha.
+
+As chaves e impressões são hashes de 64 bits calculados de uma vez para a
+planilha inteira (pandas.util.hash_array); a comparação com o que já foi
+enviado carrega as chaves do estabelecimento de uma vez e cruza tudo com
+um índice hash do pandas, sem consulta por célula.
+
+O envio só entra no histórico com `registrar(delta)`, depois que o arquivo
+foi gravado ou baixado: processar de novo sem registrar dá o mesmo delta,
+e processar de novo depois de registrar não repete nada.
+"""
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .transformacoes import ampliar_float32
+
+PREFIXO_EXAME = 'NR_EXAME_'
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS envios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    data TEXT NOT NULL,
+    cd_estabelecimento INTEGER NOT NULL,
+    linhas INTEGER NOT NULL,
+    celulas INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS exames_enviados (
+    cd_estabelecimento INTEGER NOT NULL,
+    chave INTEGER NOT NULL,
+    impressao INTEGER NOT NULL,
+    nr_atendimento INTEGER NOT NULL,
+    dt_resultado TEXT NOT NULL,
+    codigo TEXT NOT NULL,
+    valor REAL NOT NULL,
+    envio INTEGER NOT NULL REFERENCES envios(id),
+    PRIMARY KEY (cd_estabelecimento, chave)
+) WITHOUT ROWID;
+"""
+
+
+def _hash(valores):
+    """Hash estável (mesmo valor em qualquer execução) de um array, como int64 para o SQLite."""
+    return pd.util.hash_array(np.asarray(valores)).view('int64')
+
+
+@dataclass
+class DeltaEnvio:
+    """Saída de `HistoricoEnvios.filtrar_novos`."""
+    # Planilha só com as linhas que têm algo novo; exames já enviados com o
+    # mesmo valor ficam vazios
+    planilha: pd.DataFrame
+    cd_estabelecimento: int
+    celulas_novas: int = 0
+    celulas_alteradas: int = 0
+    celulas_repetidas: int = 0
+    # Células a enviar (chave, nr_atendimento, dt_resultado, codigo, valor,
+    # impressao), gravadas no histórico por `registrar`
+    celulas: pd.DataFrame = field(default_factory=pd.DataFrame, repr=False)
+    registrado: bool = False
+
+    @property
+    def celulas_enviadas(self):
+        return self.celulas_novas + self.celulas_alteradas
+
+
+class HistoricoEnvios:
+    """
+    Arquivo SQLite com os valores de exame já enviados.
+
+        with HistoricoEnvios('historico_envios.sqlite') as historico:
+            delta = historico.filtrar_novos(resultado.planilha_final, cd_estabelecimento)
+            ...grava delta.planilha...
+            historico.registrar(delta)
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        # Uma conexão compartilhada entre as threads do Streamlit, uma operação por vez
+        self._lock = threading.Lock()
+        self._conexao = sqlite3.connect(caminho, check_same_thread=False)
+        with self._lock, self._conexao:
+            # WAL + synchronous=NORMAL: gravação em lote rápida, ainda segura contra queda do processo
+            self._conexao.execute("PRAGMA journal_mode=WAL")
+            self._conexao.execute("PRAGMA synchronous=NORMAL")
+            self._conexao.executescript(_ESQUEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        self.close()
+
+    def close(self):
+        self._conexao.close()
+
+    def _celulas(self, planilha, cd_estabelecimento):
+        """Uma linha por valor de exame preenchido, com chave e impressão."""
+        exames = [c for c in planilha.columns if c.startswith(PREFIXO_EXAME)]
+        valores = np.column_stack([
+            ampliar_float32(planilha[c].to_numpy()) for c in exames
+        ]) if exames else np.empty((len(planilha), 0))
+        linhas, colunas = np.nonzero(~np.isnan(valores))
+
+        atendimentos = planilha['NR_ATENDIMENTO'].to_numpy(dtype='int64')
+        datas = planilha['DT_RESULTADO'].astype(str).to_numpy(dtype=object)
+        # Hash da linha (estabelecimento, atendimento, data) e do exame, combinados por célula
+        hash_linhas = pd.util.hash_pandas_object(
+            pd.DataFrame({'atendimento': atendimentos, 'data': datas}), index=False
+        ).to_numpy() ^ pd.util.hash_array(np.array([int(cd_estabelecimento)], dtype='int64'))[0]
+        hash_exames = pd.util.hash_array(np.array(exames, dtype=object))
+        codigos = np.array([c[len(PREFIXO_EXAME):] for c in exames], dtype=object)
+
+        celulas = pd.DataFrame({
+            'chave': _hash(hash_linhas[linhas] * np.uint64(31) + hash_exames[colunas]),
+            'nr_atendimento': atendimentos[linhas],
+            'dt_resultado': datas[linhas],
+            'codigo': codigos[colunas],
+            'valor': valores[linhas, colunas],
+        })
+        celulas['impressao'] = _hash(celulas['valor'].to_numpy())
+        return celulas, linhas, colunas, exames
+
+    def filtrar_novos(self, planilha, cd_estabelecimento):
+        """
+        Compara a planilha com o que já foi enviado.
+
+        Args:
+            planilha: planilha de importação (ResultadoProcessamento.planilha_final)
+            cd_estabelecimento: estabelecimento da planilha
+
+        Returns:
+            DeltaEnvio
+        """
+        celulas, linhas, colunas, exames = self._celulas(planilha, cd_estabelecimento)
+
+        chaves_enviadas, impressoes_enviadas = self._enviados(cd_estabelecimento)
+        posicoes = pd.Index(chaves_enviadas).get_indexer(celulas['chave'].to_numpy())
+        ja_enviada = posicoes >= 0
+        anterior = impressoes_enviadas[np.where(ja_enviada, posicoes, 0)] if len(chaves_enviadas) else posicoes
+        repetida = ja_enviada & (anterior == celulas['impressao'].to_numpy())
+        alterada = ja_enviada & ~repetida
+
+        # Planilha só com as células a enviar
+        enviar = np.zeros((len(planilha), len(exames)), dtype=bool)
+        enviar[linhas[~repetida], colunas[~repetida]] = True
+        mantidas = enviar.any(axis=1)
+        delta = planilha[mantidas].copy()
+        for i, coluna in enumerate(exames):
+            delta[coluna] = delta[coluna].where(enviar[mantidas, i])
+
+        return DeltaEnvio(
+            planilha=delta,
+            cd_estabelecimento=int(cd_estabelecimento),
+            celulas_novas=int((~ja_enviada).sum()),
+            celulas_alteradas=int(alterada.sum()),
+            celulas_repetidas=int(repetida.sum()),
+            celulas=celulas[~repetida].reset_index(drop=True),
+        )
+
+    def _enviados(self, cd_estabelecimento):
+        """(chaves, impressões) já enviadas do estabelecimento, como arrays int64."""
+        with self._lock:
+            cursor = self._conexao.execute(
+                "SELECT chave, impressao FROM exames_enviados WHERE cd_estabelecimento = ?",
+                (int(cd_estabelecimento),),
+            )
+            enviados = np.array(cursor.fetchall(), dtype='int64').reshape(-1, 2)
+        return enviados[:, 0], enviados[:, 1]
+
+    def registrar(self, delta):
+        """
+        Grava no histórico as células de `delta` (depois que o arquivo foi
+        gravado ou baixado). Registrar o mesmo delta de novo não tem efeito.
+
+        Returns:
+            id do envio (None se não havia nada a registrar)
+        """
+        if delta.registrado or delta.celulas.empty:
+            return None
+        # Em ordem de chave: inserção sequencial na árvore da chave primária
+        celulas = delta.celulas.drop_duplicates('chave', keep='last').sort_values('chave')
+        with self._lock, self._conexao:
+            cursor = self._conexao.execute(
+                "INSERT INTO envios (data, cd_estabelecimento, linhas, celulas) VALUES (?, ?, ?, ?)",
+                (datetime.now().isoformat(timespec='seconds'), delta.cd_estabelecimento,
+                 len(delta.planilha), len(celulas)),
+            )
+            envio = cursor.lastrowid
+            self._conexao.executemany(
+                "INSERT OR REPLACE INTO exames_enviados VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                zip([delta.cd_estabelecimento] * len(celulas), celulas['chave'].tolist(),
+                    celulas['impressao'].tolist(), celulas['nr_atendimento'].tolist(),
+                    celulas['dt_resultado'].tolist(), celulas['codigo'].tolist(),
+                    celulas['valor'].tolist(), [envio] * len(celulas)),
+            )
+        delta.registrado = True
+        return envio
+
+    def envios(self):
+        """Envios registrados, do mais recente ao mais antigo."""
+        with self._lock:
+            return pd.read_sql_query("SELECT * FROM envios ORDER BY id DESC", self._conexao)
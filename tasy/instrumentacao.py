@@ -0,0 +1,196 @@
+"""
+Medição das etapas do processamento.
+
+Cada etapa (leitura, preparação, busca de atendimentos, mesclagem,
+exportação) registra tempo, linhas de entrada e saída e pico de memória,
+para mostrar na interface e acompanhar a evolução entre execuções
+(JSON/JSONL). Uma etapa pode ainda ser perfilada com cProfile ou, se
+instalado, pyinstrument.
+
+    instrumentacao = Instrumentacao(perfilar='mesclagem')
+    resultado = processar_arquivos(..., instrumentacao=instrumentacao)
+    instrumentacao.registros()   # uma linha por etapa
+    instrumentacao.perfil        # relatório do perfilador (texto)
+"""
+import importlib.util
+import io
+import json
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import datetime
+
+from .erros import ErroProcessamento
+from .memoria import medir_memoria
+
+# Etapas registradas pelo pacote, na ordem em que acontecem
+ETAPAS = [
+    'leitura_pacientes',
+    'leitura_basicos',
+    'leitura_resultados2',
+    'indice_pacientes',
+    'preparar_basicos',
+    'atendimentos_basicos',
+    'preparar_resultados2',
+    'atendimentos_resultados2',
+    'particionamento',
+    'mesclagem',
+    'validacao',
+    'exportacao',
+]
+
+# Texto mostrado no progresso enquanto a etapa está em andamento
+DESCRICOES_ETAPAS = {
+    'leitura_pacientes': "📂 Lendo pacientes",
+    'leitura_basicos': "📂 Lendo exames básicos",
+    'leitura_resultados2': "📂 Lendo resultados 2",
+    'indice_pacientes': "🔍 Indexando pacientes",
+    'preparar_basicos': "⚙️ Processando exames básicos",
+    'atendimentos_basicos': "🔍 Buscando atendimentos dos exames básicos",
+    'preparar_resultados2': "⚙️ Processando resultados 2",
+    'atendimentos_resultados2': "🔍 Buscando atendimentos dos resultados 2",
+    'particionamento': "🗂️ Separando por paciente",
+    'mesclagem': "🔄 Mesclando dados",
+    'validacao': "🩺 Conferindo faixas dos exames",
+    'exportacao': "💾 Gerando arquivo",
+}
+
+PERFILADORES = ['cprofile', 'pyinstrument']
+PYINSTRUMENT_DISPONIVEL = importlib.util.find_spec('pyinstrument') is not None
+
+# Funções listadas no relatório do cProfile
+LINHAS_PERFIL = 40
+
+
+def perfiladores_disponiveis():
+    """Perfiladores que podem ser usados neste ambiente."""
+    return [p for p in PERFILADORES if p != 'pyinstrument' or PYINSTRUMENT_DISPONIVEL]
+
+
+@dataclass
+class MedicaoEtapa:
+    """Uma etapa; repetida (blocos, partições), os valores são somados."""
+    etapa: str
+    segundos: float = 0.0
+    linhas_entrada: int = None
+    linhas_saida: int = None
+    pico_memoria: int = None
+    chamadas: int = 0
+
+    def somar(self, outra):
+        self.segundos += outra.segundos
+        self.linhas_entrada = _somar(self.linhas_entrada, outra.linhas_entrada)
+        self.linhas_saida = _somar(self.linhas_saida, outra.linhas_saida)
+        self.pico_memoria = max(self.pico_memoria or 0, outra.pico_memoria or 0) or None
+        self.chamadas += outra.chamadas
+
+
+def _somar(a, b):
+    if a is None or b is None:
+        return b if a is None else a
+    return a + b
+
+
+class Instrumentacao:
+    """
+    Registro das etapas de um processamento.
+
+    Args:
+        perfilar: nome da etapa a perfilar (None = nenhuma)
+        perfilador: 'cprofile' ou 'pyinstrument'
+        observador: callable(medicao, concluida) chamado no início
+            (concluida=False) e no fim de cada etapa, por exemplo para
+            mostrar o progresso; uma exceção do observador interrompe o
+            processamento
+    """
+
+    def __init__(self, perfilar=None, perfilador='cprofile', observador=None):
+        if perfilador not in PERFILADORES:
+            raise ValueError(f"Perfilador inválido: {perfilador}")
+        if perfilar is not None and perfilador == 'pyinstrument' and not PYINSTRUMENT_DISPONIVEL:
+            raise ErroProcessamento("Perfil com pyinstrument requer o pacote pyinstrument")
+        self.perfilar = perfilar
+        self.perfilador = perfilador
+        self.observador = observador
+        self.etapas = {}
+        self.perfil = None
+        self.inicio = datetime.now()
+
+    @contextmanager
+    def etapa(self, nome, linhas_entrada=None):
+        """
+        Mede o bloco como a etapa `nome`; `linhas_saida` é preenchido pelo
+        chamador:
+
+            with instrumentacao.etapa('mesclagem', len(basicos)) as etapa:
+                planilha = ...
+                etapa.linhas_saida = len(planilha)
+        """
+        medicao = MedicaoEtapa(nome, linhas_entrada=linhas_entrada, chamadas=1)
+        if self.observador is not None:
+            self.observador(medicao, False)
+        parar_perfil = self._iniciar_perfil() if nome == self.perfilar else None
+        inicio = time.perf_counter()
+        try:
+            with medir_memoria() as memoria:
+                yield medicao
+        finally:
+            medicao.segundos = time.perf_counter() - inicio
+            medicao.pico_memoria = memoria.pico
+            if parar_perfil is not None:
+                self.perfil = parar_perfil()
+            if nome in self.etapas:
+                self.etapas[nome].somar(medicao)
+            else:
+                self.etapas[nome] = medicao
+        if self.observador is not None:
+            self.observador(medicao, True)
+
+    def _iniciar_perfil(self):
+        if self.perfilador == 'pyinstrument':
+            from pyinstrument import Profiler
+
+            perfilador = Profiler()
+            perfilador.start()
+
+            def parar():
+                perfilador.stop()
+                return perfilador.output_text(unicode=True)
+        else:
+            import cProfile
+            import pstats
+
+            perfilador = cProfile.Profile()
+            perfilador.enable()
+
+            def parar():
+                perfilador.disable()
+                texto = io.StringIO()
+                pstats.Stats(perfilador, stream=texto).sort_stats('cumulative').print_stats(LINHAS_PERFIL)
+                return texto.getvalue()
+        return parar
+
+    @property
+    def total_segundos(self):
+        return sum(medicao.segundos for medicao in self.etapas.values())
+
+    def registros(self):
+        """Lista de dicts, uma por etapa, na ordem em que foram executadas."""
+        return [asdict(medicao) for medicao in self.etapas.values()]
+
+    def como_dict(self, **contexto):
+        """Execução inteira (data, `contexto` e etapas) para JSON."""
+        return {
+            'inicio': self.inicio.isoformat(timespec='seconds'),
+            **contexto,
+            'total_segundos': round(self.total_segundos, 4),
+            'etapas': self.registros(),
+        }
+
+    def para_json(self, **contexto):
+        return json.dumps(self.como_dict(**contexto), ensure_ascii=False, indent=2)
+
+    def gravar_jsonl(self, destino, **contexto):
+        """Acrescenta a execução como uma linha em `destino` (histórico para acompanhar tendências)."""
+        with open(destino, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(self.como_dict(**contexto), ensure_ascii=False) + '\n')
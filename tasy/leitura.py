@@ -0,0 +1,253 @@
+"""
+Leitura das planilhas enviadas (laboratório e TASY).
+
+O formato é identificado uma única vez pelos primeiros bytes do arquivo
+(não pela extensão) e a planilha é lida uma única vez, com o motor mais
+rápido disponível:
+
+    .xlsx -> calamine (python-calamine) ou openpyxl em modo read-only
+    .xls  -> calamine ou xlrd
+
+Quando `colunas` é informado, só essas colunas são convertidas em
+DataFrame (usecols); o resto da planilha é descartado na leitura.
+
+`ler_planilha_em_blocos` lê um .xlsx aos poucos (openpyxl read-only),
+para o processamento em fluxo de exportações grandes demais para a memória.
+"""
+import hashlib
+import importlib.util
+import io
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+from .erros import ErroProcessamento
+from .transformacoes import normalizar_nome
+
+CALAMINE_DISPONIVEL = importlib.util.find_spec('python_calamine') is not None
+
+ASSINATURA_XLSX = b'PK\x03\x04'
+ASSINATURA_XLS = b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1'
+
+
+@dataclass
+class InfoLeitura:
+    """Estatísticas de leitura de uma planilha."""
+    arquivo: str
+    formato: str
+    motor: str
+    linhas: int
+    colunas: int
+    segundos: float
+    # Nomes da linha de cabeçalho, inclusive os que a projeção deixou de fora
+    cabecalho: list = field(default_factory=list)
+
+
+def detectar_formato(cabecalho):
+    """'xlsx' ou 'xls' a partir dos primeiros bytes do arquivo (None se desconhecido)."""
+    if cabecalho.startswith(ASSINATURA_XLSX):
+        return 'xlsx'
+    if cabecalho.startswith(ASSINATURA_XLS):
+        return 'xls'
+    return None
+
+
+def escolher_motor(formato):
+    if CALAMINE_DISPONIVEL:
+        return 'calamine'
+    return 'openpyxl' if formato == 'xlsx' else 'xlrd'
+
+
+def _nome_arquivo(arquivo):
+    if isinstance(arquivo, (str, Path)):
+        return Path(arquivo).name
+    return getattr(arquivo, 'name', 'planilha')
+
+
+def _projecao(colunas):
+    """
+    Filtro de usecols: mantém as colunas pedidas (sem diferenciar maiúsculas
+    nem acentos, como o MapeamentoExames) e sempre a primeira coluna da planilha, que detectar_colunas_nome usa
+    quando não reconhece o nome da coluna de paciente. Os nomes vistos ficam
+    em `usar.vistas` (o cabeçalho completo, para mensagens de erro).
+    """
+    necessarias = {normalizar_nome(c) for c in colunas}
+    vistas = []
+
+    def usar(coluna):
+        vistas.append(coluna)
+        return len(vistas) == 1 or normalizar_nome(coluna) in necessarias
+
+    usar.vistas = vistas
+    return usar
+
+
+def _abrir(arquivo):
+    """Objeto tipo arquivo posicionado no início (caminhos são abertos em memória)."""
+    if isinstance(arquivo, (str, Path)):
+        return io.BytesIO(Path(arquivo).read_bytes())
+    if isinstance(arquivo, bytes):
+        return io.BytesIO(arquivo)
+    arquivo.seek(0)
+    return arquivo
+
+
+def ler_bytes(arquivo):
+    """Conteúdo de um caminho ou arquivo enviado (UploadedFile/BytesIO)."""
+    if isinstance(arquivo, (str, Path)):
+        return Path(arquivo).read_bytes()
+    if isinstance(arquivo, bytes):
+        return arquivo
+    if hasattr(arquivo, 'getvalue'):
+        return arquivo.getvalue()
+    arquivo.seek(0)
+    conteudo = arquivo.read()
+    arquivo.seek(0)
+    return conteudo
+
+
+def hash_conteudo(conteudo):
+    """Identificador do conteúdo de um arquivo (chave dos caches)."""
+    return hashlib.sha1(conteudo).hexdigest()
+
+
+class ArquivoCarregado(io.BytesIO):
+    """Arquivo já carregado em memória, com nome e hash do conteúdo calculado uma vez."""
+
+    def __init__(self, conteudo, name):
+        super().__init__(conteudo)
+        self.name = name
+        self.hash = hash_conteudo(conteudo)
+
+
+def carregar_arquivo(arquivo):
+    """Carrega um caminho ou arquivo enviado como ArquivoCarregado."""
+    if isinstance(arquivo, ArquivoCarregado):
+        return arquivo
+    return ArquivoCarregado(ler_bytes(arquivo), _nome_arquivo(arquivo))
+
+
+def ler_planilha(arquivo, colunas=None):
+    """
+    Lê a primeira aba de uma planilha Excel.
+
+    Args:
+        arquivo: caminho, bytes ou objeto tipo arquivo (UploadedFile/BytesIO)
+        colunas: colunas de interesse (None = todas)
+
+    Returns:
+        tuple: (DataFrame, InfoLeitura)
+    """
+    inicio = time.perf_counter()
+    nome = _nome_arquivo(arquivo)
+    dados = _abrir(arquivo)
+
+    formato = detectar_formato(dados.read(8))
+    dados.seek(0)
+    if formato is None:
+        raise ErroProcessamento(f"{nome}: formato não reconhecido (esperado .xlsx ou .xls)")
+
+    motor = escolher_motor(formato)
+    usecols = _projecao(colunas) if colunas is not None else None
+    try:
+        df = pd.read_excel(dados, engine=motor, usecols=usecols)
+    except ImportError as e:
+        raise ErroProcessamento(f"{nome}: leitor de {formato} não instalado ({e})") from e
+
+    info = InfoLeitura(
+        arquivo=nome,
+        formato=formato,
+        motor=motor,
+        linhas=len(df),
+        colunas=len(df.columns),
+        segundos=time.perf_counter() - inicio,
+        cabecalho=list(usecols.vistas if usecols is not None else df.columns),
+    )
+    return df, info
+
+
+def _cabecalho(valores):
+    """Nomes de coluna como o pd.read_excel: 'Unnamed: i' para vazios, '.1', '.2' para repetidos."""
+    nomes = []
+    vistos = {}
+    for i, valor in enumerate(valores):
+        nome = f"Unnamed: {i}" if valor is None else valor
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f"{nome}.{vistos[nome]}"
+        else:
+            vistos[nome] = 0
+        nomes.append(nome)
+    return nomes
+
+
+def ler_planilha_em_blocos(arquivo, colunas=None, tamanho_bloco=50_000):
+    """
+    Lê a primeira aba em blocos de até `tamanho_bloco` linhas.
+
+    Arquivos .xlsx são percorridos linha a linha (openpyxl read-only), sem
+    carregar a planilha inteira; um caminho é lido direto do disco, sem
+    copiar o arquivo para a memória. Arquivos .xls não têm leitura parcial:
+    são lidos de uma vez e devolvidos em fatias, então não têm a memória
+    limitada.
+
+    Args:
+        arquivo: caminho, bytes ou objeto tipo arquivo
+        colunas: colunas de interesse (None = todas), como em ler_planilha
+        tamanho_bloco: linhas por DataFrame
+
+    Yields:
+        DataFrame de cada bloco (todos com as mesmas colunas)
+    """
+    nome = _nome_arquivo(arquivo)
+    dados = open(arquivo, 'rb') if isinstance(arquivo, (str, Path)) else _abrir(arquivo)
+    try:
+        yield from _blocos(dados, nome, colunas, tamanho_bloco)
+    finally:
+        if isinstance(arquivo, (str, Path)):
+            dados.close()
+
+
+def _blocos(dados, nome, colunas, tamanho_bloco):
+    formato = detectar_formato(dados.read(8))
+    dados.seek(0)
+    if formato is None:
+        raise ErroProcessamento(f"{nome}: formato não reconhecido (esperado .xlsx ou .xls)")
+
+    if formato == 'xls':
+        df, _ = ler_planilha(dados, colunas)
+        for inicio in range(0, max(len(df), 1), tamanho_bloco):
+            yield df.iloc[inicio:inicio + tamanho_bloco]
+        return
+
+    from openpyxl import load_workbook
+
+    pasta = load_workbook(dados, read_only=True, data_only=True)
+    try:
+        linhas = pasta.worksheets[0].iter_rows(values_only=True)
+        todas = _cabecalho(next(linhas, ()))
+        usar = _projecao(colunas) if colunas is not None else (lambda coluna: True)
+        indices = [i for i, coluna in enumerate(todas) if usar(coluna)]
+        cabecalho = [todas[i] for i in indices]
+
+        bloco = []
+        produziu = False
+        for valores in linhas:
+            if not any(v is not None for v in valores):
+                continue  # linhas vazias (read_excel também as descarta)
+            bloco.append(tuple(valores[i] if i < len(valores) else None for i in indices))
+            if len(bloco) == tamanho_bloco:
+                yield pd.DataFrame.from_records(bloco, columns=cabecalho)
+                produziu = True
+                bloco = []
+        if bloco or not produziu:
+            yield pd.DataFrame.from_records(bloco, columns=cabecalho)
+    finally:
+        pasta.close()
+
+
+def ler_excel(arquivo, colunas=None):
+    """Lê arquivo Excel enviado (caminho ou objeto tipo arquivo)"""
+    return ler_planilha(arquivo, colunas)[0]
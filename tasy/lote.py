@@ -0,0 +1,183 @@
+"""
+Processamento de vários estabelecimentos em paralelo.
+
+Ler o Excel e cruzar os dados é trabalho de CPU que segura o GIL, então
+threads não ajudam: cada estabelecimento é processado num processo
+separado (ProcessPoolExecutor). Os arquivos vão para os processos já
+carregados em memória (ArquivoCarregado), e os resultados voltam
+prontos para gravar.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from .configuracao import obter_configuracao
+from .correspondencia import LIMIAR_PADRAO
+from .instrumentacao import Instrumentacao
+from .leitura import carregar_arquivo
+from .motor import chave_resultado, processar_arquivos, reaproveitar_resultado
+from .pacientes import POLITICA_DUPLICADOS_PADRAO
+
+
+@dataclass
+class TarefaLote:
+    """Conjunto de planilhas de um estabelecimento (caminhos, bytes ou arquivos enviados)."""
+    estabelecimento: str
+    cd_estabelecimento: int
+    basicos: object
+    pacientes: object
+    resultados2: object = None
+
+
+@dataclass
+class ResultadoLote:
+    """Saída de `processar_lote`, na ordem das tarefas."""
+    # {estabelecimento: ResultadoProcessamento}
+    resultados: dict = field(default_factory=dict)
+    # {estabelecimento: mensagem de erro}
+    erros: dict = field(default_factory=dict)
+
+    def planilha_combinada(self):
+        """Planilhas de todos os estabelecimentos numa só, na ordem do lote."""
+        planilhas = [resultado.planilha_final for resultado in self.resultados.values()]
+        if not planilhas:
+            return pd.DataFrame()
+        categoricas = [c for c, tipo in planilhas[0].dtypes.items() if isinstance(tipo, pd.CategoricalDtype)]
+        combinada = pd.concat(planilhas, ignore_index=True)
+        return combinada.astype({c: 'category' for c in categoricas})
+
+    @property
+    def total_inconsistencias(self):
+        return sum(resultado.total_inconsistencias for resultado in self.resultados.values())
+
+    @property
+    def total_fora_faixa(self):
+        return sum(resultado.total_fora_faixa for resultado in self.resultados.values())
+
+
+def _processar_tarefa(tarefa, protocolo, configuracao, limiar_aproximado, politica_duplicados,
+                      perfilar, perfilador):
+    # Executado no processo filho: precisa ser uma função de módulo (pickle)
+    return processar_arquivos(
+        tarefa.basicos,
+        tarefa.resultados2,
+        tarefa.pacientes,
+        protocolo,
+        tarefa.cd_estabelecimento,
+        configuracao=configuracao,
+        limiar_aproximado=limiar_aproximado,
+        politica_duplicados=politica_duplicados,
+        instrumentacao=Instrumentacao(perfilar, perfilador),
+    )
+
+
+def _sem_aviso(estabelecimento, resultado, erro, concluidos, total):
+    pass
+
+
+def processar_lote(tarefas, protocolo, configuracao=None, processos=None,
+                   limiar_aproximado=LIMIAR_PADRAO, politica_duplicados=POLITICA_DUPLICADOS_PADRAO,
+                   cache=None, ao_concluir=None, perfilar=None, perfilador='cprofile'):
+    """
+    Processa os estabelecimentos em paralelo.
+
+    Args:
+        tarefas: lista de TarefaLote
+        protocolo: 'MENSAL', 'TRIMESTRAL', 'SEMESTRAL' ou 'ANUAL'
+        configuracao: ConfiguracaoTasy (None = config_exames.json padrão)
+        processos: número de processos (None = núcleos disponíveis; 1 = no
+            próprio processo, sem pool)
+        limiar_aproximado / politica_duplicados: como em processar_arquivos
+        cache: CacheResultados; estabelecimentos já processados com os
+            mesmos arquivos não vão para o pool
+        ao_concluir: callable(estabelecimento, resultado, erro, concluidos, total)
+            chamado no processo principal a cada estabelecimento terminado; uma
+            exceção levantada nele interrompe o lote (cancelamento) e descarta
+            os estabelecimentos ainda não iniciados
+        perfilar / perfilador: etapa perfilada em cada estabelecimento (ver
+            instrumentacao.Instrumentacao)
+
+    Returns:
+        ResultadoLote (um erro num estabelecimento não interrompe os demais)
+    """
+    configuracao = configuracao or obter_configuracao()
+    ao_concluir = ao_concluir or _sem_aviso
+    total = len(tarefas)
+    concluidos = {}
+    erros = {}
+
+    def concluir(estabelecimento, resultado=None, erro=None):
+        if erro is None:
+            concluidos[estabelecimento] = resultado
+        else:
+            erros[estabelecimento] = erro
+        ao_concluir(estabelecimento, resultado, erro, len(concluidos) + len(erros), total)
+
+    pendentes = []
+    for tarefa in tarefas:
+        try:
+            tarefa = TarefaLote(
+                tarefa.estabelecimento,
+                tarefa.cd_estabelecimento,
+                carregar_arquivo(tarefa.basicos),
+                carregar_arquivo(tarefa.pacientes),
+                carregar_arquivo(tarefa.resultados2) if tarefa.resultados2 is not None else None,
+            )
+        except OSError as e:
+            concluir(tarefa.estabelecimento, erro=str(e))
+            continue
+        chave = chave_resultado(tarefa.basicos, tarefa.resultados2, tarefa.pacientes, tarefa.cd_estabelecimento,
+                                configuracao, limiar_aproximado, politica_duplicados)
+        guardado = cache.resultados.get(chave) if cache is not None else None
+        if guardado is not None:
+            concluir(tarefa.estabelecimento, reaproveitar_resultado(guardado, protocolo))
+        else:
+            pendentes.append((tarefa, chave))
+
+    def guardar(tarefa, chave, resultado):
+        if cache is not None:
+            resultado.chave_cache = chave
+            cache.resultados[chave] = resultado
+        concluir(tarefa.estabelecimento, resultado)
+
+    argumentos = (protocolo, configuracao, limiar_aproximado, politica_duplicados, perfilar, perfilador)
+    processos = min(processos or os.cpu_count() or 1, len(pendentes))
+    if processos <= 1:
+        for tarefa, chave in pendentes:
+            try:
+                resultado = _processar_tarefa(tarefa, *argumentos)
+            except Exception as e:
+                concluir(tarefa.estabelecimento, erro=str(e))
+            else:
+                guardar(tarefa, chave, resultado)
+    elif pendentes:
+        # 'spawn': o processo pai pode ter threads (servidor do Streamlit), e
+        # fork com threads ativas pode travar o filho
+        contexto = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as executor:
+            futuros = {
+                executor.submit(_processar_tarefa, tarefa, *argumentos): (tarefa, chave)
+                for tarefa, chave in pendentes
+            }
+            try:
+                for futuro in as_completed(futuros):
+                    tarefa, chave = futuros[futuro]
+                    try:
+                        resultado = futuro.result()
+                    except Exception as e:
+                        concluir(tarefa.estabelecimento, erro=str(e))
+                    else:
+                        guardar(tarefa, chave, resultado)
+            except BaseException:
+                # Interrompido por ao_concluir: só os já iniciados terminam
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    ordem = [tarefa.estabelecimento for tarefa in tarefas]
+    return ResultadoLote(
+        resultados={nome: concluidos[nome] for nome in ordem if nome in concluidos},
+        erros={nome: erros[nome] for nome in ordem if nome in erros},
+    )
@@ -0,0 +1,79 @@
+"""
+Mapeamento compilado das colunas do laboratório para os códigos TASY.
+
+O config_exames.json lista, para cada exame, as variações de nome de
+coluna em ordem de preferência. Aqui essas variações viram um índice
+reverso (nome normalizado da coluna -> código TASY), já separado por
+categoria, de modo que resolver as colunas de uma planilha custa uma
+consulta por coluna, sem percorrer todos os exames e variações.
+"""
+from .transformacoes import normalizar_nome
+
+CATEGORIAS = ('basico', 'resultados2')
+
+
+def chave_coluna(coluna):
+    """Nome de coluna comparável: sem acentos, minúsculo, espaços colapsados."""
+    return normalizar_nome(coluna)
+
+
+class MapeamentoExames:
+    """
+    Índice reverso coluna -> código TASY, por categoria.
+
+    Para cada categoria (e para None = todas) guarda
+    {chave_coluna: (codigo_tasy, prioridade)}, onde a prioridade é a posição
+    da variação em `colunas_lab` (a primeira listada vence).
+    """
+
+    def __init__(self, mapa_exames_por_codigo):
+        self.ordem_codigos = {codigo: i for i, codigo in enumerate(mapa_exames_por_codigo)}
+        self._exatos = {categoria: {} for categoria in (None,) + CATEGORIAS}
+        self._normalizados = {categoria: {} for categoria in (None,) + CATEGORIAS}
+
+        for codigo, info in mapa_exames_por_codigo.items():
+            for prioridade, coluna in enumerate(info['colunas_lab']):
+                for categoria in (None, info['categoria']):
+                    self._exatos[categoria].setdefault(coluna, (codigo, prioridade))
+                    self._normalizados[categoria].setdefault(chave_coluna(coluna), (codigo, prioridade))
+
+    def resolver(self, colunas, categoria=None):
+        """
+        Mapeia as colunas de uma planilha para códigos TASY.
+
+        Um nome idêntico ao do config vence uma coincidência só por
+        maiúsculas/acentos; entre variações do mesmo exame vence a listada
+        primeiro.
+
+        Args:
+            colunas: nomes das colunas da planilha (df.columns)
+            categoria: 'basico' ou 'resultados2' (None = todos)
+
+        Returns:
+            dict: {codigo_tasy: nome_coluna_encontrada}, na ordem do config
+        """
+        exatos = self._exatos[categoria]
+        normalizados = self._normalizados[categoria]
+
+        escolhidos = {}
+        for coluna in colunas:
+            if coluna in exatos:
+                codigo, prioridade = exatos[coluna]
+                peso = 2 * prioridade
+            else:
+                encontrado = normalizados.get(chave_coluna(coluna))
+                if encontrado is None:
+                    continue
+                codigo, prioridade = encontrado
+                peso = 2 * prioridade + 1
+            if codigo not in escolhidos or peso < escolhidos[codigo][0]:
+                escolhidos[codigo] = (peso, coluna)
+
+        return {
+            codigo: escolhidos[codigo][1]
+            for codigo in sorted(escolhidos, key=self.ordem_codigos.get)
+        }
+
+    def chaves(self, categoria=None):
+        """Chaves normalizadas de todas as variações da categoria."""
+        return set(self._normalizados[categoria])
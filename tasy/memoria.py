@@ -0,0 +1,110 @@
+"""
+Medição da memória do processo durante o processamento.
+
+tracemalloc deixaria o processamento várias vezes mais lento; aqui se usa
+o pico de memória residente (RSS) que o próprio sistema operacional
+registra. No Linux (VmHWM) o pico é zerado no início de cada medição; nos
+demais sistemas é o pico desde o início do processo.
+
+Medições podem ser aninhadas (processamento inteiro e cada etapa): antes
+de zerar o pico, o valor atingido até ali é repassado às medições em
+andamento.
+
+O pico é do processo inteiro, não da thread. Medições simultâneas em
+threads diferentes (tarefas da interface, trabalhadores do serviço) não
+perdem o pico umas das outras, porque o repasse e o reinício acontecem sob
+um lock, mas cada uma inclui a memória usada pelas outras no mesmo
+intervalo.
+"""
+import sys
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_STATUS = '/proc/self/status'
+_CLEAR_REFS = '/proc/self/clear_refs'
+
+# Medições dentro de um `with medir_memoria()` ainda aberto, em qualquer thread
+_EM_ANDAMENTO = []
+# Protege _EM_ANDAMENTO e o par repasse + reinício do pico
+_LOCK = threading.Lock()
+
+
+def _status(campo):
+    """Valor em bytes de um campo de /proc/self/status (None fora do Linux)."""
+    try:
+        with open(_STATUS, encoding='ascii') as f:
+            for linha in f:
+                if linha.startswith(campo + ':'):
+                    return int(linha.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def memoria_atual():
+    """Memória residente do processo agora, em bytes (None se indisponível)."""
+    return _status('VmRSS')
+
+
+def pico_memoria():
+    """Maior memória residente desde o início do processo ou do último reinício, em bytes."""
+    pico = _status('VmHWM')
+    if pico is None and resource is not None:
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        pico = maximo if sys.platform == 'darwin' else maximo * 1024
+    return pico
+
+
+def reiniciar_pico_memoria():
+    """Zera o pico para a memória atual (só no Linux). Retorna se conseguiu."""
+    try:
+        with open(_CLEAR_REFS, 'w', encoding='ascii') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+@dataclass
+class MedicaoMemoria:
+    """Memória do processo no início e pico durante um bloco `with medir_memoria()`."""
+    inicial: int = None
+    pico: int = None
+    # False: o pico pode ser anterior ao bloco (sistema sem reinício do pico)
+    reiniciado: bool = False
+
+
+@contextmanager
+def medir_memoria():
+    """
+    Mede o pico de memória do processo (todas as threads) durante o bloco:
+
+        with medir_memoria() as medicao:
+            ...
+        medicao.pico  # bytes
+    """
+    with _LOCK:
+        _repassar_pico(pico_memoria())
+        medicao = MedicaoMemoria(inicial=memoria_atual(), reiniciado=reiniciar_pico_memoria())
+        _EM_ANDAMENTO.append(medicao)
+    try:
+        yield medicao
+    finally:
+        with _LOCK:
+            _repassar_pico(pico_memoria())
+            # Por identidade: medições aninhadas podem ter os mesmos valores
+            _EM_ANDAMENTO[:] = [outra for outra in _EM_ANDAMENTO if outra is not medicao]
+
+
+def _repassar_pico(pico):
+    # Chamada com _LOCK adquirido
+    if pico is None:
+        return
+    for medicao in _EM_ANDAMENTO:
+        medicao.pico = max(medicao.pico or 0, pico)
@@ -0,0 +1,396 @@
+"""
+Motor de processamento: cruza os exames do laboratório com os pacientes
+do TASY e monta a planilha de importação.
+
+Nada aqui depende do Streamlit; a interface (app_tasy.py) e a linha de
+comando (python -m tasy) chamam `processar` da mesma forma.
+"""
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+import pandas as pd
+
+from .combinacao import combinar_coletas
+from .configuracao import obter_configuracao
+from .correspondencia import LIMIAR_PADRAO, SUGESTAO_MINIMA
+from .instrumentacao import Instrumentacao
+from .leitura import carregar_arquivo, ler_planilha
+from .memoria import MedicaoMemoria, medir_memoria
+from .pacientes import POLITICA_DUPLICADOS_PADRAO, IndicePacientes, obter_indice_pacientes
+from .transformacoes import (
+    COLUNA_DATA_LAB,
+    COLUNAS_NOME,
+    converter_colunas_numericas,
+    converter_datas,
+    detectar_colunas_nome,
+    formatar_datas,
+    normalizar_nomes,
+)
+
+
+@dataclass
+class ResultadoProcessamento:
+    """Saída de `processar`."""
+    planilha_final: pd.DataFrame
+    sem_atendimento_basicos: pd.DataFrame
+    sem_atendimento_r2: pd.DataFrame
+    nomes_sem_atendimento: set = field(default_factory=set)
+    # {codigo_tasy: valores não numéricos descartados}, basicos + resultados2
+    valores_invalidos: dict = field(default_factory=dict)
+    # {'basicos'/'resultados2': datas (dthr_os) não reconhecidas}
+    datas_invalidas: dict = field(default_factory=dict)
+    # Candidatos da correspondência aproximada, aplicados ou só sugeridos
+    correspondencias_aproximadas: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # Nomes com mais de um NR_ATENDIMENTO no TASY (IndicePacientes.resumo_duplicados)
+    nomes_duplicados: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # Valores fora da faixa_min/faixa_max do exame (FaixasReferencia.conferir)
+    valores_fora_faixa: pd.DataFrame = field(default_factory=pd.DataFrame)
+    # leitura.InfoLeitura de cada planilha lida (preenchido por processar_arquivos)
+    leituras: list = field(default_factory=list)
+    # Pico de memória do processo na leitura + processamento (processar_arquivos)
+    memoria: MedicaoMemoria = None
+    # Chave no CacheResultados (None quando processado sem cache)
+    chave_cache: tuple = None
+    # Linhas gravadas direto em arquivo (processar_em_fluxo; None no processamento em memória)
+    linhas_gravadas: int = None
+    # {'sem_atendimento_basicos'/'sem_atendimento_r2'/'valores_fora_faixa': linhas
+    # contadas mas não guardadas} (processar_em_fluxo, acima de LIMITE_LINHAS_RELATORIO)
+    linhas_omitidas: dict = field(default_factory=dict)
+    # Tempo, linhas e memória de cada etapa
+    instrumentacao: Instrumentacao = field(default_factory=Instrumentacao)
+
+    @property
+    def total_inconsistencias(self):
+        return (len(self.sem_atendimento_basicos) + len(self.sem_atendimento_r2)
+                + self.linhas_omitidas.get('sem_atendimento_basicos', 0)
+                + self.linhas_omitidas.get('sem_atendimento_r2', 0))
+
+    @property
+    def total_fora_faixa(self):
+        return len(self.valores_fora_faixa) + self.linhas_omitidas.get('valores_fora_faixa', 0)
+
+
+def _sem_progresso(percentual, mensagem):
+    pass
+
+
+def _localizar_atendimentos(df, col_nome, indice_pacientes, limiar_aproximado):
+    """
+    NR_ATENDIMENTO de cada linha: busca exata e, para o que sobrar,
+    correspondência aproximada (se `limiar_aproximado` não for None).
+
+    Candidatos com confiança >= limiar_aproximado são aplicados; os demais
+    (a partir de SUGESTAO_MINIMA) só são devolvidos como sugestão. Com o
+    padrão (SOMENTE_SUGESTOES) nenhum é aplicado.
+
+    Returns:
+        tuple: (Series de atendimentos, lista de dicts das correspondências aproximadas)
+    """
+    atendimentos = indice_pacientes.localizar(df['nome_normalizado'], df.get('dthr_os'))
+    if limiar_aproximado is None:
+        return atendimentos, []
+
+    faltando = df.loc[atendimentos.isna(), ['nome_normalizado', col_nome]].drop_duplicates('nome_normalizado')
+    candidatos = indice_pacientes.correspondencia.corresponder(
+        faltando['nome_normalizado'], min(limiar_aproximado, SUGESTAO_MINIMA)
+    )
+    if not candidatos:
+        return atendimentos, []
+
+    aplicados = {
+        nome: atendimento
+        for nome, (_, atendimento, confianca) in candidatos.items()
+        if confianca >= limiar_aproximado
+    }
+    if aplicados:
+        atendimentos = atendimentos.fillna(df['nome_normalizado'].map(aplicados))
+
+    registros = [
+        {
+            'nome_normalizado': nome,
+            'Nome no laboratório': nome_lab,
+            'Nome no TASY': indice_pacientes.nomes[candidatos[nome][0]],
+            'NR_ATENDIMENTO': candidatos[nome][1],
+            'Confiança': round(candidatos[nome][2], 3),
+            'Aplicado': 'Sim' if nome in aplicados else 'Não',
+        }
+        for nome, nome_lab in zip(faltando['nome_normalizado'], faltando[col_nome])
+        if nome in candidatos
+    ]
+    return atendimentos, registros
+
+
+# Colunas guardadas em sem_atendimento_basicos / sem_atendimento_r2
+COLUNAS_IDENTIFICACAO = ['nome_original', 'nome_normalizado', COLUNA_DATA_LAB]
+
+
+def coluna_constante(valor, linhas):
+    """Coluna com o mesmo valor em todas as linhas, como categoria (1 byte por linha)."""
+    return pd.Categorical.from_codes(np.zeros(linhas, dtype='int8'), categories=[valor])
+
+
+def _preparar_lab(df, mapa, formatos_data):
+    """
+    Projeta uma planilha do laboratório nas colunas usadas daqui em diante:
+    nome original e normalizado, dthr_os convertida e um float32 por exame
+    mapeado. As demais colunas da planilha são descartadas e ela não é
+    alterada.
+
+    Returns:
+        tuple: (DataFrame, {codigo_tasy: valores descartados}, datas não reconhecidas)
+    """
+    col_nome = detectar_colunas_nome(df)
+    # Datas normalizadas antes do cruzamento: a mesma coleta em formatos
+    # diferentes nas duas planilhas precisa gerar a mesma chave
+    datas, datas_invalidas = converter_datas(df[COLUNA_DATA_LAB], formatos_data)
+    valores, valores_invalidos = converter_colunas_numericas(df, mapa)
+
+    identificacao = pd.DataFrame({
+        'nome_original': df[col_nome],
+        'nome_normalizado': normalizar_nomes(df[col_nome]),
+        COLUNA_DATA_LAB: datas,
+    })
+    return pd.concat([identificacao, valores], axis=1, copy=False), valores_invalidos, datas_invalidas
+
+
+def montar_planilha(basicos, resultados2, protocolo, cd_estabelecimento, configuracao):
+    """
+    Combina basicos e resultados2 já preparados e monta a planilha de importação.
+
+    Args:
+        basicos: saída de _preparar_lab com NR_ATENDIMENTO
+        resultados2: nome_normalizado, dthr_os e exames do resultados2 (ou None)
+        protocolo / cd_estabelecimento / configuracao: como em processar
+
+    Returns:
+        DataFrame nas colunas de ordem_colunas_tasy, uma linha por coleta
+        (paciente + dthr_os) do basicos com atendimento
+    """
+    combinado = combinar_coletas(basicos, resultados2, configuracao.regra_coletas_repetidas)
+
+    # Montagem direta das linhas com atendimento, coluna a coluna, sem
+    # copiar a tabela combinada inteira
+    mantidas = combinado['NR_ATENDIMENTO'].notna().to_numpy()
+    linhas = int(mantidas.sum())
+    colunas = {
+        'NM_PACIENTE': pd.Categorical(combinado['nome_original'].to_numpy()[mantidas]),
+        'NR_ATENDIMENTO': combinado['NR_ATENDIMENTO'].to_numpy()[mantidas].astype(int),
+        'DT_RESULTADO': formatar_datas(combinado[COLUNA_DATA_LAB][mantidas]).to_numpy(),
+        'DS_PROTOCOLO': coluna_constante(protocolo, linhas),
+        'CD_ESTABELECIMENTO': coluna_constante(int(cd_estabelecimento), linhas),
+    }
+    for coluna in configuracao.ordem_colunas_tasy[5:]:
+        if coluna in combinado.columns:
+            colunas[coluna] = combinado[coluna].to_numpy()[mantidas]
+        else:
+            colunas[coluna] = np.full(linhas, np.nan, dtype='float32')
+    return pd.DataFrame(colunas, index=combinado.index[mantidas])
+
+
+def processar(basicos, resultados2, pacientes, protocolo, cd_estabelecimento,
+              configuracao=None, progresso=None, limiar_aproximado=LIMIAR_PADRAO,
+              politica_duplicados=POLITICA_DUPLICADOS_PADRAO, instrumentacao=None):
+    """
+    Gera a planilha de importação TASY.
+
+    Args:
+        basicos: DataFrame com os exames básicos do laboratório
+        resultados2: DataFrame com os resultados complementares (ou None)
+        pacientes: DataFrame com Nome + Atendimento exportado do TASY,
+            ou um IndicePacientes já construído
+        protocolo: 'MENSAL', 'TRIMESTRAL', 'SEMESTRAL' ou 'ANUAL'
+        cd_estabelecimento: código aplicado a todos os registros
+        configuracao: ConfiguracaoTasy (None = config_exames.json padrão)
+        progresso: callable(percentual, mensagem) chamado entre as etapas
+        limiar_aproximado: confiança mínima (0 a 1) para aplicar o atendimento
+            de um nome pela correspondência aproximada; o padrão
+            (SOMENTE_SUGESTOES) só sugere e None desativa a segunda passada
+        politica_duplicados: ver pacientes.POLITICAS_DUPLICADOS (ignorado se
+            `pacientes` já for um IndicePacientes)
+        instrumentacao: Instrumentacao que recebe as etapas (None = uma nova)
+
+    Returns:
+        ResultadoProcessamento
+    """
+    configuracao = configuracao or obter_configuracao()
+    progresso = progresso or _sem_progresso
+    instrumentacao = instrumentacao or Instrumentacao()
+    mapeamento = configuracao.mapeamento
+
+    progresso(30, "🔍 Indexando pacientes...")
+    if isinstance(pacientes, IndicePacientes):
+        indice_pacientes = pacientes
+    else:
+        with instrumentacao.etapa('indice_pacientes', len(pacientes)) as etapa:
+            indice_pacientes = IndicePacientes(pacientes, politica_duplicados)
+            etapa.linhas_saida = len(indice_pacientes.atendimentos)
+
+    progresso(40, "⚙️ Processando exames básicos...")
+    with instrumentacao.etapa('preparar_basicos', len(basicos)) as etapa:
+        mapa_basicos = mapeamento.resolver(basicos.columns, categoria='basico')
+        basicos, valores_invalidos, invalidas = _preparar_lab(basicos, mapa_basicos, configuracao.formatos_data)
+        datas_invalidas = {'basicos': invalidas}
+        etapa.linhas_saida = len(basicos)
+
+    with instrumentacao.etapa('atendimentos_basicos', len(basicos)) as etapa:
+        basicos['NR_ATENDIMENTO'], aproximados = _localizar_atendimentos(
+            basicos, 'nome_original', indice_pacientes, limiar_aproximado
+        )
+        etapa.linhas_saida = int(basicos['NR_ATENDIMENTO'].notna().sum())
+    sem_atendimento_basicos = basicos.loc[basicos['NR_ATENDIMENTO'].isna(), COLUNAS_IDENTIFICACAO]
+    duplicados = [basicos[['nome_normalizado', 'NR_ATENDIMENTO']]]
+
+    nomes_sem_atendimento = set(sem_atendimento_basicos['nome_original'].unique())
+
+    if resultados2 is not None:
+        progresso(60, "⚙️ Processando resultados 2...")
+        with instrumentacao.etapa('preparar_resultados2', len(resultados2)) as etapa:
+            mapa_resultados2 = mapeamento.resolver(resultados2.columns, categoria='resultados2')
+            resultados2, invalidos_r2, datas_invalidas['resultados2'] = _preparar_lab(
+                resultados2, mapa_resultados2, configuracao.formatos_data
+            )
+            valores_invalidos.update(invalidos_r2)
+            etapa.linhas_saida = len(resultados2)
+
+        with instrumentacao.etapa('atendimentos_resultados2', len(resultados2)) as etapa:
+            resultados2['NR_ATENDIMENTO'], aproximados_r2 = _localizar_atendimentos(
+                resultados2, 'nome_original', indice_pacientes, limiar_aproximado
+            )
+            etapa.linhas_saida = int(resultados2['NR_ATENDIMENTO'].notna().sum())
+        aproximados.extend(aproximados_r2)
+        duplicados.append(resultados2[['nome_normalizado', 'NR_ATENDIMENTO']])
+        sem_atendimento_r2 = resultados2.loc[resultados2['NR_ATENDIMENTO'].isna(), COLUNAS_IDENTIFICACAO]
+        nomes_sem_atendimento.update(sem_atendimento_r2['nome_original'].unique())
+    else:
+        sem_atendimento_r2 = pd.DataFrame()
+
+    duplicados = pd.concat(duplicados, ignore_index=True)
+    nomes_duplicados = indice_pacientes.resumo_duplicados(duplicados['nome_normalizado'], duplicados['NR_ATENDIMENTO'])
+
+    correspondencias_aproximadas = pd.DataFrame(aproximados).drop_duplicates('nome_normalizado') if aproximados else pd.DataFrame()
+
+    progresso(75, "🔄 Mesclando dados...")
+    linhas_lab = len(basicos) + (len(resultados2) if resultados2 is not None else 0)
+    with instrumentacao.etapa('mesclagem', linhas_lab) as etapa:
+        planilha_final = montar_planilha(
+            basicos,
+            resultados2[['nome_normalizado', COLUNA_DATA_LAB, *mapa_resultados2]] if resultados2 is not None else None,
+            protocolo,
+            cd_estabelecimento,
+            configuracao,
+        )
+        etapa.linhas_saida = len(planilha_final)
+
+    with instrumentacao.etapa('validacao', len(planilha_final)) as etapa:
+        valores_fora_faixa = configuracao.faixas.conferir(planilha_final)
+        etapa.linhas_saida = len(valores_fora_faixa)
+
+    progresso(90, "💾 Gerando arquivo...")
+
+    return ResultadoProcessamento(
+        planilha_final=planilha_final,
+        sem_atendimento_basicos=sem_atendimento_basicos,
+        sem_atendimento_r2=sem_atendimento_r2,
+        nomes_sem_atendimento=nomes_sem_atendimento,
+        valores_invalidos=valores_invalidos,
+        datas_invalidas=datas_invalidas,
+        correspondencias_aproximadas=correspondencias_aproximadas.drop(columns='nome_normalizado', errors='ignore'),
+        nomes_duplicados=nomes_duplicados,
+        valores_fora_faixa=valores_fora_faixa,
+        instrumentacao=instrumentacao,
+    )
+
+def colunas_necessarias(configuracao, categoria):
+    """Colunas lidas de uma planilha do laboratório ('basico' ou 'resultados2')."""
+    return COLUNAS_NOME + [COLUNA_DATA_LAB] + configuracao.colunas_lab(categoria)
+
+
+def chave_resultado(arquivo_basicos, arquivo_resultados2, arquivo_pacientes, cd_estabelecimento,
+                    configuracao, limiar_aproximado, politica_duplicados):
+    """
+    Chave de um processamento no CacheResultados: conteúdo dos arquivos
+    (ArquivoCarregado) e tudo o que muda o resultado, exceto o protocolo.
+    """
+    return (
+        arquivo_basicos.hash,
+        arquivo_resultados2.hash if arquivo_resultados2 is not None else None,
+        arquivo_pacientes.hash,
+        cd_estabelecimento,
+        configuracao.assinatura,
+        limiar_aproximado,
+        politica_duplicados,
+    )
+
+
+def reaproveitar_resultado(guardado, protocolo, instrumentacao=None):
+    """Cópia de um resultado do cache com o protocolo trocado (e sem as etapas medidas antes)."""
+    return replace(
+        guardado,
+        planilha_final=guardado.planilha_final.assign(
+            DS_PROTOCOLO=coluna_constante(protocolo, len(guardado.planilha_final))
+        ),
+        leituras=[replace(info, motor='cache', segundos=0.0) for info in guardado.leituras],
+        memoria=None,
+        instrumentacao=instrumentacao or Instrumentacao(),
+    )
+
+
+def processar_arquivos(arquivo_basicos, arquivo_resultados2, arquivo_pacientes,
+                       protocolo, cd_estabelecimento, configuracao=None, progresso=None,
+                       limiar_aproximado=LIMIAR_PADRAO, politica_duplicados=POLITICA_DUPLICADOS_PADRAO,
+                       cache=None, instrumentacao=None):
+    """
+    Lê as planilhas (caminhos ou arquivos enviados) e chama `processar`.
+
+    `arquivo_resultados2` é opcional (None). Com `cache` (CacheResultados),
+    arquivos com o mesmo conteúdo não são relidos e um processamento já
+    feito só tem o protocolo trocado. As etapas ficam em
+    `resultado.instrumentacao` (passe uma Instrumentacao para perfilar).
+    """
+    configuracao = configuracao or obter_configuracao()
+    progresso = progresso or _sem_progresso
+    instrumentacao = instrumentacao or Instrumentacao()
+
+    chave = None
+    if cache is not None:
+        arquivo_basicos = carregar_arquivo(arquivo_basicos)
+        arquivo_pacientes = carregar_arquivo(arquivo_pacientes)
+        if arquivo_resultados2 is not None:
+            arquivo_resultados2 = carregar_arquivo(arquivo_resultados2)
+        chave = chave_resultado(arquivo_basicos, arquivo_resultados2, arquivo_pacientes, cd_estabelecimento,
+                                configuracao, limiar_aproximado, politica_duplicados)
+        guardado = cache.resultados.get(chave)
+        if guardado is not None:
+            progresso(90, "♻️ Reaproveitando processamento anterior...")
+            return reaproveitar_resultado(guardado, protocolo, instrumentacao)
+
+    ler = cache.ler if cache is not None else ler_planilha
+
+    with medir_memoria() as memoria:
+        progresso(10, "📂 Carregando arquivos...")
+        # Leitura da planilha e construção do índice (ou índice reaproveitado)
+        with instrumentacao.etapa('leitura_pacientes') as etapa:
+            pacientes, info_pacientes = obter_indice_pacientes(arquivo_pacientes, politica_duplicados)
+            etapa.linhas_saida = info_pacientes.linhas
+        with instrumentacao.etapa('leitura_basicos') as etapa:
+            basicos, info_basicos = ler(arquivo_basicos, colunas_necessarias(configuracao, 'basico'))
+            etapa.linhas_saida = len(basicos)
+        leituras = [info_basicos, info_pacientes]
+        if arquivo_resultados2 is not None:
+            with instrumentacao.etapa('leitura_resultados2') as etapa:
+                resultados2, info_r2 = ler(arquivo_resultados2, colunas_necessarias(configuracao, 'resultados2'))
+                etapa.linhas_saida = len(resultados2)
+            leituras.insert(1, info_r2)
+        else:
+            resultados2 = None
+
+        resultado = processar(basicos, resultados2, pacientes, protocolo, cd_estabelecimento,
+                              configuracao=configuracao, progresso=progresso,
+                              limiar_aproximado=limiar_aproximado, instrumentacao=instrumentacao)
+    resultado.leituras = leituras
+    resultado.memoria = memoria
+
+    if cache is not None:
+        resultado.chave_cache = chave
+        cache.resultados[chave] = resultado
+    return resultado
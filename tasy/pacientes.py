@@ -0,0 +1,217 @@
+"""
+Índice de pacientes do TASY: nome normalizado -> NR_ATENDIMENTO.
+
+O índice é construído uma vez por exportação de pacientes e pode ser
+reaproveitado entre execuções (mesmo arquivo enviado de novo, vários
+estabelecimentos no lote, etc.).
+"""
+from dataclasses import replace
+
+import pandas as pd
+
+from .cache import CacheLRU
+from .correspondencia import CorrespondenciaAproximada
+from .erros import ErroProcessamento
+from .leitura import carregar_arquivo, ler_planilha
+from .transformacoes import (
+    COLUNAS_ATENDIMENTO,
+    COLUNAS_DATA_ATENDIMENTO,
+    COLUNAS_NOME,
+    converter_datas,
+    detectar_colunas_atendimento,
+    detectar_colunas_data_atendimento,
+    detectar_colunas_nome,
+    normalizar_nomes,
+)
+
+
+# Como escolher o atendimento quando o mesmo nome normalizado aparece com
+# mais de um NR_ATENDIMENTO na exportação do TASY:
+#   'ultimo'       - a última linha do arquivo (padrão, como sempre foi)
+#   'mais_recente' - o de data de atendimento mais recente; sem coluna de
+#                    data, o maior NR_ATENDIMENTO
+#   'mais_proximo' - por linha do laboratório, o de data mais próxima de
+#                    dthr_os (sem data, igual a 'mais_recente')
+POLITICAS_DUPLICADOS = ('ultimo', 'mais_recente', 'mais_proximo')
+POLITICA_DUPLICADOS_PADRAO = 'ultimo'
+
+
+class IndicePacientes:
+    """
+    Índice construído a partir da planilha de pacientes do TASY.
+
+    Atributos:
+        col_nome / col_atendimento / col_data: colunas detectadas na planilha
+        atendimentos: {nome_normalizado: NR_ATENDIMENTO} já resolvido pela política
+        nomes: {nome_normalizado: nome como está no TASY}
+        colisoes: DataFrame (nome_normalizado, atendimento, data) com os nomes
+            que têm mais de um NR_ATENDIMENTO
+    """
+
+    def __init__(self, pacientes, politica=POLITICA_DUPLICADOS_PADRAO, cabecalho=None):
+        if politica not in POLITICAS_DUPLICADOS:
+            raise ValueError(f"Política de duplicados inválida: {politica}")
+        self.politica = politica
+
+        self.col_nome = detectar_colunas_nome(pacientes)
+        self.col_atendimento = detectar_colunas_atendimento(pacientes)
+        self.col_data = detectar_colunas_data_atendimento(pacientes)
+
+        if not self.col_atendimento:
+            # Do cabeçalho do arquivo: `pacientes` pode ter só as colunas projetadas na leitura
+            disponiveis = cabecalho or pacientes.columns
+            raise ErroProcessamento(
+                f"Coluna de atendimento não encontrada!\n\nColunas disponíveis: {', '.join(map(str, disponiveis))}"
+            )
+
+        # Datas como em dthr_os: texto, datas do Excel e números de série numa
+        # mesma coluna viram datetime64 (inválidas = NaT, primeiras na ordenação)
+        tabela = pd.DataFrame({
+            'nome_normalizado': normalizar_nomes(pacientes[self.col_nome]),
+            'atendimento': pacientes[self.col_atendimento],
+            'nome': pacientes[self.col_nome],
+            'data': converter_datas(pacientes[self.col_data])[0] if self.col_data else pd.NaT,
+        })
+        tabela = tabela[tabela['atendimento'].notna() & (tabela['nome_normalizado'] != '')]
+
+        # Uma única passada agrupada: quantos atendimentos distintos por nome
+        distintos = tabela.groupby('nome_normalizado', sort=False)['atendimento'].transform('nunique')
+        self.colisoes = tabela.loc[distintos > 1, ['nome_normalizado', 'atendimento', 'data']] \
+            .drop_duplicates(['nome_normalizado', 'atendimento'], keep='last') \
+            .reset_index(drop=True)
+
+        if politica != 'ultimo':
+            ordem = ['data', 'atendimento'] if self.col_data else ['atendimento']
+            tabela = tabela.sort_values(ordem, kind='stable', na_position='first')
+        escolhidos = tabela.drop_duplicates('nome_normalizado', keep='last')
+
+        self.atendimentos = dict(zip(escolhidos['nome_normalizado'], escolhidos['atendimento']))
+        self.nomes = dict(zip(escolhidos['nome_normalizado'], escolhidos['nome']))
+        self._correspondencia = None
+        self.hash_arquivo = None
+
+    def __len__(self):
+        return len(self.atendimentos)
+
+    def localizar(self, nomes_normalizados, datas=None):
+        """
+        NR_ATENDIMENTO para cada nome normalizado (NaN se não encontrado).
+
+        Com a política 'mais_proximo', `datas` (dthr_os de cada linha) decide
+        entre os atendimentos de um nome duplicado.
+        """
+        atendimentos = nomes_normalizados.map(self.atendimentos)
+        if (self.politica != 'mais_proximo' or datas is None or self.col_data is None
+                or self.colisoes.empty):
+            return atendimentos
+
+        afetados = nomes_normalizados.isin(self.colisoes['nome_normalizado'])
+        if not afetados.any():
+            return atendimentos
+
+        linhas = pd.DataFrame({
+            'nome_normalizado': nomes_normalizados[afetados],
+            'dthr_os': converter_datas(datas[afetados])[0],
+        }).rename_axis('linha').reset_index()
+        pares = linhas.merge(self.colisoes, on='nome_normalizado')
+        pares['distancia'] = (pares['dthr_os'] - pares['data']).abs()
+        pares = pares.dropna(subset=['distancia'])
+        mais_proximos = pares.sort_values('distancia', kind='stable').drop_duplicates('linha')
+
+        atendimentos.loc[mais_proximos['linha'].to_numpy()] = mais_proximos['atendimento'].to_numpy()
+        return atendimentos
+
+    def resumo_duplicados(self, nomes_normalizados, atendimentos):
+        """
+        Linhas do laboratório cujo nome tem mais de um atendimento no TASY.
+
+        Args:
+            nomes_normalizados: Series com o nome normalizado de cada linha
+            atendimentos: Series com o NR_ATENDIMENTO usado em cada linha
+
+        Returns:
+            DataFrame com uma linha por nome: candidatos, atendimento(s) usado(s)
+            e quantidade de linhas afetadas
+        """
+        if self.colisoes.empty:
+            return pd.DataFrame()
+
+        afetados = nomes_normalizados.isin(self.colisoes['nome_normalizado'])
+        if not afetados.any():
+            return pd.DataFrame()
+
+        candidatos = self.colisoes.groupby('nome_normalizado', sort=False)['atendimento'] \
+            .agg(lambda s: ', '.join(map(_formatar_atendimento, s)))
+        usados = pd.DataFrame({
+            'nome_normalizado': nomes_normalizados[afetados],
+            'atendimento': atendimentos[afetados],
+        }).groupby('nome_normalizado').agg(
+            usados=('atendimento', lambda s: ', '.join(map(_formatar_atendimento, s.dropna().unique()))),
+            linhas=('atendimento', 'size'),
+        )
+
+        return pd.DataFrame({
+            'Paciente': usados.index.map(self.nomes),
+            'Atendimentos no TASY': usados.index.map(candidatos),
+            'Atendimento usado': usados['usados'].to_numpy(),
+            'Linhas afetadas': usados['linhas'].to_numpy(),
+            'Política': self.politica,
+        })
+
+    @property
+    def correspondencia(self):
+        """CorrespondenciaAproximada sobre este índice (montada no primeiro uso)."""
+        if self._correspondencia is None:
+            self._correspondencia = CorrespondenciaAproximada(self.atendimentos)
+        return self._correspondencia
+
+
+def _formatar_atendimento(atendimento):
+    try:
+        return str(int(atendimento))
+    except (TypeError, ValueError):
+        return str(atendimento)
+
+
+# Índices já construídos, por hash do conteúdo do arquivo de pacientes
+_CACHE_INDICES = CacheLRU(maxsize=8)
+
+
+def limpar_cache_indices():
+    """Descarta os índices guardados (o próximo obter_indice_pacientes lê o arquivo de novo)."""
+    _CACHE_INDICES.clear()
+
+
+def indices_em_cache():
+    """Quantidade de índices de pacientes guardados."""
+    return len(_CACHE_INDICES)
+
+
+def obter_indice_pacientes(arquivo_pacientes, politica=POLITICA_DUPLICADOS_PADRAO):
+    """
+    Lê a planilha de pacientes e constrói o índice, reaproveitando o índice
+    de uma execução anterior quando o conteúdo do arquivo é o mesmo.
+
+    O índice guardado é compartilhado entre chamadas (threads do serviço e
+    da interface) e não é alterado aqui; as estatísticas da leitura voltam
+    à parte.
+
+    Returns:
+        tuple: (IndicePacientes, InfoLeitura); motor 'cache' quando o índice
+            foi reaproveitado
+    """
+    arquivo = carregar_arquivo(arquivo_pacientes)
+    chave = (arquivo.hash, politica)
+
+    guardado = _CACHE_INDICES.get(chave)
+    if guardado is not None:
+        indice, info = guardado
+        return indice, replace(info, motor='cache', segundos=0.0)
+
+    pacientes, info = ler_planilha(
+        arquivo, colunas=COLUNAS_NOME + COLUNAS_ATENDIMENTO + COLUNAS_DATA_ATENDIMENTO
+    )
+    indice = IndicePacientes(pacientes, politica, cabecalho=info.cabecalho)
+    indice.hash_arquivo = arquivo.hash
+    _CACHE_INDICES[chave] = (indice, info)
+    return indice, info
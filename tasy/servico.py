@@ -0,0 +1,521 @@
+"""
+Serviço HTTP local: outras ferramentas enviam as planilhas e recebem o
+arquivo TASY, sem navegador.
+
+    python -m tasy.servico --porta 8765 --trabalhadores 2 --fila 8
+
+    curl -F basicos=@basicos.xlsx -F resultados2=@resultados2.xlsx \\
+         -F pacientes=@pacientes.xlsx -F estabelecimento=MATRIZ -F protocolo=MENSAL \\
+         -o Planilha_TASY.xlsx http://127.0.0.1:8765/processar
+
+Endpoints (corpo dos POST em multipart/form-data: arquivos basicos,
+pacientes e resultados2 (opcional); campos estabelecimento (nome) ou
+cd_estabelecimento, protocolo, formato, aplicar_aproximados,
+limiar_aproximado, sem_aproximacao e politica_duplicados, como nas opções
+da linha de comando):
+
+    POST   /processar               espera o processamento e devolve o arquivo
+    POST   /tarefas                 enfileira e devolve 202 {"id": ...}
+    GET    /tarefas/<id>            andamento e resumo
+    GET    /tarefas/<id>/arquivo    arquivo gerado (409 enquanto não termina)
+    DELETE /tarefas/<id>            cancela
+    GET    /metricas                vazão, latência, fila e caches
+    GET    /saude
+
+O processamento é o mesmo da interface (processar_arquivos + gerar_saida)
+e roda num GerenciadorTarefas com `--trabalhadores` threads e no máximo
+`--fila` pedidos esperando: além disso o serviço responde 503 com
+Retry-After, em vez de acumular pedidos. Configuração compilada, índices
+de pacientes e resultados (CacheResultados) ficam em memória entre os
+pedidos, como na interface.
+"""
+import argparse
+import json
+import logging
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from datetime import datetime
+from email import policy
+from email.parser import BytesParser
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from .cache_resultados import CacheResultados
+from .cli import PROTOCOLOS
+from .configuracao import obter_configuracao
+from .correspondencia import LIMIAR_APLICACAO, LIMIAR_PADRAO
+from .erros import ErroConfiguracao, ErroProcessamento, FilaCheia
+from .exportacao import FORMATOS_SAIDA, formatos_disponiveis, gerar_saida
+from .instrumentacao import Instrumentacao
+from .leitura import ArquivoCarregado
+from .motor import processar_arquivos
+from .pacientes import POLITICA_DUPLICADOS_PADRAO, POLITICAS_DUPLICADOS, indices_em_cache
+from .tarefas import GerenciadorTarefas, etapas_processamento
+
+logger = logging.getLogger('tasy')
+
+PORTA_PADRAO = 8765
+FILA_PADRAO = 8
+# Pedidos concluídos guardados para as métricas de latência
+AMOSTRAS_LATENCIA = 1000
+# Espera máxima de POST /processar (depois disso, 504 e a tarefa é cancelada)
+TEMPO_LIMITE_PADRAO = 600
+TAMANHO_MAXIMO_PADRAO = 200 * 1024 * 1024
+
+
+class RequisicaoInvalida(Exception):
+    """Pedido malformado (400) ou grande demais (413)."""
+
+    def __init__(self, mensagem, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(mensagem)
+        self.status = status
+
+
+def ler_formulario(tipo_conteudo, corpo):
+    """
+    Campos e arquivos de um corpo multipart/form-data.
+
+    Returns:
+        tuple: ({campo: texto}, {campo: ArquivoCarregado})
+    """
+    if not tipo_conteudo.startswith('multipart/form-data'):
+        raise RequisicaoInvalida("Envie as planilhas como multipart/form-data")
+    mensagem = BytesParser(policy=policy.HTTP).parsebytes(
+        b'Content-Type: ' + tipo_conteudo.encode('latin-1') + b'\r\n\r\n' + corpo
+    )
+    if not mensagem.is_multipart():
+        raise RequisicaoInvalida("Corpo multipart inválido")
+    campos, arquivos = {}, {}
+    for parte in mensagem.iter_parts():
+        nome = parte.get_param('name', header='content-disposition')
+        if not nome:
+            continue
+        conteudo = parte.get_payload(decode=True) or b''
+        if parte.get_filename() is not None:
+            if conteudo:
+                arquivos[nome] = ArquivoCarregado(conteudo, parte.get_filename())
+        else:
+            campos[nome] = conteudo.decode('utf-8').strip()
+    return campos, arquivos
+
+
+def _marcado(campos, nome):
+    return campos.get(nome, '').lower() in ('1', 'sim', 'true')
+
+
+def interpretar_pedido(campos, arquivos, configuracao):
+    """
+    Valida o formulário e monta os parâmetros do processamento.
+
+    Returns:
+        tuple: (parâmetros, {'basicos', 'resultados2', 'pacientes'})
+    """
+    faltando = [nome for nome in ('basicos', 'pacientes') if nome not in arquivos]
+    if faltando:
+        raise RequisicaoInvalida(f"Arquivo(s) ausente(s): {', '.join(faltando)}")
+
+    if campos.get('cd_estabelecimento'):
+        try:
+            cd_estabelecimento = int(campos['cd_estabelecimento'])
+        except ValueError:
+            raise RequisicaoInvalida("cd_estabelecimento deve ser um número inteiro") from None
+    elif campos.get('estabelecimento'):
+        cd_estabelecimento = configuracao.codigo_estabelecimento(campos['estabelecimento'])
+        if cd_estabelecimento is None:
+            raise RequisicaoInvalida(f"Estabelecimento desconhecido: {campos['estabelecimento']} "
+                                     f"(esperado {', '.join(configuracao.estabelecimentos)})")
+    else:
+        raise RequisicaoInvalida("Informe estabelecimento ou cd_estabelecimento")
+
+    protocolo = campos.get('protocolo', 'MENSAL').upper()
+    if protocolo not in PROTOCOLOS:
+        raise RequisicaoInvalida(f"Protocolo inválido: {protocolo} (esperado {', '.join(PROTOCOLOS)})")
+    formato = campos.get('formato', 'xlsx').lower()
+    if formato not in formatos_disponiveis():
+        raise RequisicaoInvalida(f"Formato indisponível: {formato} (esperado {', '.join(formatos_disponiveis())})")
+    politica = campos.get('politica_duplicados', POLITICA_DUPLICADOS_PADRAO)
+    if politica not in POLITICAS_DUPLICADOS:
+        raise RequisicaoInvalida(f"politica_duplicados inválida: {politica} "
+                                 f"(esperado {', '.join(POLITICAS_DUPLICADOS)})")
+    try:
+        limiar = float(campos.get('limiar_aproximado') or LIMIAR_APLICACAO)
+    except ValueError:
+        raise RequisicaoInvalida("limiar_aproximado deve ser um número entre 0 e 1") from None
+    if not 0 <= limiar <= 1:
+        raise RequisicaoInvalida("limiar_aproximado deve ser um número entre 0 e 1")
+    if _marcado(campos, 'sem_aproximacao'):
+        limiar = None
+    elif not _marcado(campos, 'aplicar_aproximados'):
+        limiar = LIMIAR_PADRAO
+
+    parametros = {
+        'cd_estabelecimento': cd_estabelecimento,
+        'protocolo': protocolo,
+        'formato': formato,
+        'limiar_aproximado': limiar,
+        'politica_duplicados': politica,
+    }
+    planilhas = {nome: arquivos.get(nome) for nome in ('basicos', 'resultados2', 'pacientes')}
+    return parametros, planilhas
+
+
+def _percentis(valores):
+    if not valores:
+        return None
+    p50, p95, p99 = np.percentile(valores, [50, 95, 99])
+    return {'p50': round(p50, 4), 'p95': round(p95, 4), 'p99': round(p99, 4), 'max': round(max(valores), 4)}
+
+
+class MetricasServico:
+    """Contadores e latências dos pedidos (espera na fila, processamento e total)."""
+
+    def __init__(self, amostras=AMOSTRAS_LATENCIA):
+        self.inicio = time.time()
+        self.contadores = Counter()
+        # (instante de conclusão, espera, processamento) dos últimos pedidos concluídos
+        self._concluidos = deque(maxlen=amostras)
+        self._lock = threading.Lock()
+
+    def contar(self, evento):
+        with self._lock:
+            self.contadores[evento] += 1
+
+    def concluir(self, tarefa):
+        with self._lock:
+            self.contadores[tarefa.estado] += 1
+            if tarefa.estado == 'concluida':
+                self._concluidos.append((time.time(), tarefa.espera, tarefa.fim - tarefa.inicio))
+
+    def resumo(self):
+        agora = time.time()
+        with self._lock:
+            contadores = dict(self.contadores)
+            concluidos = list(self._concluidos)
+        ultimo_minuto = sum(1 for instante, _, _ in concluidos if instante >= agora - 60)
+        segundos = agora - self.inicio
+        return {
+            'desde': datetime.fromtimestamp(self.inicio).isoformat(timespec='seconds'),
+            'segundos_ativo': round(segundos, 1),
+            'pedidos': contadores,
+            'vazao_por_segundo': {
+                'ultimo_minuto': round(ultimo_minuto / min(60, segundos or 1), 4),
+                'total': round(contadores.get('concluida', 0) / (segundos or 1), 4),
+            },
+            'latencia_segundos': {
+                'amostras': len(concluidos),
+                'espera': _percentis([espera for _, espera, _ in concluidos]),
+                'processamento': _percentis([processamento for _, _, processamento in concluidos]),
+                'total': _percentis([espera + processamento for _, espera, processamento in concluidos]),
+            },
+        }
+
+
+class ServicoTasy:
+    """
+    Pipeline da interface atrás de uma fila limitada.
+
+    Args:
+        trabalhadores: processamentos simultâneos
+        fila: pedidos que podem esperar além dos em execução
+        caminho_config: config_exames.json (None = padrão)
+        guardar: tarefas concluídas guardadas para GET /tarefas/<id>
+    """
+
+    def __init__(self, trabalhadores=2, fila=FILA_PADRAO, caminho_config=None, guardar=64):
+        self.caminho_config = caminho_config
+        self.metricas = MetricasServico()
+        self.tarefas = GerenciadorTarefas(trabalhadores, sessoes=guardar, fila=fila,
+                                          ao_terminar=self.metricas.concluir)
+        self.cache = CacheResultados()
+        obter_configuracao(caminho_config)  # erro de configuração aparece já na partida
+
+    def enviar(self, campos, arquivos):
+        """
+        Valida o pedido e o coloca na fila.
+
+        Raises:
+            RequisicaoInvalida, FilaCheia
+        """
+        self.metricas.contar('recebidos')
+        configuracao = obter_configuracao(self.caminho_config)
+        parametros, planilhas = interpretar_pedido(campos, arquivos, configuracao)
+        try:
+            return self.tarefas.enviar(
+                uuid.uuid4().hex,
+                lambda tarefa: self._processar(tarefa, planilhas, configuracao),
+                etapas=etapas_processamento(resultados2=planilhas['resultados2'] is not None),
+                descricao=planilhas['basicos'].name,
+                parametros=parametros,
+            )
+        except FilaCheia:
+            self.metricas.contar('recusados')
+            raise
+
+    def _processar(self, tarefa, planilhas, configuracao):
+        """Roda na thread do trabalhador; devolve (resultado, bytes do arquivo)."""
+        parametros = tarefa.parametros
+        resultado = processar_arquivos(
+            planilhas['basicos'],
+            planilhas['resultados2'],
+            planilhas['pacientes'],
+            parametros['protocolo'],
+            parametros['cd_estabelecimento'],
+            configuracao=configuracao,
+            progresso=tarefa.progresso,
+            limiar_aproximado=parametros['limiar_aproximado'],
+            politica_duplicados=parametros['politica_duplicados'],
+            cache=self.cache,
+            instrumentacao=Instrumentacao(observador=tarefa.observar_etapa),
+        )
+        planilha = resultado.planilha_final
+
+        def gerar():
+            with resultado.instrumentacao.etapa('exportacao', len(planilha)) as etapa:
+                saida = gerar_saida(planilha, parametros['formato'])
+                etapa.linhas_saida = len(planilha)
+            return saida
+
+        conteudo = self.cache.saida(resultado, parametros['protocolo'], parametros['formato'], gerar).getvalue()
+        resultado.instrumentacao.observador = None
+        return resultado, conteudo
+
+    def resumo_tarefa(self, tarefa):
+        resumo = {
+            'id': tarefa.sessao,
+            'estado': tarefa.estado,
+            'percentual': tarefa.percentual,
+            'mensagem': tarefa.mensagem,
+            'etapa': tarefa.etapa,
+            'espera_segundos': round(tarefa.espera, 3),
+            'segundos': round(tarefa.segundos, 3),
+        }
+        if tarefa.erro is not None:
+            resumo['erro'] = str(tarefa.erro)
+        if tarefa.estado == 'concluida':
+            resultado, _ = tarefa.resultado
+            resumo.update(_resumo_resultado(resultado))
+        return resumo
+
+    def resumo_metricas(self):
+        metricas = self.metricas.resumo()
+        metricas['fila'] = {
+            'trabalhadores': self.tarefas.trabalhadores,
+            'capacidade': self.tarefas.fila,
+            'executando': self.tarefas.executando,
+            'na_fila': self.tarefas.na_fila,
+        }
+        metricas['caches'] = {
+            'indices_pacientes': indices_em_cache(),
+            'leituras': len(self.cache.leituras),
+            'resultados': len(self.cache.resultados),
+            'saidas': len(self.cache.saidas),
+        }
+        return metricas
+
+    def encerrar(self):
+        self.tarefas.encerrar()
+
+
+def _resumo_resultado(resultado):
+    return {
+        'registros': len(resultado.planilha_final),
+        'pacientes_sem_atendimento': len(resultado.nomes_sem_atendimento),
+        'valores_fora_faixa': len(resultado.valores_fora_faixa),
+        'valores_invalidos': sum(resultado.valores_invalidos.values()),
+        'etapas': {medicao.etapa: round(medicao.segundos, 4) for medicao in resultado.instrumentacao.etapas.values()},
+    }
+
+
+_ROTA_TAREFA = re.compile(r'^/tarefas/([0-9a-f]{32})(/arquivo)?$')
+
+
+class ManipuladorTasy(BaseHTTPRequestHandler):
+    """Rotas do serviço; `self.server.servico` é o ServicoTasy."""
+
+    server_version = 'TasyServico/1.0'
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, formato, *argumentos):
+        logger.debug("%s %s", self.address_string(), formato % argumentos)
+
+    def _json(self, status, corpo, cabecalhos=None):
+        dados = json.dumps(corpo, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def _erro(self, status, mensagem, cabecalhos=None):
+        self._json(status, {'erro': mensagem}, cabecalhos)
+
+    def _arquivo(self, tarefa):
+        resultado, conteudo = tarefa.resultado
+        parametros = tarefa.parametros
+        extensao, mime = FORMATOS_SAIDA[parametros['formato']]
+        nome = (f"Planilha_Importacao_TASY_{parametros['cd_estabelecimento']}_"
+                f"{datetime.now().strftime('%Y%m%d_%H%M%S')}{extensao}")
+        resumo = _resumo_resultado(resultado)
+        self.send_response(HTTPStatus.OK)
+        self.send_header('Content-Type', mime)
+        self.send_header('Content-Length', str(len(conteudo)))
+        self.send_header('Content-Disposition', f'attachment; filename="{nome}"')
+        self.send_header('X-Tasy-Tarefa', tarefa.sessao)
+        self.send_header('X-Tasy-Registros', str(resumo['registros']))
+        self.send_header('X-Tasy-Pacientes-Sem-Atendimento', str(resumo['pacientes_sem_atendimento']))
+        self.send_header('X-Tasy-Valores-Fora-Faixa', str(resumo['valores_fora_faixa']))
+        self.send_header('X-Tasy-Segundos', f"{tarefa.segundos:.3f}")
+        self.end_headers()
+        self.wfile.write(conteudo)
+
+    def _ler_pedido(self):
+        tamanho = int(self.headers.get('Content-Length') or 0)
+        if tamanho > self.server.tamanho_maximo:
+            raise RequisicaoInvalida(f"Pedido maior que {self.server.tamanho_maximo // 2**20} MB",
+                                     HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        return ler_formulario(self.headers.get('Content-Type', ''), self.rfile.read(tamanho))
+
+    def _enviar(self):
+        servico = self.server.servico
+        try:
+            return servico.enviar(*self._ler_pedido())
+        except RequisicaoInvalida as e:
+            self.close_connection = True
+            self._erro(e.status, str(e))
+        except FilaCheia as e:
+            self._erro(HTTPStatus.SERVICE_UNAVAILABLE, f"Serviço ocupado: {e}", {'Retry-After': '5'})
+        except ErroConfiguracao as e:
+            self._erro(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+        return None
+
+    def _responder_tarefa(self, tarefa):
+        """Arquivo se concluída; senão o erro correspondente ao estado."""
+        if tarefa.estado == 'concluida':
+            self._arquivo(tarefa)
+        elif tarefa.estado == 'erro':
+            status = (HTTPStatus.UNPROCESSABLE_ENTITY if isinstance(tarefa.erro, ErroProcessamento)
+                      else HTTPStatus.INTERNAL_SERVER_ERROR)
+            self._erro(status, str(tarefa.erro))
+        elif tarefa.estado == 'cancelada':
+            self._erro(HTTPStatus.CONFLICT, "Processamento cancelado")
+        else:
+            self._json(HTTPStatus.CONFLICT, self.server.servico.resumo_tarefa(tarefa))
+
+    def do_POST(self):
+        if self.path == '/processar':
+            tarefa = self._enviar()
+            if tarefa is None:
+                return
+            if not tarefa.aguardar(self.server.tempo_limite):
+                tarefa.cancelar()
+                self._erro(HTTPStatus.GATEWAY_TIMEOUT, f"Processamento passou de {self.server.tempo_limite}s")
+                return
+            self._responder_tarefa(tarefa)
+        elif self.path == '/tarefas':
+            tarefa = self._enviar()
+            if tarefa is not None:
+                self._json(HTTPStatus.ACCEPTED, self.server.servico.resumo_tarefa(tarefa),
+                           {'Location': f"/tarefas/{tarefa.sessao}"})
+        else:
+            self.close_connection = True
+            self._erro(HTTPStatus.NOT_FOUND, f"Rota desconhecida: {self.path}")
+
+    def _tarefa(self):
+        rota = _ROTA_TAREFA.match(self.path)
+        tarefa = self.server.servico.tarefas.da_sessao(rota.group(1)) if rota else None
+        if tarefa is None:
+            self._erro(HTTPStatus.NOT_FOUND, f"Tarefa desconhecida: {self.path}")
+        return rota, tarefa
+
+    def do_GET(self):
+        servico = self.server.servico
+        if self.path == '/saude':
+            self._json(HTTPStatus.OK, {'estado': 'ok', 'config_versao': obter_configuracao(servico.caminho_config).versao})
+        elif self.path == '/metricas':
+            self._json(HTTPStatus.OK, servico.resumo_metricas())
+        elif self.path.startswith('/tarefas/'):
+            rota, tarefa = self._tarefa()
+            if tarefa is None:
+                return
+            if rota.group(2):
+                self._responder_tarefa(tarefa)
+            else:
+                self._json(HTTPStatus.OK, servico.resumo_tarefa(tarefa))
+        else:
+            self._erro(HTTPStatus.NOT_FOUND, f"Rota desconhecida: {self.path}")
+
+    def do_DELETE(self):
+        rota, tarefa = self._tarefa()
+        if tarefa is None:
+            return
+        if rota.group(2):
+            self._erro(HTTPStatus.METHOD_NOT_ALLOWED, "Use DELETE /tarefas/<id>")
+            return
+        tarefa.cancelar()
+        self._json(HTTPStatus.OK, self.server.servico.resumo_tarefa(tarefa))
+
+
+def criar_servidor(servico, host='127.0.0.1', porta=PORTA_PADRAO, tempo_limite=TEMPO_LIMITE_PADRAO,
+                   tamanho_maximo=TAMANHO_MAXIMO_PADRAO):
+    """ThreadingHTTPServer com as rotas do ServicoTasy (uma thread por conexão)."""
+    servidor = ThreadingHTTPServer((host, porta), ManipuladorTasy)
+    servidor.daemon_threads = True
+    servidor.servico = servico
+    servidor.tempo_limite = tempo_limite
+    servidor.tamanho_maximo = tamanho_maximo
+    return servidor
+
+
+def criar_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m tasy.servico',
+        description="Serviço HTTP local que gera a planilha de importação TASY.",
+    )
+    parser.add_argument('--host', default='127.0.0.1',
+                        help="endereço de escuta (padrão: só a própria máquina)")
+    parser.add_argument('--porta', type=int, default=PORTA_PADRAO)
+    parser.add_argument('--trabalhadores', type=int, default=2, help="processamentos simultâneos")
+    parser.add_argument('--fila', type=int, default=FILA_PADRAO,
+                        help="pedidos em espera além dos em execução; os demais recebem 503")
+    parser.add_argument('--tempo-limite', type=float, default=TEMPO_LIMITE_PADRAO,
+                        help="segundos de espera de POST /processar antes de responder 504")
+    parser.add_argument('--tamanho-maximo', type=int, default=TAMANHO_MAXIMO_PADRAO // 2**20,
+                        help="tamanho máximo de um pedido, em MB")
+    parser.add_argument('--config', default=None, help="caminho do config_exames.json")
+    parser.add_argument('-v', '--verbose', action='store_true', help="registra cada pedido")
+    return parser
+
+
+def main(argv=None):
+    args = criar_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    if args.verbose:
+        logger.setLevel(logging.DEBUG)
+    try:
+        servico = ServicoTasy(args.trabalhadores, args.fila, args.config)
+    except ErroConfiguracao as e:
+        logger.error("%s", e)
+        return 2
+    servidor = criar_servidor(servico, args.host, args.porta, args.tempo_limite, args.tamanho_maximo * 2**20)
+    logger.info("Serviço TASY em http://%s:%d (%d trabalhadores, fila %d)",
+                args.host, servidor.server_port, args.trabalhadores, args.fila)
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servico.encerrar()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+Processamento em segundo plano, acompanhado por sessão.
+
+A interface entrega o processamento a um GerenciadorTarefas e só consulta o
+andamento a cada rerun: o script do Streamlit não fica bloqueado, o
+percentual vem das linhas processadas em cada etapa (ver Instrumentacao) e
+o usuário pode cancelar. A tarefa guarda o resultado, então reruns e
+reconexões do navegador com a mesma chave de sessão o encontram sem
+reprocessar.
+
+    tarefa = gerenciador.enviar(sessao, lambda tarefa: processar_arquivos(
+        ..., progresso=tarefa.progresso,
+        instrumentacao=Instrumentacao(observador=tarefa.observar_etapa),
+    ), etapas=etapas_processamento(resultados2=True))
+    tarefa.percentual, tarefa.mensagem   # andamento
+    tarefa.cancelar()
+    gerenciador.da_sessao(sessao).resultado
+
+Com `fila`, o gerenciador aceita no máximo trabalhadores + fila tarefas
+ativas e recusa as demais com FilaCheia (contrapressão para o serviço
+HTTP, ver tasy.servico).
+"""
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .cache import CacheLRU
+from .erros import ErroProcessamento, FilaCheia, ProcessamentoCancelado
+from .instrumentacao import DESCRICOES_ETAPAS
+
+logger = logging.getLogger('tasy')
+
+ESTADOS = ['na_fila', 'executando', 'concluida', 'cancelada', 'erro']
+
+# Processamentos simultâneos (demais esperam na fila) e sessões lembradas
+TRABALHADORES_PADRAO = 2
+SESSOES_PADRAO = 64
+
+_IDS = itertools.count(1)
+
+
+def etapas_processamento(resultados2=True, exportacao=True):
+    """Etapas executadas por processar_arquivos (+ exportação), na ordem."""
+    etapas = ['leitura_pacientes', 'leitura_basicos']
+    if resultados2:
+        etapas.append('leitura_resultados2')
+    etapas += ['preparar_basicos', 'atendimentos_basicos']
+    if resultados2:
+        etapas += ['preparar_resultados2', 'atendimentos_resultados2']
+    etapas += ['mesclagem', 'validacao']
+    if exportacao:
+        etapas.append('exportacao')
+    return etapas
+
+
+class Tarefa:
+    """
+    Um processamento enviado ao GerenciadorTarefas.
+
+    O percentual é a fração das linhas já processadas sobre as linhas de
+    todas as etapas previstas: cada etapa pesa o número de linhas que
+    recebe (as de leitura, o número de linhas lidas). Etapas ainda não
+    iniciadas pesam as linhas da maior etapa conhecida até o momento, e a
+    estimativa fica exata depois da leitura das planilhas.
+    """
+
+    def __init__(self, sessao, etapas=None, descricao='', parametros=None):
+        self.id = next(_IDS)
+        self.sessao = sessao
+        self.descricao = descricao
+        # Opções usadas no envio (protocolo, estabelecimento...), para exibir o resultado
+        self.parametros = dict(parametros or {})
+        self.estado = 'na_fila'
+        self.percentual = 0
+        self.mensagem = "⏳ Aguardando na fila..."
+        self.etapa = None
+        self.resultado = None
+        self.erro = None
+        self.envio = time.perf_counter()
+        self.inicio = None
+        self.fim = None
+        # Arquivos gerados a partir do resultado, reaproveitados entre reruns
+        self.saidas = {}
+        self._etapas = list(etapas or [])
+        self._linhas = {}
+        self._concluidas = set()
+        self._cancelar = threading.Event()
+        self._terminada = threading.Event()
+
+    @property
+    def ativa(self):
+        return self.estado in ('na_fila', 'executando')
+
+    @property
+    def segundos(self):
+        if self.inicio is None:
+            return 0.0
+        return (self.fim or time.perf_counter()) - self.inicio
+
+    @property
+    def espera(self):
+        """Segundos na fila antes de começar."""
+        return (self.inicio or time.perf_counter()) - self.envio
+
+    @property
+    def cancelamento_pedido(self):
+        return self._cancelar.is_set()
+
+    def aguardar(self, timeout=None):
+        """Bloqueia até a tarefa terminar (True) ou o `timeout` em segundos passar (False)."""
+        return self._terminada.wait(timeout)
+
+    def cancelar(self):
+        """Pede a interrupção; o processamento para no fim da etapa em andamento."""
+        if self.ativa:
+            self._cancelar.set()
+            self.mensagem = "🛑 Cancelando..."
+
+    def _verificar_cancelamento(self):
+        if self._cancelar.is_set():
+            raise ProcessamentoCancelado("Processamento cancelado")
+
+    def progresso(self, percentual, mensagem):
+        """Callback `progresso` do motor: só a mensagem (o percentual vem das etapas)."""
+        self._verificar_cancelamento()
+        self.mensagem = mensagem
+
+    def observar_etapa(self, medicao, concluida):
+        """Observador da Instrumentacao: atualiza etapa, mensagem e percentual."""
+        self._verificar_cancelamento()
+        nome = medicao.etapa
+        if nome not in self._etapas:
+            self._etapas.append(nome)
+        linhas = medicao.linhas_entrada if medicao.linhas_entrada is not None else medicao.linhas_saida
+        if concluida:
+            self._linhas[nome] = self._linhas.get(nome, 0) + (linhas or 0)
+            self._concluidas.add(nome)
+        else:
+            self.etapa = nome
+            if linhas is not None:
+                self._linhas[nome] = linhas
+            descricao = DESCRICOES_ETAPAS.get(nome, nome)
+            self.mensagem = f"{descricao} ({linhas:,} linhas)..." if linhas else f"{descricao}..."
+        self.percentual = max(self.percentual, self._calcular_percentual())
+
+    def _calcular_percentual(self):
+        estimativa = max(self._linhas.values(), default=0) or 1
+        pesos = {etapa: self._linhas.get(etapa, estimativa) or 1 for etapa in self._etapas}
+        feito = sum(pesos[etapa] for etapa in self._concluidas)
+        # 100 só quando a tarefa termina
+        return min(99, int(100 * feito / sum(pesos.values())))
+
+
+class GerenciadorTarefas:
+    """
+    Executa tarefas em threads de fundo, no máximo uma por sessão.
+
+    Args:
+        trabalhadores: processamentos simultâneos; os demais esperam na fila
+        sessoes: sessões lembradas (as menos usadas são esquecidas)
+        fila: tarefas que podem esperar além das em execução (None = sem limite)
+        ao_terminar: callable(tarefa) chamado na thread da tarefa, já no estado final
+    """
+
+    def __init__(self, trabalhadores=TRABALHADORES_PADRAO, sessoes=SESSOES_PADRAO, fila=None, ao_terminar=None):
+        self.trabalhadores = trabalhadores
+        self.fila = fila
+        self.ao_terminar = ao_terminar
+        self._executor = ThreadPoolExecutor(max_workers=trabalhadores, thread_name_prefix='tasy-tarefa')
+        self._por_sessao = CacheLRU(maxsize=sessoes)
+        self._vagas = threading.BoundedSemaphore(trabalhadores + fila) if fila is not None else None
+        self._lock = threading.Lock()
+        self.na_fila = 0
+        self.executando = 0
+
+    def enviar(self, sessao, funcao, etapas=None, descricao='', parametros=None):
+        """
+        Enfileira `funcao(tarefa)`; o retorno vira `tarefa.resultado`.
+
+        Uma tarefa anterior da mesma sessão ainda em andamento é cancelada.
+
+        Returns:
+            Tarefa
+
+        Raises:
+            FilaCheia: com `fila`, se já houver trabalhadores + fila tarefas ativas
+        """
+        if self._vagas is not None and not self._vagas.acquire(blocking=False):
+            raise FilaCheia(f"{self.trabalhadores} processamentos em andamento e {self.fila} na fila")
+        anterior = self.da_sessao(sessao)
+        if anterior is not None:
+            anterior.cancelar()
+        tarefa = Tarefa(sessao, etapas, descricao, parametros)
+        self._por_sessao[sessao] = tarefa
+        with self._lock:
+            self.na_fila += 1
+        self._executor.submit(self._executar, tarefa, funcao)
+        return tarefa
+
+    def da_sessao(self, sessao):
+        """Última tarefa enviada pela sessão (None se não houver)."""
+        return self._por_sessao.get(sessao)
+
+    def _executar(self, tarefa, funcao):
+        tarefa.inicio = time.perf_counter()
+        with self._lock:
+            self.na_fila -= 1
+            self.executando += 1
+        try:
+            tarefa._verificar_cancelamento()
+            tarefa.estado = 'executando'
+            tarefa.mensagem = "⚙️ Iniciando..."
+            tarefa.resultado = funcao(tarefa)
+            tarefa.percentual = 100
+            tarefa.mensagem = "✅ Concluído!"
+            tarefa.estado = 'concluida'
+        except ProcessamentoCancelado:
+            tarefa.mensagem = "🛑 Processamento cancelado"
+            tarefa.estado = 'cancelada'
+        except Exception as e:
+            # Exibido pela interface; erros inesperados também vão para o log
+            if not isinstance(e, ErroProcessamento):
+                logger.exception("Tarefa %d (%s) falhou", tarefa.id, tarefa.descricao)
+            tarefa.erro = e
+            tarefa.mensagem = f"❌ {e}"
+            tarefa.estado = 'erro'
+        finally:
+            tarefa.fim = time.perf_counter()
+            with self._lock:
+                self.executando -= 1
+            if self._vagas is not None:
+                self._vagas.release()
+            if self.ao_terminar is not None:
+                self.ao_terminar(tarefa)
+            tarefa._terminada.set()
+
+    def encerrar(self):
+        """Cancela as tarefas na fila e libera as threads (sem esperar as em andamento)."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
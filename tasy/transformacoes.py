@@ -0,0 +1,260 @@
+"""
+Funções de transformação aplicadas às planilhas do laboratório e do TASY.
+"""
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+from .cache import CacheLRU
+
+
+def normalizar_nome(nome):
+    """
+    Normaliza nome para comparação:
+    - Remove espaços extras
+    - Converte para minúsculas
+    - Remove acentos
+    """
+    if pd.isna(nome):
+        return ''
+    
+    # Normalizar texto e remover acentos
+    nfkd = unicodedata.normalize('NFKD', str(nome).lower())
+    nome_sem_acento = ''.join([c for c in nfkd if not unicodedata.combining(c)])
+    
+    # Colapsar qualquer sequência de espaços
+    return ' '.join(nome_sem_acento.split())
+
+
+# Nomes já normalizados, compartilhado entre pacientes, basicos e resultados2
+# (e entre execuções): os mesmos pacientes se repetem em todos os arquivos.
+CACHE_NOMES = CacheLRU(maxsize=200_000)
+
+_RE_ACENTOS = r'[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]'
+
+
+def _normalizar_unicos(nomes):
+    """Normaliza um array de nomes distintos (não nulos) de uma só vez."""
+    return (
+        pd.Series(nomes, dtype=object).astype(str)
+        .str.lower()
+        .str.normalize('NFKD')
+        .str.replace(_RE_ACENTOS, '', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+        .to_numpy(dtype=object)
+    )
+
+
+def normalizar_nomes(serie, cache=CACHE_NOMES):
+    """
+    Versão vetorizada de `normalizar_nome` para uma coluna inteira.
+
+    Normaliza apenas os valores distintos que ainda não estão no cache e
+    devolve o resultado alinhado ao índice de `serie`.
+    """
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    if not all(isinstance(nome, str) for nome in unicos):
+        # 1, 1.0 e True são o mesmo valor para o factorize e para o cache, mas
+        # normalizam para textos diferentes: chave sempre pelo texto do valor
+        codigos, unicos = pd.factorize(serie.where(serie.isna(), serie.astype(str)), use_na_sentinel=True)
+    normalizados = np.empty(len(unicos) + 1, dtype=object)
+    normalizados[-1] = ''  # posição usada pelos nulos (código -1)
+
+    faltando = []
+    for i, nome in enumerate(unicos):
+        valor = cache.get(nome)
+        if valor is None:
+            faltando.append(i)
+        else:
+            normalizados[i] = valor
+
+    if faltando:
+        novos = _normalizar_unicos(unicos[faltando])
+        normalizados[faltando] = novos
+        for nome, valor in zip(unicos[faltando], novos):
+            cache[nome] = valor
+
+    return pd.Series(normalizados[codigos], index=serie.index, dtype=object)
+
+
+def converter_valor_numerico(valor):
+    if pd.isna(valor) or valor == '' or valor == ' ':
+        return None
+    try:
+        if isinstance(valor, str):
+            valor = valor.strip().replace(',', '.')
+        return float(valor)
+    except:
+        return None
+
+
+def converter_colunas_numericas(df, mapeamento):
+    """
+    Versão vetorizada de `converter_valor_numerico` para várias colunas.
+
+    Todas as células texto das colunas mapeadas passam juntas por um único
+    strip/troca de vírgula/`pd.to_numeric`; colunas já numéricas são apenas
+    convertidas. Os valores ficam em float32 (7 algarismos significativos,
+    de sobra para resultados de exame); ver `ampliar_float32` na exportação.
+
+    Args:
+        df: DataFrame com os dados do laboratório
+        mapeamento: {codigo_tasy: coluna_lab} (saída de MapeamentoExames.resolver)
+
+    Returns:
+        tuple: (DataFrame com uma coluna float32 por codigo_tasy,
+                {codigo_tasy: quantidade de valores não numéricos descartados})
+    """
+    valores = pd.DataFrame(index=df.index)
+    invalidos = {}
+
+    cols_texto = []
+    for col_tasy, col_lab in mapeamento.items():
+        serie = df[col_lab]
+        if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+            valores[col_tasy] = serie.astype('float32')
+            invalidos[col_tasy] = 0
+        else:
+            cols_texto.append((col_tasy, col_lab))
+
+    if cols_texto:
+        bloco = df[[col_lab for _, col_lab in cols_texto]].to_numpy(dtype=object)
+        celulas = pd.Series(bloco.ravel(order='F'), dtype=object)
+
+        texto = celulas.astype(str).str.strip()
+        vazio = celulas.isna().to_numpy() | (texto == '').to_numpy()
+        # float64 explícito: só com inteiros (ou sem linhas) o to_numeric devolve int64
+        numeros = pd.to_numeric(texto.str.replace(',', '.', regex=False), errors='coerce').to_numpy(dtype='float64')
+        numeros[vazio] = np.nan
+
+        numeros = numeros.reshape(bloco.shape, order='F')
+        descartados = (np.isnan(numeros) & ~vazio.reshape(bloco.shape, order='F')).sum(axis=0)
+
+        for i, (col_tasy, _) in enumerate(cols_texto):
+            valores[col_tasy] = numeros[:, i].astype('float32')
+            invalidos[col_tasy] = int(descartados[i])
+
+    return valores[list(mapeamento)], {col_tasy: invalidos[col_tasy] for col_tasy in mapeamento}
+
+
+def ampliar_float32(valores):
+    """
+    float32 -> float64 pelo decimal mais curto com 7 algarismos significativos
+    (12.1 continua 12.1, e não 12.100000381469727).
+
+    A divisão de um inteiro exato por uma potência de 10 exata é arredondada
+    corretamente, então o resultado é o mesmo float de ler o texto '12.1'.
+    """
+    valores = np.asarray(valores, dtype='float64')
+    absolutos = np.abs(valores)
+    utilizaveis = np.isfinite(valores) & (absolutos > 0)
+    casas = 7 - np.ceil(np.log10(np.where(utilizaveis, absolutos, 1))).astype(int)
+    escala = 10.0 ** np.clip(np.abs(casas), 0, 22)
+    ampliados = np.where(casas >= 0, np.round(valores * escala) / escala, np.round(valores / escala) * escala)
+    return np.where(utilizaveis, ampliados, valores)
+
+
+# Formatos tentados, em ordem, para datas em texto; dia antes do mês como
+# no laboratório. 'ISO8601' cobre '2025-11-03', '2025-11-03 08:00:00' etc.
+FORMATOS_DATA = [
+    '%d/%m/%Y %H:%M:%S',
+    '%d/%m/%Y %H:%M',
+    '%d/%m/%Y',
+    '%d/%m/%y %H:%M:%S',
+    '%d/%m/%y %H:%M',
+    '%d/%m/%y',
+    '%d-%m-%Y %H:%M:%S',
+    '%d-%m-%Y %H:%M',
+    '%d-%m-%Y',
+    'ISO8601',
+]
+
+# Formato de DT_RESULTADO na planilha de importação
+FORMATO_DT_RESULTADO = '%d/%m/%Y %H:%M:%S'
+
+# Datas do Excel gravadas como número de série: dias desde 30/12/1899
+ORIGEM_SERIAL_EXCEL = pd.Timestamp('1899-12-30')
+SERIAL_EXCEL_MAXIMO = 2958465  # 31/12/9999
+
+
+def converter_datas(serie, formatos=FORMATOS_DATA):
+    """
+    Converte uma coluna de datas do laboratório para datetime64.
+
+    Aceita datas já reconhecidas pelo leitor da planilha, números de série
+    do Excel (também em texto) e texto em qualquer um dos `formatos`,
+    tentados em ordem. Cada formato é aplicado de uma vez à coluna, e só
+    aos valores distintos ainda não convertidos.
+
+    Args:
+        serie: coluna de datas (dthr_os)
+        formatos: formatos strptime (ou 'ISO8601') a tentar
+
+    Returns:
+        tuple: (Series datetime64 alinhada a `serie`, quantidade de valores
+        não vazios que não puderam ser convertidos)
+    """
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        return serie, 0
+
+    codigos, unicos = pd.factorize(serie, use_na_sentinel=True)
+    unicos = pd.Series(unicos, dtype=object)
+    texto = unicos.where(unicos.map(type) != str, unicos.astype(str).str.strip())
+
+    numeros = pd.to_numeric(texto, errors='coerce')
+    seriais = numeros.between(1, SERIAL_EXCEL_MAXIMO)
+    datas = pd.Series(pd.NaT, index=unicos.index, dtype='datetime64[ns]')
+    datas[seriais] = (ORIGEM_SERIAL_EXCEL + pd.to_timedelta(numeros[seriais], unit='D')).dt.round('s')
+
+    pendentes = ~seriais & (texto != '')
+    for formato in formatos:
+        if not pendentes.any():
+            break
+        datas[pendentes] = pd.to_datetime(texto[pendentes], format=formato, errors='coerce')
+        pendentes &= datas.isna()
+
+    invalidos = int(np.isin(codigos, np.flatnonzero(pendentes)).sum())
+    valores = np.append(datas.to_numpy(), np.datetime64('NaT'))  # posição -1 = nulos
+    return pd.Series(valores[codigos], index=serie.index, name=serie.name), invalidos
+
+
+def formatar_datas(datas):
+    """DT_RESULTADO ('dd/mm/aaaa hh:mm:ss') de uma Series datetime64; NaT vira None."""
+    formatadas = datas.dt.strftime(FORMATO_DT_RESULTADO)
+    return formatadas.astype(object).where(formatadas.notna(), None)
+
+
+# Nomes de coluna reconhecidos (comparação sem diferenciar maiúsculas)
+COLUNAS_NOME = ['nome', 'paciente', 'nm_paciente', 'Paciente', 'Nome', 'NM_PACIENTE']
+COLUNAS_ATENDIMENTO = ['atendimento', 'nr_atendimento', 'Atendimento', 'NR_ATENDIMENTO']
+COLUNAS_DATA_ATENDIMENTO = ['dt_entrada', 'dt_atendimento', 'data_atendimento', 'data_entrada',
+                            'DT_ENTRADA', 'DT_ATENDIMENTO']
+
+# Data/hora da coleta nas planilhas do laboratório (chave do cruzamento)
+COLUNA_DATA_LAB = 'dthr_os'
+
+
+def detectar_colunas_nome(df):
+    possiveis = COLUNAS_NOME
+    for col in df.columns:
+        if col in possiveis or col.lower() in [p.lower() for p in possiveis]:
+            return col
+    return df.columns[0]
+
+
+def detectar_colunas_atendimento(df):
+    possiveis = COLUNAS_ATENDIMENTO
+    for col in df.columns:
+        if col in possiveis or col.lower() in [p.lower() for p in possiveis]:
+            return col
+    return None
+
+
+def detectar_colunas_data_atendimento(df):
+    possiveis = COLUNAS_DATA_ATENDIMENTO
+    for col in df.columns:
+        if col in possiveis or col.lower() in [p.lower() for p in possiveis]:
+            return col
+    return None
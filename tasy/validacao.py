@@ -0,0 +1,106 @@
+"""
+Conferência dos resultados contra a faixa aceita de cada exame.
+
+Cada exame do config_exames.json pode ter `faixa_min`, `faixa_max` e
+`unidade` (opcionais). São limites de plausibilidade, não a faixa normal do
+laboratório: servem para pegar erro de digitação ou de vírgula (Hb 150 em
+vez de 15,0) antes que chegue ao TASY. Os valores continuam na planilha de
+importação; os que saem da faixa vão para a aba "Valores fora da faixa" do
+relatório de inconsistências, um por linha e exame.
+
+A conferência é uma passada só sobre o bloco de exames com faixa (uma
+matriz float32 linhas x exames), comparada de uma vez com os vetores de
+mínimos e máximos.
+"""
+import numpy as np
+import pandas as pd
+
+from .transformacoes import ampliar_float32
+
+COLUNAS_FORA_FAIXA = [
+    'NM_PACIENTE', 'NR_ATENDIMENTO', 'DT_RESULTADO', 'Código TASY', 'Nome do Exame',
+    'Valor', 'Unidade', 'Faixa mínima', 'Faixa máxima', 'Alerta',
+]
+
+
+def formatar_faixa(faixa_min, faixa_max, unidade=None):
+    """'2 a 25 g/dL', '≥ 0,5', '' (sem faixa)."""
+    def numero(valor):
+        return f"{valor:g}".replace('.', ',')
+
+    if faixa_min is not None and faixa_max is not None:
+        texto = f"{numero(faixa_min)} a {numero(faixa_max)}"
+    elif faixa_min is not None:
+        texto = f"≥ {numero(faixa_min)}"
+    elif faixa_max is not None:
+        texto = f"≤ {numero(faixa_max)}"
+    else:
+        return unidade or ''
+    return f"{texto} {unidade}" if unidade else texto
+
+
+class FaixasReferencia:
+    """
+    Faixas aceitas dos exames que têm `faixa_min` ou `faixa_max`.
+
+    Args:
+        mapa_exames_por_codigo: ConfiguracaoTasy.mapa_exames_por_codigo
+    """
+
+    def __init__(self, mapa_exames_por_codigo):
+        com_faixa = {
+            codigo: info for codigo, info in mapa_exames_por_codigo.items()
+            if info.get('faixa_min') is not None or info.get('faixa_max') is not None
+        }
+        self.codigos = list(com_faixa)
+        self.nomes = np.array([info['nome'] for info in com_faixa.values()], dtype=object)
+        self.unidades = np.array([info.get('unidade') or '' for info in com_faixa.values()], dtype=object)
+        self.minimos = np.array([
+            info['faixa_min'] if info.get('faixa_min') is not None else -np.inf for info in com_faixa.values()
+        ], dtype='float64')
+        self.maximos = np.array([
+            info['faixa_max'] if info.get('faixa_max') is not None else np.inf for info in com_faixa.values()
+        ], dtype='float64')
+
+    def __len__(self):
+        return len(self.codigos)
+
+    def conferir(self, planilha):
+        """
+        Valores da planilha de importação fora da faixa do exame.
+
+        Args:
+            planilha: planilha de importação (colunas de ordem_colunas_tasy)
+
+        Returns:
+            DataFrame nas COLUNAS_FORA_FAIXA, uma linha por valor fora da faixa
+        """
+        presentes = [i for i, codigo in enumerate(self.codigos) if codigo in planilha.columns]
+        if not presentes or planilha.empty:
+            return pd.DataFrame(columns=COLUNAS_FORA_FAIXA)
+
+        codigos = [self.codigos[i] for i in presentes]
+        valores = planilha[codigos].to_numpy(dtype='float32')
+        # Limites também em float32: um valor igual ao limite (0,7) não sai da
+        # faixa pelo arredondamento; NaN fica fora das duas máscaras
+        abaixo = valores < self.minimos[presentes].astype('float32')
+        acima = valores > self.maximos[presentes].astype('float32')
+        linhas, colunas = np.nonzero(abaixo | acima)
+        if len(linhas) == 0:
+            return pd.DataFrame(columns=COLUNAS_FORA_FAIXA)
+
+        # Textos repetidos como categorias (códigos por linha), como o NM_PACIENTE da planilha
+        exames = np.asarray(presentes)[colunas]
+        return pd.DataFrame({
+            'NM_PACIENTE': planilha['NM_PACIENTE'].array.take(linhas),
+            'NR_ATENDIMENTO': planilha['NR_ATENDIMENTO'].to_numpy()[linhas],
+            'DT_RESULTADO': planilha['DT_RESULTADO'].array.take(linhas),
+            'Código TASY': pd.Categorical.from_codes(colunas, [codigo.replace('NR_EXAME_', '') for codigo in codigos]),
+            'Nome do Exame': pd.Categorical(self.nomes[exames]),
+            'Valor': ampliar_float32(valores[linhas, colunas]),
+            'Unidade': pd.Categorical(self.unidades[exames]),
+            'Faixa mínima': np.where(np.isfinite(self.minimos[exames]), self.minimos[exames], np.nan),
+            'Faixa máxima': np.where(np.isfinite(self.maximos[exames]), self.maximos[exames], np.nan),
+            'Alerta': pd.Categorical.from_codes(acima[linhas, colunas].astype('int8'),
+                                                ['Abaixo da faixa', 'Acima da faixa']),
+        }, columns=COLUNAS_FORA_FAIXA)
@@ -0,0 +1,17 @@
+from benchmarks.executar import MEMORIA_MINIMA, comparar, formatar_regressao
+
+
+def test_comparar_com_linha_base_zero():
+    linha_base = {'1000': {'mesclagem': {'segundos': 1.0, 'memoria_adicional': 0}}}
+    atual = {'1000': {'mesclagem': {'segundos': 1.0, 'memoria_adicional': 2 * MEMORIA_MINIMA}}}
+
+    regressoes = comparar(atual, linha_base)
+
+    assert [(r['medida'], r['variacao']) for r in regressoes] == [('memoria_adicional', None)]
+    assert formatar_regressao(regressoes[0]).endswith('(n/a)')
+
+
+def test_comparar_dentro_da_tolerancia():
+    linha_base = {'1000': {'mesclagem': {'segundos': 1.0, 'memoria_adicional': 0}}}
+    atual = {'1000': {'mesclagem': {'segundos': 1.1, 'memoria_adicional': 0}}}
+    assert comparar(atual, linha_base) == []
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tasy.combinacao import codificar_coletas, combinar_coletas, reduzir_coletas
+
+CHAVE = ['nome_normalizado', 'dthr_os']
+
+
+def _basicos():
+    return pd.DataFrame({
+        'nome_original': ['Bia', 'Ana', 'Ana', 'Caio', 'Ana', 'Duda'],
+        'nome_normalizado': ['BIA', 'ANA', 'ANA', 'CAIO', 'ANA', 'DUDA'],
+        'dthr_os': pd.to_datetime(['2025-11-02', '2025-11-01', '2025-11-01', '2025-11-03',
+                                   '2025-11-05', None]),
+        'NR_ATENDIMENTO': [20.0, 10.0, 10.0, 30.0, 10.0, 40.0],
+        'NR_EXAME_HB': np.array([12.0, np.nan, 13.0, 14.0, 15.0, 16.0], dtype='float32'),
+        'NR_EXAME_GLI': np.array([np.nan, 90.0, 95.0, np.nan, np.nan, 80.0], dtype='float32'),
+    })
+
+
+def _resultados2():
+    # ANA 01/11 repetida, CAIO sem coleta no resultados2, EVA sem coleta no basicos
+    return pd.DataFrame({
+        'nome_normalizado': ['ANA', 'EVA', 'ANA', 'BIA', 'DUDA'],
+        'dthr_os': pd.to_datetime(['2025-11-01', '2025-11-09', '2025-11-01', '2025-11-02', None]),
+        'NR_EXAME_GLI': np.array([np.nan, 70.0, 99.0, 85.0, 60.0], dtype='float32'),
+        'NR_EXAME_TSH': np.array([2.5, 1.0, 3.1, np.nan, 4.0], dtype='float32'),
+    })
+
+
+def _reduzir_groupby(df, regra):
+    grupos = df.groupby(CHAVE, sort=True, dropna=False)
+    return (grupos.first() if regra == 'primeiro' else grupos.last()).reset_index()
+
+
+def _combinar_merge(basicos, resultados2, regra):
+    """Referência: groupby + merge à esquerda, basicos vale onde preenchido."""
+    mesclado = pd.merge(_reduzir_groupby(basicos, regra), _reduzir_groupby(resultados2, regra),
+                        on=CHAVE, how='left', suffixes=('', '_r2'))
+    for coluna in [c for c in mesclado.columns if c.endswith('_r2')]:
+        original = coluna[:-len('_r2')]
+        mesclado[original] = mesclado[original].fillna(mesclado.pop(coluna))
+    return mesclado
+
+
+@pytest.mark.parametrize('regra', ['primeiro', 'ultimo'])
+def test_reduzir_coletas_igual_a_groupby(regra):
+    basicos = _basicos()
+    chaves, = codificar_coletas(basicos)
+
+    reduzido, unicas = reduzir_coletas(basicos, chaves, regra)
+
+    assert len(unicas) == len(reduzido) == 5
+    assert (np.diff(unicas) > 0).all()
+    esperado = _reduzir_groupby(basicos, regra)[basicos.columns]
+    pd.testing.assert_frame_equal(reduzido, esperado, check_dtype=False)
+
+
+@pytest.mark.parametrize('regra', ['primeiro', 'ultimo'])
+def test_combinar_coletas_igual_a_merge(regra):
+    combinado = combinar_coletas(_basicos(), _resultados2(), regra)
+
+    esperado = _combinar_merge(_basicos(), _resultados2(), regra)
+    pd.testing.assert_frame_equal(combinado, esperado[combinado.columns], check_dtype=False)
+    # Coleta só do resultados2 não entra; coleta só do basicos fica sem os exames dele
+    assert 'EVA' not in set(combinado['nome_normalizado'])
+    assert np.isnan(combinado.loc[combinado['nome_normalizado'] == 'CAIO', 'NR_EXAME_TSH']).all()
+
+
+def test_combinar_coletas_regras_diferem_nas_repetidas():
+    primeiro = combinar_coletas(_basicos(), _resultados2(), 'primeiro')
+    ultimo = combinar_coletas(_basicos(), _resultados2(), 'ultimo')
+    ana = (primeiro['nome_normalizado'] == 'ANA') & (primeiro['dthr_os'] == '2025-11-01')
+
+    assert primeiro.loc[ana, ['NR_EXAME_HB', 'NR_EXAME_GLI', 'NR_EXAME_TSH']].values.tolist() == [
+        [13.0, 90.0, np.float32(2.5)]]
+    assert ultimo.loc[ana, ['NR_EXAME_HB', 'NR_EXAME_GLI', 'NR_EXAME_TSH']].values.tolist() == [
+        [13.0, 95.0, np.float32(3.1)]]
+
+
+def test_combinar_coletas_sem_resultados2():
+    combinado = combinar_coletas(_basicos(), None)
+    assert len(combinado) == 5
+    assert list(combinado.columns) == list(_basicos().columns)
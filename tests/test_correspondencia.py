@@ -0,0 +1,39 @@
+import pandas as pd
+
+from tasy import correspondencia
+from tasy.correspondencia import LIMIAR_APLICACAO, LIMIAR_PADRAO, CorrespondenciaAproximada
+from tasy.motor import _localizar_atendimentos
+from tasy.pacientes import IndicePacientes
+from tasy.transformacoes import normalizar_nomes
+
+
+def _localizar(nomes, **kwargs):
+    indice = IndicePacientes(pd.DataFrame({'Nome': ['Jose Carlos Silva'], 'NR_ATENDIMENTO': [10]}))
+    lab = pd.DataFrame({'nome_original': nomes})
+    lab['nome_normalizado'] = normalizar_nomes(lab['nome_original'])
+    return _localizar_atendimentos(lab, 'nome_original', indice, **kwargs)
+
+
+def test_nome_aproximado_so_sugerido_por_padrao():
+    atendimentos, registros = _localizar(['Josue Carlos Silva'], limiar_aproximado=LIMIAR_PADRAO)
+    assert atendimentos.isna().all()
+    assert [(r['NR_ATENDIMENTO'], r['Aplicado']) for r in registros] == [(10, 'Não')]
+
+
+def test_nome_aproximado_aplicado_quando_pedido():
+    atendimentos, registros = _localizar(['Josue Carlos Silva'], limiar_aproximado=LIMIAR_APLICACAO)
+    assert atendimentos.tolist() == [10]
+    assert registros[0]['Aplicado'] == 'Sim'
+
+
+def test_memo_limitado(monkeypatch):
+    monkeypatch.setattr(correspondencia, 'MEMO_MAXIMO', 2)
+    busca = CorrespondenciaAproximada({'jose carlos silva': 10})
+
+    for nome in ['josue carlos silva', 'maria souza', 'jose carlos silv', 'ana lima']:
+        busca.melhor_candidato(nome)
+
+    assert len(busca._memo) == 2
+    # Resultado None também é memorizado
+    assert 'ana lima' in busca._memo and busca.melhor_candidato('ana lima') is None
+    assert busca.melhor_candidato('josue carlos silva')[1] == 10
@@ -0,0 +1,69 @@
+import io
+
+import pandas as pd
+import pytest
+
+import tasy
+from benchmarks.dados import gerar_planilhas
+from tasy import fluxo
+from tasy.exportacao import EscritorPlanilha
+from tasy.pacientes import limpar_cache_indices
+
+
+@pytest.fixture(scope='module')
+def planilhas(tmp_path_factory):
+    configuracao = tasy.obter_configuracao()
+    return configuracao, gerar_planilhas(300, configuracao.config, tmp_path_factory.mktemp('dados'))
+
+
+def _ordenada(df):
+    colunas = list(df.columns[:3])
+    return df.sort_values(colunas, kind='stable').reset_index(drop=True)
+
+
+def _em_fluxo(configuracao, arquivos, **opcoes):
+    limpar_cache_indices()
+    saida = io.BytesIO()
+    resultado = fluxo.processar_em_fluxo(arquivos['basicos'], arquivos['resultados2'], arquivos['pacientes'],
+                                         'MENSAL', 1, {'xlsx': saida}, configuracao=configuracao, **opcoes)
+    saida.seek(0)
+    return resultado, pd.read_excel(saida)
+
+
+@pytest.mark.parametrize('particoes, tamanho_bloco', [(1, 50_000), (7, 37)])
+def test_fluxo_igual_a_processar(planilhas, particoes, tamanho_bloco):
+    configuracao, arquivos = planilhas
+    limpar_cache_indices()
+    referencia = tasy.processar_arquivos(arquivos['basicos'], arquivos['resultados2'], arquivos['pacientes'],
+                                         'MENSAL', 1, configuracao=configuracao)
+    # Mesma conversão de tipos da planilha gravada em fluxo
+    gravada = io.BytesIO()
+    with EscritorPlanilha(gravada, 'xlsx', configuracao.ordem_colunas_tasy) as escritor:
+        escritor.acrescentar(referencia.planilha_final)
+    gravada.seek(0)
+
+    resultado, planilha = _em_fluxo(configuracao, arquivos, particoes=particoes, tamanho_bloco=tamanho_bloco)
+
+    pd.testing.assert_frame_equal(_ordenada(planilha), _ordenada(pd.read_excel(gravada)))
+    assert resultado.linhas_gravadas == len(referencia.planilha_final)
+    assert resultado.total_inconsistencias == referencia.total_inconsistencias
+    assert resultado.total_fora_faixa == referencia.total_fora_faixa
+    assert resultado.nomes_sem_atendimento == referencia.nomes_sem_atendimento
+    assert resultado.valores_invalidos == dict(referencia.valores_invalidos)
+    assert resultado.datas_invalidas == referencia.datas_invalidas
+    assert len(resultado.nomes_duplicados) == len(referencia.nomes_duplicados)
+    assert not any(resultado.linhas_omitidas.values())
+
+
+def test_fluxo_limita_relatorios(planilhas, monkeypatch):
+    configuracao, arquivos = planilhas
+    completo, _ = _em_fluxo(configuracao, arquivos, tamanho_bloco=37)
+    assert len(completo.sem_atendimento_basicos) > 5
+
+    monkeypatch.setattr(fluxo, 'LIMITE_LINHAS_RELATORIO', 5)
+    limitado, _ = _em_fluxo(configuracao, arquivos, tamanho_bloco=37)
+
+    assert len(limitado.sem_atendimento_basicos) == 5
+    assert limitado.linhas_omitidas['sem_atendimento_basicos'] == len(completo.sem_atendimento_basicos) - 5
+    assert limitado.total_inconsistencias == completo.total_inconsistencias
+    assert limitado.total_fora_faixa == completo.total_fora_faixa
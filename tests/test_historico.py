@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+from tasy.historico import HistoricoEnvios
+
+
+def _planilha():
+    return pd.DataFrame({
+        'NR_ATENDIMENTO': [10, 11, 12],
+        'DT_RESULTADO': ['01/11/2025 08:00:00', '02/11/2025 09:30:00', '03/11/2025 10:15:00'],
+        'NR_EXAME_HB': np.array([13.5, 12.1, np.nan], dtype='float32'),
+        'NR_EXAME_GLI': np.array([90.0, np.nan, 101.0], dtype='float32'),
+    })
+
+
+def test_primeiro_envio_emite_todas_as_linhas(tmp_path):
+    with HistoricoEnvios(tmp_path / 'historico.sqlite') as historico:
+        delta = historico.filtrar_novos(_planilha(), 1)
+
+    assert len(delta.planilha) == 3
+    assert (delta.celulas_novas, delta.celulas_alteradas, delta.celulas_repetidas) == (4, 0, 0)
+
+
+def test_reenvio_registrado_nao_emite_nada(tmp_path):
+    caminho = tmp_path / 'historico.sqlite'
+    with HistoricoEnvios(caminho) as historico:
+        assert historico.registrar(historico.filtrar_novos(_planilha(), 1)) is not None
+
+    # Outra conexão: o histórico fica no arquivo
+    with HistoricoEnvios(caminho) as historico:
+        delta = historico.filtrar_novos(_planilha(), 1)
+        assert historico.registrar(delta) is None
+
+    assert delta.planilha.empty
+    assert (delta.celulas_novas, delta.celulas_alteradas, delta.celulas_repetidas) == (0, 0, 4)
+
+
+def test_valor_alterado_e_reemitido(tmp_path):
+    with HistoricoEnvios(tmp_path / 'historico.sqlite') as historico:
+        historico.registrar(historico.filtrar_novos(_planilha(), 1))
+        planilha = _planilha()
+        planilha.loc[1, 'NR_EXAME_HB'] = 12.4
+        delta = historico.filtrar_novos(planilha, 1)
+
+    assert delta.planilha['NR_ATENDIMENTO'].tolist() == [11]
+    assert delta.planilha['NR_EXAME_HB'].tolist() == [np.float32(12.4)]
+    assert delta.planilha['NR_EXAME_GLI'].isna().all()
+    assert (delta.celulas_novas, delta.celulas_alteradas, delta.celulas_repetidas) == (0, 1, 3)
+
+
+def test_outro_estabelecimento_tem_historico_proprio(tmp_path):
+    with HistoricoEnvios(tmp_path / 'historico.sqlite') as historico:
+        historico.registrar(historico.filtrar_novos(_planilha(), 1))
+        delta = historico.filtrar_novos(_planilha(), 2)
+
+    assert len(delta.planilha) == 3
@@ -0,0 +1,28 @@
+import threading
+
+from tasy import memoria
+from tasy.memoria import medir_memoria
+
+
+def test_medicoes_simultaneas_em_threads():
+    barreira = threading.Barrier(4)
+    medicoes = []
+
+    def medir():
+        with medir_memoria() as medicao:
+            barreira.wait()
+            bloco = b'\x01' * (8 * 2**20)
+            barreira.wait()
+            del bloco
+        medicoes.append(medicao)
+
+    threads = [threading.Thread(target=medir) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert memoria._EM_ANDAMENTO == []
+    if medicoes[0].reiniciado:  # só no Linux
+        # Pico do processo: cada medição vê pelo menos o próprio bloco
+        assert all(medicao.pico - medicao.inicial >= 8 * 2**20 for medicao in medicoes)
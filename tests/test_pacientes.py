@@ -0,0 +1,54 @@
+import io
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+from tasy.erros import ErroProcessamento
+from tasy.leitura import ArquivoCarregado
+from tasy.pacientes import IndicePacientes, limpar_cache_indices, obter_indice_pacientes
+
+
+def _arquivo_pacientes():
+    saida = io.BytesIO()
+    pd.DataFrame({'Nome': ['Ana Lima', 'Jose Silva'], 'NR_ATENDIMENTO': [1, 2]}).to_excel(saida, index=False)
+    return ArquivoCarregado(saida.getvalue(), 'pacientes.xlsx')
+
+
+def test_indice_reaproveitado_nao_altera_leitura_anterior():
+    limpar_cache_indices()
+    arquivo = _arquivo_pacientes()
+    indice, info = obter_indice_pacientes(arquivo)
+    reaproveitado, info_cache = obter_indice_pacientes(arquivo)
+
+    assert reaproveitado is indice
+    assert info_cache.motor == 'cache'
+    assert info.motor != 'cache'
+    assert info.linhas == info_cache.linhas == 2
+
+
+@pytest.mark.parametrize('politica', ['mais_recente', 'mais_proximo'])
+def test_datas_de_atendimento_em_tipos_misturados(politica):
+    # Texto, data do Excel, inválida e número de série (45962 = 01/11/2025) na mesma coluna
+    pacientes = pd.DataFrame({
+        'Nome': ['Ana Lima', 'Ana Lima', 'Ana Lima', 'Jose Silva', 'Jose Silva'],
+        'NR_ATENDIMENTO': [1, 2, 3, 4, 5],
+        'DT_ENTRADA': ['05/11/2025', datetime(2025, 11, 1), 'sem data', 45962, '20/10/2025 08:00'],
+    })
+
+    indice = IndicePacientes(pacientes, politica)
+
+    assert indice.atendimentos == {'ana lima': 1, 'jose silva': 4}
+    nomes = pd.Series(['ana lima', 'ana lima', 'jose silva'])
+    datas = pd.Series([datetime(2025, 11, 2), '06/11/2025', '21/10/2025'], dtype=object)
+    esperado = [2, 1, 5] if politica == 'mais_proximo' else [1, 1, 4]
+    assert indice.localizar(nomes, datas).tolist() == esperado
+
+
+def test_sem_coluna_de_atendimento_lista_o_cabecalho_do_arquivo():
+    limpar_cache_indices()
+    saida = io.BytesIO()
+    pd.DataFrame({'Nome': ['Ana Lima'], 'Prontuario': [7], 'Convenio': ['SUS']}).to_excel(saida, index=False)
+
+    with pytest.raises(ErroProcessamento, match='Colunas disponíveis: Nome, Prontuario, Convenio$'):
+        obter_indice_pacientes(ArquivoCarregado(saida.getvalue(), 'pacientes.xlsx'))
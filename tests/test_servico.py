@@ -0,0 +1,78 @@
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import tasy
+from tasy.correspondencia import LIMIAR_PADRAO
+from tasy.pacientes import POLITICA_DUPLICADOS_PADRAO
+from tasy.servico import ManipuladorTasy, RequisicaoInvalida, ServicoTasy, interpretar_pedido, ler_formulario
+
+FRONTEIRA = 'fronteira-teste'
+TIPO = f'multipart/form-data; boundary={FRONTEIRA}'
+
+
+def _corpo(campos, arquivos):
+    partes = [f'--{FRONTEIRA}\r\nContent-Disposition: form-data; name="{nome}"\r\n\r\n{valor}\r\n'.encode()
+              for nome, valor in campos.items()]
+    for nome, (arquivo, conteudo) in arquivos.items():
+        partes.append(f'--{FRONTEIRA}\r\nContent-Disposition: form-data; name="{nome}"; filename="{arquivo}"\r\n'
+                      f'Content-Type: application/octet-stream\r\n\r\n'.encode() + conteudo + b'\r\n')
+    partes.append(f'--{FRONTEIRA}--\r\n'.encode())
+    return b''.join(partes)
+
+
+def test_ler_formulario_separa_campos_e_arquivos():
+    corpo = _corpo({'protocolo': 'trimestral', 'cd_estabelecimento': ' 7 '},
+                   {'basicos': ('basicos.xlsx', b'PK\x03\x04dados'), 'pacientes': ('pacientes.xlsx', b'PK'),
+                    'resultados2': ('vazio.xlsx', b'')})
+
+    campos, arquivos = ler_formulario(TIPO, corpo)
+
+    assert campos == {'protocolo': 'trimestral', 'cd_estabelecimento': '7'}
+    # Arquivo vazio conta como não enviado
+    assert sorted(arquivos) == ['basicos', 'pacientes']
+    assert arquivos['basicos'].name == 'basicos.xlsx'
+    assert arquivos['basicos'].getvalue() == b'PK\x03\x04dados'
+
+    parametros, planilhas = interpretar_pedido(campos, arquivos, tasy.obter_configuracao())
+    assert parametros == {'cd_estabelecimento': 7, 'protocolo': 'TRIMESTRAL', 'formato': 'xlsx',
+                          'limiar_aproximado': LIMIAR_PADRAO, 'politica_duplicados': POLITICA_DUPLICADOS_PADRAO}
+    assert planilhas['resultados2'] is None
+
+
+def test_ler_formulario_recusa_corpo_que_nao_e_multipart():
+    with pytest.raises(RequisicaoInvalida, match='multipart/form-data'):
+        ler_formulario('application/json', b'{}')
+
+
+def test_interpretar_pedido_sem_pacientes():
+    campos, arquivos = ler_formulario(TIPO, _corpo({'cd_estabelecimento': '1'},
+                                                   {'basicos': ('basicos.xlsx', b'PK')}))
+    with pytest.raises(RequisicaoInvalida, match='ausente.*pacientes') as erro:
+        interpretar_pedido(campos, arquivos, tasy.obter_configuracao())
+    assert erro.value.status == 400
+
+
+def test_manipulador_responde_400_sem_arquivo():
+    corpo = _corpo({'cd_estabelecimento': '1'}, {'basicos': ('basicos.xlsx', b'PK')})
+    servico = ServicoTasy(trabalhadores=1, fila=1)
+    # Manipulador sem socket: só o necessário para do_POST
+    manipulador = ManipuladorTasy.__new__(ManipuladorTasy)
+    manipulador.server = SimpleNamespace(servico=servico, tamanho_maximo=2**20, tempo_limite=5)
+    manipulador.headers = {'Content-Type': TIPO, 'Content-Length': str(len(corpo))}
+    manipulador.rfile, manipulador.wfile = io.BytesIO(corpo), io.BytesIO()
+    manipulador.path, manipulador.command = '/processar', 'POST'
+    manipulador.request_version, manipulador.requestline = 'HTTP/1.1', 'POST /processar HTTP/1.1'
+    manipulador.client_address = ('127.0.0.1', 0)
+    try:
+        manipulador.do_POST()
+    finally:
+        servico.encerrar()
+
+    cabecalho, _, conteudo = manipulador.wfile.getvalue().partition(b'\r\n\r\n')
+    assert cabecalho.startswith(b'HTTP/1.1 400')
+    assert json.loads(conteudo) == {'erro': 'Arquivo(s) ausente(s): pacientes'}
+    assert manipulador.close_connection
+    assert servico.resumo_metricas()['pedidos'] == {'recebidos': 1}
@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from tasy.cache import CacheLRU
+from tasy.transformacoes import converter_colunas_numericas, normalizar_nome, normalizar_nomes
+
+
+def test_colunas_texto_so_com_inteiros():
+    df = pd.DataFrame({'CTOT': ['150', '160', ' ']})
+    valores, invalidos = converter_colunas_numericas(df, {'NR_EXAME_1': 'CTOT'})
+    assert valores['NR_EXAME_1'].dtype == 'float32'
+    np.testing.assert_array_equal(valores['NR_EXAME_1'].to_numpy(), [150, 160, np.nan])
+    assert invalidos == {'NR_EXAME_1': 0}
+
+
+def test_colunas_texto_sem_linhas():
+    df = pd.DataFrame({'CTOT': pd.Series([], dtype=object), 'HB': pd.Series([], dtype=object)})
+    valores, invalidos = converter_colunas_numericas(df, {'NR_EXAME_1': 'CTOT', 'NR_EXAME_2': 'HB'})
+    assert list(valores.columns) == ['NR_EXAME_1', 'NR_EXAME_2']
+    assert len(valores) == 0
+    assert invalidos == {'NR_EXAME_1': 0, 'NR_EXAME_2': 0}
+
+
+def test_virgula_decimal_e_descartados():
+    df = pd.DataFrame({'HB': ['12,5', 'hemolisado', None]})
+    valores, invalidos = converter_colunas_numericas(df, {'NR_EXAME_1': 'HB'})
+    np.testing.assert_array_equal(valores['NR_EXAME_1'].to_numpy(), np.array([12.5, np.nan, np.nan], dtype='float32'))
+    assert invalidos == {'NR_EXAME_1': 1}
+
+
+def test_normalizar_nomes_nao_confunde_valores_iguais_de_tipos_diferentes():
+    cache = CacheLRU()
+    assert normalizar_nomes(pd.Series([1.0], dtype=object), cache).tolist() == ['1.0']
+
+    serie = pd.Series([1, True, 1.0, None, ' José  da Silva '], dtype=object)
+    resultado = normalizar_nomes(serie, cache).tolist()
+
+    assert resultado == ['1', 'true', '1.0', '', 'jose da silva']
+    assert resultado[:3] == [normalizar_nome(valor) for valor in serie[:3]]
+    assert all(isinstance(chave, str) for chave in cache._dados)
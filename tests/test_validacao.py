@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from tasy.configuracao import construir_configuracao
+from tasy.erros import ErroConfiguracao
+from tasy.validacao import COLUNAS_FORA_FAIXA, FaixasReferencia
+
+
+def _config(**faixa):
+    return {
+        'estabelecimentos': {'MATRIZ': 1},
+        'exames': [
+            {'codigo_tasy': 'HB', 'nome': 'Hemoglobina', 'colunas_lab': ['hb'], 'categoria': 'basico',
+             'unidade': 'g/dL', 'faixa_min': 2, 'faixa_max': 25, **faixa},
+            {'codigo_tasy': 'K', 'nome': 'Potássio', 'colunas_lab': ['k'], 'categoria': 'basico',
+             'faixa_max': 10},
+            {'codigo_tasy': 'GLI', 'nome': 'Glicose', 'colunas_lab': ['gli'], 'categoria': 'basico'},
+        ],
+    }
+
+
+def _planilha(**exames):
+    linhas = len(next(iter(exames.values())))
+    return pd.DataFrame({
+        'NM_PACIENTE': pd.Categorical([f'Paciente {i}' for i in range(linhas)]),
+        'NR_ATENDIMENTO': np.arange(1, linhas + 1),
+        'DT_RESULTADO': [f'0{i + 1}/11/2025 08:00:00' for i in range(linhas)],
+        **{coluna: np.array(valores, dtype='float32') for coluna, valores in exames.items()},
+    })
+
+
+def test_conferir_separa_valores_fora_da_faixa():
+    faixas = construir_configuracao(_config()).faixas
+    assert faixas.codigos == ['NR_EXAME_HB', 'NR_EXAME_K']
+
+    planilha = _planilha(NR_EXAME_HB=[15.0, 150.0, np.nan, 2.0, 1.5],
+                         NR_EXAME_K=[4.0, np.nan, 12.0, 10.0, np.nan],
+                         NR_EXAME_GLI=[90.0, 9000.0, np.nan, -1.0, 0.0])
+
+    fora = faixas.conferir(planilha)
+
+    assert list(fora.columns) == COLUNAS_FORA_FAIXA
+    # Limites incluídos, NaN e exames sem faixa (GLI) ignorados
+    assert sorted(zip(fora['NR_ATENDIMENTO'], fora['Código TASY'], fora['Valor'], fora['Alerta'])) == [
+        (2, 'HB', 150.0, 'Acima da faixa'),
+        (3, 'K', 12.0, 'Acima da faixa'),
+        (5, 'HB', 1.5, 'Abaixo da faixa'),
+    ]
+    potassio = fora[fora['Código TASY'] == 'K'].iloc[0]
+    assert np.isnan(potassio['Faixa mínima']) and potassio['Faixa máxima'] == 10
+    assert potassio['Unidade'] == ''
+
+
+def test_conferir_limite_decimal_em_float32():
+    faixas = FaixasReferencia({'NR_EXAME_CR': {'nome': 'Creatinina', 'faixa_min': 0.7, 'faixa_max': None}})
+    assert faixas.conferir(_planilha(NR_EXAME_CR=[0.7, 0.69]))['Valor'].tolist() == [pytest.approx(0.69)]
+
+
+def test_conferir_planilha_sem_exames_com_faixa():
+    faixas = construir_configuracao(_config()).faixas
+
+    fora = faixas.conferir(_planilha(NR_EXAME_GLI=[9000.0, np.nan]))
+
+    assert fora.empty
+    assert list(fora.columns) == COLUNAS_FORA_FAIXA
+    assert faixas.conferir(_planilha(NR_EXAME_HB=[])).empty
+
+
+@pytest.mark.parametrize('faixa, problema', [
+    ({'faixa_min': '2'}, "'faixa_min' deve ser um número"),
+    ({'faixa_max': float('nan')}, "'faixa_max' deve ser um número"),
+    ({'faixa_max': True}, "'faixa_max' deve ser um número"),
+    ({'faixa_min': 30}, "'faixa_min' maior que 'faixa_max'"),
+    ({'unidade': ' '}, "'unidade' deve ser um texto não vazio"),
+])
+def test_configuracao_recusa_faixa_malformada(faixa, problema):
+    with pytest.raises(ErroConfiguracao, match=problema):
+        construir_configuracao(_config(**faixa))